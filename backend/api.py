@@ -1,16 +1,47 @@
 # backend/api.py
-import sys, pathlib, uuid, shutil
+import sys, pathlib, json
 from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
 
 from core.rag_pipeline import process_document
 from core.mcp import mcp_instance  # Importa MCP
+from core.config import (
+    PRELOAD_MODELS,
+    INGEST_MANIFEST_PATH,
+    CHAIN_MANIFEST_PATH,
+    PINECONE_INDEX_NAME,
+    VECTOR_STORE_BACKEND,
+    BATCH_MAX_QUESTIONS,
+)
+from core.models import preload_models
+from core.ingest_cache import IngestCache, save_upload
+from core.jobs import IngestionQueue, QueueFullError
+from core.answer_cache import get_answer_cache
+from core.strategies import get_strategy_stats
+from core.vectorstores import ALL_NAMESPACES, doc_namespace
+from core.chain_registry import ChainRegistry
+from core.batch import answer_batch
+from core.resources import get_embeddings
 
 app = FastAPI(title="LegalMentor API")
-app.state.chains = {}
+if PRELOAD_MODELS:
+    preload_models(PRELOAD_MODELS)  # demais modelos carregam sob demanda
+
+def _rebuild_chain(doc_id: str, entry: dict):
+    """Reconecta ao índice/namespace do manifesto (sem reprocessar nem reembedar)."""
+    return process_document(None, doc_id=doc_id, namespace=entry["namespace"])
+
+def _chain_entry(namespace: str) -> dict:
+    return {"namespace": namespace, "index": PINECONE_INDEX_NAME, "backend": VECTOR_STORE_BACKEND}
+
+app.state.chains = ChainRegistry(CHAIN_MANIFEST_PATH, _rebuild_chain)
+app.state.ingest_cache = IngestCache(INGEST_MANIFEST_PATH)
+app.state.jobs = IngestionQueue()
 UPLOAD_DIR = pathlib.Path("uploaded_docs")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
@@ -18,45 +49,109 @@ class QueryIn(BaseModel):
     doc_id: str
     pergunta: str
     use_mcp: Optional[bool] = False  # Flag opcional
+    session_id: Optional[str] = None  # memória MCP por sessão (sem ela: por documento)
+
+def _mcp_session(doc_id: str, session_id: Optional[str] = None):
+    """Memória MCP da sessão naquele documento."""
+    return mcp_instance.session(f"{session_id}:{doc_id}" if session_id else doc_id)
 
 @app.post("/rag/init")
 def init_with_existing():
+    # Sem doc_id: busca entre todos os documentos indexados
     chain = process_document(None)
     if chain is None:
         raise HTTPException(500, "Falha ao carregar índice Pinecone.")
-    app.state.chains["default"] = chain
+    app.state.chains.register("default", chain, **_chain_entry(ALL_NAMESPACES))
     return {"doc_id": "default"}
 
+def _get_chain(doc_id: str):
+    """Chain do registro: em memória ou reconstruída sob demanda (ex.: após despejo/restart)."""
+    registry = app.state.chains
+    if not registry.known(doc_id):
+        entry = app.state.ingest_cache.find_by_doc_id(doc_id)
+        if entry:
+            # Indexado antes do registro; sem namespace no manifesto: namespace "default"
+            registry.describe(doc_id, **_chain_entry(entry.get("namespace", "default")))
+    return registry.get(doc_id)
+
 @app.post("/rag/upload")
 def upload_pdf(file: UploadFile = File(...)):
     if file.content_type != "application/pdf":
         raise HTTPException(400, "Apenas PDF é aceito.")
-    doc_path = UPLOAD_DIR / f"{uuid.uuid4()}.pdf"
-    shutil.copyfileobj(file.file, doc_path.open("wb"))
+    doc_path, content_hash = save_upload(file.file, UPLOAD_DIR)
+    doc_id = str(doc_path)
+
+    # Mesmo conteúdo já indexado → devolve o doc_id existente sem reprocessar
+    cached = app.state.ingest_cache.lookup(content_hash)
+    if cached:
+        return {"doc_id": cached["doc_id"], "cached": True, "status": "done"}
+
+    # Ingestão roda em background; o cliente acompanha por /rag/jobs/{job_id}
+    try:
+        job = app.state.jobs.submit(
+            _ingest, doc_id, content_hash, file.filename,
+            key=content_hash, doc_id=doc_id,
+        )
+    except QueueFullError as exc:
+        raise HTTPException(503, str(exc))
+    return {"doc_id": doc_id, "cached": False, "job_id": job.job_id, "status": job.status}
+
+def _ingest(job, doc_id: str, content_hash: str, filename: Optional[str]):
+    chain = process_document(doc_id, progress=job.update)
+    app.state.chains.register(doc_id, chain, **_chain_entry(doc_namespace(doc_id)))
+    app.state.ingest_cache.record(content_hash, doc_id, filename=filename, namespace=doc_namespace(doc_id))
 
-    chain = process_document(str(doc_path))     
-    app.state.chains[str(doc_path)] = chain
-    return {"doc_id": str(doc_path)}
+@app.get("/rag/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status e progresso por etapa de um job de ingestão."""
+    job = app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job não encontrado")
+    return job.to_dict()
+
+@app.get("/rag/upload/stats")
+def upload_cache_stats():
+    """Contadores de hit/miss do cache de ingestão."""
+    return app.state.ingest_cache.stats()
+
+@app.get("/rag/chains/stats")
+def chain_registry_stats():
+    """Ocupação, despejos e reconstruções do registro de cadeias."""
+    return app.state.chains.stats()
+
+@app.get("/rag/cache/stats")
+def answer_cache_stats():
+    """Hit rate, ocupação e despejos do cache semântico de respostas."""
+    return get_answer_cache().stats()
+
+@app.get("/mcp/strategies/stats")
+def strategy_stats():
+    """Latência e tokens médios por estratégia do planner."""
+    return get_strategy_stats().stats()
 
 @app.post("/rag/query")
-def query(data: QueryIn):
-    chain = app.state.chains.get(data.doc_id)
+async def query(data: QueryIn):
+    # Async: a espera pelo LLM não ocupa uma thread do pool do FastAPI
+    chain = await run_in_threadpool(_get_chain, data.doc_id)  # pode reconstruir a cadeia
     if not chain:
         raise HTTPException(404, "Documento não encontrado")
     
     # Se usar MCP
     if data.use_mcp:
+        mcp = _mcp_session(data.doc_id, data.session_id)
+
         # 1. Planejar
-        plan = mcp_instance.plan(data.pergunta)
+        plan = mcp.plan(data.pergunta)
         
-        # 2. Enriquecer pergunta com contexto
-        enriched_question = mcp_instance.enrich_question(data.pergunta)
+        # 2. Contexto relevante da memória (só para a geração; a busca usa a pergunta)
+        inputs = await run_in_threadpool(mcp.prepare_inputs, data.pergunta)
         
-        # 3. Executar
-        resposta = chain.invoke({"input": enriched_question})
+        # 3. Executar com os parâmetros do plano (resposta depende da memória: sem cache)
+        resposta = await chain.ainvoke({**inputs, "use_cache": False, "plan": plan})
         
         # 4. Memorizar
-        mcp_instance.remember(
+        await run_in_threadpool(
+            mcp.remember,
             data.pergunta, 
             resposta.get("answer", ""),
             {"plan": plan}
@@ -67,21 +162,102 @@ def query(data: QueryIn):
         resposta["plan"] = plan
     else:
         # RAG direto (comportamento original)
-        resposta = chain.invoke({"input": data.pergunta})
+        resposta = await chain.ainvoke({"input": data.pergunta})
         resposta["mcp_used"] = False
     
     return resposta
 
+def _sse(event: str, payload) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+def _source(doc) -> dict:
+    return {"page_content": doc.page_content, "metadata": doc.metadata}
+
+@app.post("/rag/query/stream")
+async def query_stream(data: QueryIn):
+    """
+    Igual a /rag/query, mas em Server-Sent Events: eventos `token` com o texto
+    parcial assim que a geração começa e um evento `final` com resposta,
+    fontes e metadados (incluindo `ttft`, o time-to-first-token).
+    """
+    chain = await run_in_threadpool(_get_chain, data.doc_id)
+    if not chain:
+        raise HTTPException(404, "Documento não encontrado")
+
+    mcp = _mcp_session(data.doc_id, data.session_id)
+    plan = mcp.plan(data.pergunta) if data.use_mcp else None
+    inputs = (
+        await run_in_threadpool(mcp.prepare_inputs, data.pergunta) if data.use_mcp
+        else {"input": data.pergunta}
+    )
+
+    async def eventos():
+        async for event in chain.astream({**inputs, "use_cache": not data.use_mcp, "plan": plan}):
+            if event["type"] == "token":
+                yield _sse("token", {"content": event["content"]})
+                continue
+            final = {
+                "answer": event["answer"],
+                "sources": [_source(d) for d in event.get("source_documents", [])],
+                "metadata": event.get("metadata", {}),
+                "mcp_used": bool(data.use_mcp),
+            }
+            if data.use_mcp:
+                await run_in_threadpool(mcp.remember, data.pergunta, event["answer"], {"plan": plan})
+                final["plan"] = plan
+            yield _sse("final", final)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class BatchQueryIn(BaseModel):
+    doc_id: str
+    perguntas: List[str]
+
+@app.post("/rag/query/batch")
+async def query_batch(data: BatchQueryIn):
+    """
+    Várias perguntas sobre o mesmo documento, em NDJSON (um objeto por linha):
+    `retrieval` com o resumo das buscas, um `answer` por pergunta na ordem em
+    que terminam (com `index` da pergunta) e `done` no fim. Cada chunk aparece
+    uma única vez em `chunks`; as respostas seguintes o referenciam por `source_ids`.
+    """
+    if not data.perguntas:
+        raise HTTPException(400, "Informe ao menos uma pergunta.")
+    if len(data.perguntas) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(413, f"Máximo de {BATCH_MAX_QUESTIONS} perguntas por lote.")
+    chain = await run_in_threadpool(_get_chain, data.doc_id)
+    if not chain:
+        raise HTTPException(404, "Documento não encontrado")
+    embeddings = await run_in_threadpool(get_embeddings)
+
+    async def linhas():
+        async for event in answer_batch(chain, data.perguntas, embeddings=embeddings):
+            if event["type"] == "answer":
+                event["chunks"] = {cid: _source(doc) for cid, doc in event["chunks"].items()}
+            yield json.dumps(event, ensure_ascii=False, default=str) + "\n"
+
+    return StreamingResponse(
+        linhas(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # Endpoint opcional para ver memória (REMOVER EM PRODUÇÃO ou adicionar auth)
 @app.get("/mcp/memory")
-def get_memory(last_n: int = 5):
+def get_memory(doc_id: str, session_id: Optional[str] = None, last_n: int = 5):
     """
-    Visualiza memória MCP
+    Visualiza memória MCP de uma sessão/documento
     ⚠️ ATENÇÃO: Este endpoint está público! 
     Em produção, adicione autenticação ou remova.
     """
+    mcp = _mcp_session(doc_id, session_id)
     return {
-        "memory_size": len(mcp_instance.memory),
-        "recent_interactions": mcp_instance.get_serializable_memory(last_n),
+        "memory_size": mcp.size(),
+        "recent_interactions": mcp.get_serializable_memory(last_n),
+        "store": mcp.store.stats(),
         "warning": "Este endpoint deve ser protegido em produção"
     }
\ No newline at end of file
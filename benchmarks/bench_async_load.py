@@ -0,0 +1,81 @@
+# benchmarks/bench_async_load.py
+"""
+Vazão de consultas simultâneas no pipeline LangGraph com latência de LLM
+simulada: caminho síncrono (`invoke` num pool de 40 threads, o mesmo limite
+do threadpool do FastAPI) versus caminho assíncrono (`ainvoke` no event
+loop). A busca é instantânea; só o LLM demora.
+
+Uso:
+    python -m benchmarks.bench_async_load [--requests 200] [--latencia 1.0] [--threads 40]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from core.langgraph_pipeline import LangGraphRAGPipeline
+
+
+class RetrieverFixo:
+    def __init__(self):
+        self.docs = [Document(page_content=f"passage: Art. {i}º trecho do contrato.") for i in range(5)]
+
+    def invoke(self, query, config=None):
+        return self.docs
+
+    async def ainvoke(self, query, config=None):
+        return self.docs
+
+
+def montar(latencia: float) -> LangGraphRAGPipeline:
+    def llm_sync(inputs):
+        time.sleep(latencia)
+        return "Resposta."
+
+    async def llm_async(inputs):
+        await asyncio.sleep(latencia)
+        return "Resposta."
+
+    chain = SimpleNamespace(retriever=RetrieverFixo(), document_chain=RunnableLambda(llm_sync, afunc=llm_async))
+    return LangGraphRAGPipeline(chain, use_rerank=False)
+
+
+def rodar_sync(pipeline, n: int, threads: int) -> float:
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda i: pipeline.invoke({"input": f"pergunta {i}"}), range(n)))
+    return time.perf_counter() - inicio
+
+
+def rodar_async(pipeline, n: int) -> float:
+    async def rajada():
+        await asyncio.gather(*(pipeline.ainvoke({"input": f"pergunta {i}"}) for i in range(n)))
+
+    inicio = time.perf_counter()
+    asyncio.run(rajada())
+    return time.perf_counter() - inicio
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latencia", type=float, default=1.0, help="segundos por chamada ao LLM")
+    parser.add_argument("--threads", type=int, default=40)
+    args = parser.parse_args()
+
+    pipeline = montar(args.latencia)
+    for nome, tempo in (
+        (f"sync ({args.threads} threads)", rodar_sync(pipeline, args.requests, args.threads)),
+        ("async (event loop)", rodar_async(pipeline, args.requests)),
+    ):
+        print(f"{nome:<22} {args.requests} consultas em {tempo:6.2f} s → {args.requests / tempo:7.1f} consultas/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/bench_cold_start.py
+"""
+Mede o custo de cold start do módulo de OCR: tempo e RSS máximo de um
+processo novo que importa o pipeline em três cenários:
+
+- sob demanda: só o import (padrão; nenhum modelo de OCR carregado);
+- sem LayoutLMv2: carrega só o modelo semântico (OCR_LAYOUTLM_ENCODING=false);
+- pré-carga: semântico + LayoutLMv2, como o import fazia antes do registro.
+
+A diferença entre os cenários é a economia por worker que não processa PDFs
+escaneados (ou que não usa a codificação do LayoutLMv2). Cada cenário roda num
+subprocesso próprio para o RSS não se misturar.
+
+Uso:
+    python -m benchmarks.bench_cold_start [--repeticoes 3]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parents[1]
+
+CENARIOS = {
+    "sob demanda": [],
+    "sem LayoutLMv2": ["SEMANTIC_MODEL"],
+    "pré-carga": ["SEMANTIC_MODEL", "LAYOUT_PROCESSOR"],
+}
+
+_SONDA = """
+import json, resource, sys, time
+inicio = time.perf_counter()
+import core.rag_pipeline
+import core.layout_ocr as lo
+from core.models import preload_models
+importado = time.perf_counter() - inicio
+cargas = preload_models([getattr(lo, nome) for nome in {modelos!r}])
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    "import_s": importado,
+    "total_s": time.perf_counter() - inicio,
+    "rss_mb": rss / (1024 * 1024 if sys.platform == "darwin" else 1024),
+    "cargas": cargas,
+}}))
+"""
+
+
+def medir(modelos: list) -> dict:
+    saida = subprocess.run(
+        [sys.executable, "-c", _SONDA.format(modelos=modelos)],
+        cwd=RAIZ, capture_output=True, text=True,
+    )
+    if saida.returncode != 0:
+        ultima = (saida.stderr.strip().splitlines() or ["erro desconhecido"])[-1]
+        raise SystemExit(f"❌ Sonda falhou ({ultima}). Instale as dependências do backend para medir.")
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticoes", type=int, default=3, help="processos por cenário (mediana)")
+    args = parser.parse_args()
+
+    resultados = {}
+    for nome, modelos in CENARIOS.items():
+        rodadas = [medir(modelos) for _ in range(args.repeticoes)]
+        resultados[nome] = {
+            chave: statistics.median(r[chave] for r in rodadas) for chave in ("import_s", "total_s", "rss_mb")
+        }
+        cargas = ", ".join(f"{m} {s:.2f}s" for m, s in rodadas[-1]["cargas"].items())
+        r = resultados[nome]
+        print(
+            f"{nome:<15} import {r['import_s']:6.2f}s  total {r['total_s']:6.2f}s  "
+            f"RSS {r['rss_mb']:8.1f} MB  {cargas}"
+        )
+
+    base = resultados["pré-carga"]
+    for nome in ("sob demanda", "sem LayoutLMv2"):
+        r = resultados[nome]
+        print(
+            f"Economia ({nome}): {base['total_s'] - r['total_s']:.2f}s e "
+            f"{base['rss_mb'] - r['rss_mb']:.1f} MB por worker"
+        )
+
+
+if __name__ == "__main__":
+    main()
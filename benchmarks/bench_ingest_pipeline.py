@@ -0,0 +1,53 @@
+# benchmarks/bench_ingest_pipeline.py
+"""
+Ingestão com embedding e upsert alternados (um lote por vez) versus o
+pipeline produtor/consumidor de core/ingest_pipeline.py. As latências de
+embedding (CPU) e de upsert (rede) são simuladas com sleep.
+
+Uso:
+    python -m benchmarks.bench_ingest_pipeline [--chunks 2048] [--lote 64] [--embed 0.2] [--upsert 0.3] [--workers 4]
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from types import SimpleNamespace
+
+from core.ingest_pipeline import embed_and_upsert
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2048)
+    parser.add_argument("--lote", type=int, default=64)
+    parser.add_argument("--embed", type=float, default=0.2, help="segundos para embedar um lote")
+    parser.add_argument("--upsert", type=float, default=0.3, help="segundos para enviar um lote")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    docs = [SimpleNamespace(page_content=f"passage: trecho {i}") for i in range(args.chunks)]
+
+    def embed(texts):
+        time.sleep(args.embed)
+        return [[0.0] for _ in texts]
+
+    def upsert(batch, vectors):
+        time.sleep(args.upsert)
+
+    inicio = time.perf_counter()
+    for start in range(0, len(docs), args.lote):
+        batch = docs[start:start + args.lote]
+        upsert(batch, embed([d.page_content for d in batch]))
+    serial = time.perf_counter() - inicio
+
+    report = embed_and_upsert(docs, embed, upsert, batch_size=args.lote, workers=args.workers)
+    print(f"{'alternado':<22} {args.chunks} chunks em {serial:6.2f} s → {args.chunks / serial:7.1f} chunks/s")
+    print(
+        f"{f'pipeline ({args.workers} workers)':<22} {args.chunks} chunks em {report['total_seconds']:6.2f} s → "
+        f"{args.chunks / report['total_seconds']:7.1f} chunks/s "
+        f"(embedding {report['embed_chunks_per_s']:.1f}/s, upsert {report['upsert_vectors_per_s']:.1f}/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/bench_namespaces.py
+"""
+Latência de consulta com namespace por documento versus namespace único,
+à medida que o corpus cresce (índice local, vetores sintéticos do tamanho
+do e5-large). Com o escopo por documento, a busca só percorre os chunks do
+documento consultado e a latência fica estável.
+
+Uso:
+    python -m benchmarks.bench_namespaces [--chunks-por-doc 300] [--docs 10,50,200]
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from core.vectorstores import LocalIndex, doc_namespace
+
+DIM = 1024
+TOP_K = 20
+
+
+def carregar(index: LocalIndex, n_docs: int, inicio: int, por_doc: int, rng) -> None:
+    for d in range(inicio, n_docs):
+        vetores = rng.normal(size=(por_doc, DIM)).astype(np.float32)
+        itens = [(f"{d}-{i}", v, {"doc_id": str(d)}) for i, v in enumerate(vetores)]
+        index.upsert(itens, namespace=doc_namespace(str(d)))
+        index.upsert(itens, namespace="todos")
+
+
+def medir(index: LocalIndex, namespace: str, consultas: np.ndarray) -> float:
+    tempos = []
+    for q in consultas:
+        t0 = time.perf_counter()
+        index.query(q, top_k=TOP_K, namespace=namespace)
+        tempos.append((time.perf_counter() - t0) * 1000)
+    return float(np.percentile(tempos, 50))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks-por-doc", type=int, default=300)
+    parser.add_argument("--docs", default="10,50,200")
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(5)
+    consultas = rng.normal(size=(args.queries, DIM)).astype(np.float32)
+    print(f"{'docs':>6} {'chunks':>8} {'por documento':>15} {'namespace único':>17}")
+    with tempfile.TemporaryDirectory() as pasta:
+        index, carregados = LocalIndex(pasta), 0
+        for n_docs in (int(n) for n in args.docs.split(",")):
+            carregar(index, n_docs, carregados, args.chunks_por_doc, rng)
+            carregados = n_docs
+            escopo = medir(index, doc_namespace("0"), consultas)
+            global_ = medir(index, "todos", consultas)
+            print(f"{n_docs:>6} {n_docs * args.chunks_por_doc:>8} {escopo:>12.2f} ms {global_:>14.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
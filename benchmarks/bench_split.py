@@ -0,0 +1,99 @@
+# benchmarks/bench_split.py
+"""
+Benchmark do split por tokens: implementação antiga (encode → fatias → decode)
+versus a nova (offset mapping, fatiando a string original).
+
+Uso:
+    python -m benchmarks.bench_split --paginas 400
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from core.config import EMBEDDING_MODEL_NAME, EMBEDDING_TOKEN_LIMIT, E5_PASSAGE_PREFIX
+from core.utils import count_tokens_batch, get_tokenizer, split_batch
+
+_PALAVRAS = (
+    "contratante contratada obrigação prazo vigência rescisão multa pagamento "
+    "parcela reajuste índice notificação foro comarca cessão garantia sigilo "
+    "responsabilidade indenização aditivo vencimento cláusula penal ações"
+).split()
+
+
+def contrato_sintetico(paginas: int, seed: int = 42) -> List[str]:
+    """Gera um contrato fictício com ~1 parágrafo longo por cláusula."""
+    rnd = random.Random(seed)
+    textos = []
+    for n in range(1, paginas * 3 + 1):
+        frases = []
+        for _ in range(rnd.randint(8, 30)):
+            corpo = " ".join(rnd.choice(_PALAVRAS) for _ in range(rnd.randint(6, 24)))
+            frases.append(f"{corpo.capitalize()}{rnd.choice(['.', ';', ','])}")
+        textos.append(
+            f"{E5_PASSAGE_PREFIX}CLÁUSULA {n}ª – Art. {n}º § 1º "
+            + " ".join(frases)
+        )
+    return textos
+
+
+def split_antigo(text: str, max_tokens: int, model_name: str) -> List[str]:
+    """Implementação original (com o tokenizer já em cache, para isolar o algoritmo)."""
+    tokenizer = get_tokenizer(model_name)
+    tokens = tokenizer.encode(text, truncation=False)
+    chunks = []
+    for i in range(0, len(tokens), max_tokens):
+        chunk_text = tokenizer.decode(tokens[i:i + max_tokens], skip_special_tokens=True)
+        chunks.append(chunk_text.strip())
+    return chunks
+
+
+def _relatorio(nome: str, textos: List[str], chunks: List[str], segundos: float, limite: int, modelo: str) -> None:
+    tamanhos = count_tokens_batch(chunks, model_name=modelo)
+    fieis = sum(
+        1 for c in chunks
+        if c.removeprefix(E5_PASSAGE_PREFIX) and any(c.removeprefix(E5_PASSAGE_PREFIX) in t for t in textos)
+    )
+    print(
+        f"{nome:<8} {segundos:8.2f}s  chunks={len(chunks):6d}  "
+        f"max_tokens={max(tamanhos):4d}  acima_do_limite={sum(t > limite for t in tamanhos):5d}  "
+        f"sem_prefixo={sum(not c.startswith(E5_PASSAGE_PREFIX) for c in chunks):5d}  "
+        f"trecho_literal={fieis / len(chunks):.0%}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--paginas", type=int, default=400)
+    parser.add_argument("--max-tokens", type=int, default=EMBEDDING_TOKEN_LIMIT)
+    parser.add_argument("--overlap", type=int, default=0)
+    parser.add_argument("--modelo", default=EMBEDDING_MODEL_NAME)
+    args = parser.parse_args()
+
+    textos = contrato_sintetico(args.paginas)
+    get_tokenizer(args.modelo)  # aquece o cache fora da medição
+    print(f"📄 {len(textos)} cláusulas, {sum(map(len, textos)) / 1e6:.1f} M caracteres")
+
+    inicio = time.perf_counter()
+    antigos = [c for t in textos for c in split_antigo(t, args.max_tokens, args.modelo)]
+    _relatorio("antigo", textos, antigos, time.perf_counter() - inicio, args.max_tokens, args.modelo)
+
+    inicio = time.perf_counter()
+    novos = [
+        c for partes in split_batch(
+            textos, max_tokens=args.max_tokens, model_name=args.modelo,
+            overlap=args.overlap, prefix=E5_PASSAGE_PREFIX,
+        )
+        for c in partes
+    ]
+    _relatorio("offsets", textos, novos, time.perf_counter() - inicio, args.max_tokens, args.modelo)
+
+
+if __name__ == "__main__":
+    main()
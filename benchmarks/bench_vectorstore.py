@@ -0,0 +1,97 @@
+# benchmarks/bench_vectorstore.py
+"""
+Compara latência e recall@k dos backends de vector store sobre vetores
+sintéticos (agrupados, dimensão do e5-large). A verdade de referência é a
+busca exata por força bruta; o Pinecone só entra com `--pinecone` (usa o
+namespace temporário "bench" do índice configurado e o apaga no fim).
+
+Uso:
+    python -m benchmarks.bench_vectorstore [--n 20000] [--queries 200] [--pinecone]
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from core.vectorstores import LocalIndex
+
+DIM = 1024
+TOP_K = 20
+
+
+def gerar_dados(n: int, queries: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    centros = rng.normal(size=(64, DIM)).astype(np.float32)
+    docs = centros[rng.integers(0, 64, n)] + 0.6 * rng.normal(size=(n, DIM)).astype(np.float32)
+    consultas = centros[rng.integers(0, 64, queries)] + 0.6 * rng.normal(size=(queries, DIM)).astype(np.float32)
+    docs /= np.linalg.norm(docs, axis=1, keepdims=True)
+    consultas /= np.linalg.norm(consultas, axis=1, keepdims=True)
+    return docs, consultas
+
+
+def verdade(docs: np.ndarray, consultas: np.ndarray, k: int):
+    scores = consultas @ docs.T
+    return [set(np.argsort(-linha)[:k].tolist()) for linha in scores]
+
+
+def medir(nome: str, buscar, consultas: np.ndarray, esperado) -> None:
+    tempos, recalls = [], []
+    for q, alvo in zip(consultas, esperado):
+        inicio = time.perf_counter()
+        ids = buscar(q)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        recalls.append(len(alvo & {int(i) for i in ids}) / len(alvo))
+    print(
+        f"{nome:<10} p50 {np.percentile(tempos, 50):8.2f} ms  "
+        f"p95 {np.percentile(tempos, 95):8.2f} ms  recall@{TOP_K} {np.mean(recalls):.3f}"
+    )
+
+
+def carregar(index, docs: np.ndarray, namespace: str, lote: int = 100) -> float:
+    inicio = time.perf_counter()
+    for start in range(0, len(docs), lote):
+        index.upsert(
+            vectors=[(str(start + i), vec.tolist(), {"row": start + i}) for i, vec in enumerate(docs[start:start + lote])],
+            namespace=namespace,
+        )
+    return time.perf_counter() - inicio
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--pinecone", action="store_true")
+    args = parser.parse_args()
+
+    docs, consultas = gerar_dados(args.n, args.queries)
+    esperado = verdade(docs, consultas, TOP_K)
+    print(f"{args.n} vetores × {DIM} dims, {args.queries} consultas")
+
+    with tempfile.TemporaryDirectory() as pasta:
+        local = LocalIndex(pasta)
+        print(f"local      carga {carregar(local, docs, 'bench'):.2f}s")
+        medir("local", lambda q: [m["id"] for m in local.query(q, top_k=TOP_K, namespace="bench")], consultas, esperado)
+
+    if args.pinecone:
+        from core.config import PINECONE_INDEX_NAME
+        from core.resources import get_pinecone_index
+
+        index = get_pinecone_index(PINECONE_INDEX_NAME)
+        print(f"pinecone   carga {carregar(index, docs, 'bench'):.2f}s")
+        time.sleep(10)  # consistência eventual do Pinecone
+        try:
+            medir(
+                "pinecone",
+                lambda q: [m["id"] for m in index.query(vector=q.tolist(), top_k=TOP_K, namespace="bench")["matches"]],
+                consultas, esperado,
+            )
+        finally:
+            index.delete(delete_all=True, namespace="bench")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# core/answer_cache.py
+"""
+Cache semântico de respostas por documento.
+
+Perguntas equivalentes sobre o mesmo contrato ("qual o prazo de vigência?" /
+"prazo do contrato?") reaproveitam a resposta anterior: a pergunta é
+embedada e comparada (cosseno) com as já respondidas para o mesmo `doc_id`.
+O vetor vem do mesmo `embed_query` da busca (com o prefixo "query: " do e5 e o
+LRU de perguntas), então a pergunta passa pelo modelo uma vez só.
+Perguntas sobre o mesmo contrato ficam próximas no espaço do e5 mesmo quando
+pedem coisas diferentes ("prazo de vigência" / "valor da multa"), então um hit
+também exige palavras de conteúdo em comum com a pergunta guardada.
+Despejo LRU com TTL e limite de memória; as entradas de um documento são
+invalidadas quando ele é reingerido.
+"""
+import copy
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import (
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_MAX_MB,
+    ANSWER_CACHE_MIN_OVERLAP,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+EmbedFn = Callable[[str], List[float]]
+
+_CACHE: Optional["SemanticAnswerCache"] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+
+_STOPWORDS = frozenset(
+    "a o as os à às ao aos de da do das dos e é em no na nos nas um uma uns umas "
+    "para por pelo pela com sem que qual quais quanto quanta quantos quantas "
+    "como quando onde se são ser há tem me meu minha este esta esse essa isso".split()
+)
+
+
+def _content_words(question: str) -> set:
+    return {word for word in re.findall(r"\w+", normalize_question(question)) if word not in _STOPWORDS}
+
+
+def word_overlap(a: str, b: str) -> float:
+    """Fração das palavras de conteúdo da pergunta mais curta presentes na outra."""
+    words_a, words_b = _content_words(a), _content_words(b)
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / min(len(words_a), len(words_b))
+
+
+def _default_embed(text: str) -> List[float]:
+    # Mesmo embedder (e LRU) da busca: a pergunta é embedada uma vez por requisição
+    from .resources import get_embeddings
+    return get_embeddings().embed_query(text)
+
+
+def _estimate_size(result: Dict[str, Any], vector: np.ndarray) -> int:
+    texts = [str(result.get("answer", ""))]
+    texts += [getattr(doc, "page_content", "") for doc in result.get("source_documents", [])]
+    return vector.nbytes + sum(len(t.encode("utf-8")) for t in texts) + 512  # + overhead de objetos
+
+
+class _Entry:
+    __slots__ = ("doc_id", "question", "vector", "result", "created_at", "size")
+
+    def __init__(self, doc_id: str, question: str, vector: np.ndarray, result: Dict[str, Any]):
+        self.doc_id = doc_id
+        self.question = question
+        self.vector = vector
+        self.result = result
+        self.created_at = time.time()
+        self.size = _estimate_size(result, vector)
+
+
+class SemanticAnswerCache:
+    """Cache LRU/TTL de respostas, consultado por similaridade dentro de cada documento."""
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        min_overlap: float = ANSWER_CACHE_MIN_OVERLAP,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        max_bytes: int = int(ANSWER_CACHE_MAX_MB * 1024 * 1024),
+        embed_fn: EmbedFn = _default_embed,
+    ):
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._embed = embed_fn
+        self._lock = threading.Lock()
+        # Ordem global de uso (LRU) e índice por documento
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_doc: Dict[str, Dict[str, int]] = {}
+        self._matrices: Dict[str, Tuple[List[int], np.ndarray]] = {}
+        self._next_key = 0
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "invalidated": 0}
+
+    # ───────────── Consulta ─────────────
+    def lookup(self, doc_id: str, question: str) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]]]:
+        """
+        Devolve (resultado, vetor da pergunta). O vetor é reaproveitado no `store`
+        seguinte, evitando embedar a mesma pergunta duas vezes num miss.
+        """
+        norm = normalize_question(question)
+        with self._lock:
+            self._expire(doc_id)
+            key = self._by_doc.get(doc_id, {}).get(norm)  # caminho rápido: mesmo texto
+            if key is not None:
+                return self._hit(key, 1.0), None
+            if not self._by_doc.get(doc_id):
+                self._stats["misses"] += 1
+                return None, None
+
+        vector = self._vectorize(question)
+        with self._lock:
+            keys, matrix = self._matrix(doc_id)
+            if keys:
+                sims = matrix @ vector
+                for i in np.argsort(-sims):
+                    if sims[i] < self.threshold:
+                        break
+                    entry = self._entries.get(keys[i])
+                    if entry is not None and word_overlap(norm, entry.question) >= self.min_overlap:
+                        return self._hit(keys[i], float(sims[i])), vector
+            self._stats["misses"] += 1
+        return None, vector
+
+    def store(self, doc_id: str, question: str, result: Dict[str, Any], vector: Optional[np.ndarray] = None) -> None:
+        norm = normalize_question(question)
+        vector = self._vectorize(question) if vector is None else vector
+        entry = _Entry(doc_id, norm, vector, self._snapshot(result))
+        with self._lock:
+            old = self._by_doc.get(doc_id, {}).get(norm)
+            if old is not None:
+                self._remove(old)
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = entry
+            self._by_doc.setdefault(doc_id, {})[norm] = key
+            self._matrices.pop(doc_id, None)
+            self._bytes += entry.size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate(self, doc_id: str) -> int:
+        """Remove todas as respostas do documento (ex.: reingestão)."""
+        with self._lock:
+            keys = list(self._by_doc.get(doc_id, {}).values())
+            for key in keys:
+                self._remove(key)
+            self._stats["invalidated"] += len(keys)
+        if keys:
+            logger.info("🧹 Cache de respostas: %d entradas de '%s' invalidadas.", len(keys), doc_id)
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "documents": len(self._by_doc),
+                "bytes": self._bytes,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
+
+    # ───────────── Internos (chamados com o lock) ─────────────
+    def _vectorize(self, text: str) -> np.ndarray:
+        vector = np.asarray(self._embed(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _snapshot(result: Dict[str, Any]) -> Dict[str, Any]:
+        # Cópia rasa dos campos + metadados próprios: o chamador pode mexer no original
+        return {**result, "metadata": dict(result.get("metadata", {}))}
+
+    def _hit(self, key: int, similarity: float) -> Dict[str, Any]:
+        entry = self._entries[key]
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        result = {**entry.result, "metadata": copy.deepcopy(entry.result.get("metadata", {}))}
+        result["metadata"]["answer_cache"] = {"hit": True, "similarity": similarity, "cached_question": entry.question}
+        return result
+
+    def _matrix(self, doc_id: str) -> Tuple[List[int], np.ndarray]:
+        cached = self._matrices.get(doc_id)
+        if cached is None:
+            keys = list(self._by_doc.get(doc_id, {}).values())
+            matrix = np.stack([self._entries[k].vector for k in keys]) if keys else np.empty((0, 0), np.float32)
+            cached = self._matrices[doc_id] = (keys, matrix)
+        return cached
+
+    def _expire(self, doc_id: str) -> None:
+        if self.ttl <= 0:
+            return
+        cutoff = time.time() - self.ttl
+        for key in list(self._by_doc.get(doc_id, {}).values()):
+            if self._entries[key].created_at < cutoff:
+                self._remove(key)
+                self._stats["expired"] += 1
+
+    def _remove(self, key: int) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        questions = self._by_doc.get(entry.doc_id, {})
+        questions.pop(entry.question, None)
+        if not questions:
+            self._by_doc.pop(entry.doc_id, None)
+        self._matrices.pop(entry.doc_id, None)
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """Instância única do processo."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = SemanticAnswerCache()
+        return _CACHE
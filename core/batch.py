@@ -0,0 +1,109 @@
+# core/batch.py
+"""
+Consultas em lote sobre um mesmo documento (ex.: checklists de due diligence).
+
+1. Todas as perguntas são embedadas numa única chamada em lote. Os vetores
+   ficam no LRU de consultas, então as buscas e o cache de respostas (que
+   embeda a mesma pergunta pelo mesmo `embed_query`) não recalculam nada.
+2. As buscas rodam em paralelo (até FAN_OUT_WORKERS por vez).
+3. Um chunk recuperado por várias perguntas vira um único Document (por
+   chunk ID) e só é enviado ao cliente na primeira resposta que o usa.
+4. As gerações rodam com no máximo `concurrency` chamadas simultâneas ao LLM.
+   Cada resposta é emitida assim que fica pronta, fora da ordem de entrada.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Set
+
+from langchain_core.documents import Document as LCDocument
+
+from .config import BATCH_GENERATION_CONCURRENCY, FAN_OUT_WORKERS
+from .embedding_cache import chunk_hash
+
+logger = logging.getLogger(__name__)
+
+
+async def answer_batch(
+    chain: Any,
+    questions: Sequence[str],
+    embeddings: Optional[Any] = None,
+    concurrency: int = BATCH_GENERATION_CONCURRENCY,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Emite um evento `retrieval` (resumo das buscas), um `answer` (ou `error`)
+    por pergunta na ordem em que terminam e um `done` no fim. Cada `answer`
+    traz os IDs dos chunks usados e o conteúdo só dos chunks ainda não enviados.
+    """
+    questions = list(questions)
+    start = time.perf_counter()
+    if embeddings is not None and hasattr(embeddings, "embed_queries"):
+        await asyncio.to_thread(embeddings.embed_queries, questions)
+    embed_seconds = time.perf_counter() - start
+
+    search_limit = asyncio.Semaphore(FAN_OUT_WORKERS)
+
+    async def search(question: str) -> List[LCDocument]:
+        async with search_limit:
+            return await chain.retriever.ainvoke(question)
+
+    rankings = await asyncio.gather(*(search(q) for q in questions))
+    chunks: Dict[str, LCDocument] = {}
+    contexts: List[List[LCDocument]] = []
+    for docs in rankings:
+        # Mesma instância para o mesmo chunk em todas as perguntas
+        contexts.append([chunks.setdefault(chunk_hash(doc.page_content), doc) for doc in docs])
+    retrieved = sum(len(docs) for docs in rankings)
+    yield {
+        "type": "retrieval",
+        "questions": len(questions),
+        "chunks_retrieved": retrieved,
+        "unique_chunks": len(chunks),
+        "embed_seconds": embed_seconds,
+        "retrieve_seconds": time.perf_counter() - start - embed_seconds,
+    }
+    logger.info("📚 Lote: %d perguntas, %d chunks (%d únicos).", len(questions), retrieved, len(chunks))
+
+    generation_limit = asyncio.Semaphore(max(1, concurrency))
+
+    async def generate(index: int):
+        async with generation_limit:
+            try:
+                result = await chain.ainvoke({"input": questions[index], "documents": contexts[index]})
+            except Exception as exc:  # uma pergunta com erro não derruba o lote
+                logger.warning("⚠️ Lote: pergunta %d falhou: %s", index, exc)
+                return index, exc
+            return index, result
+
+    tasks = [asyncio.create_task(generate(i)) for i in range(len(questions))]
+    sent: Set[str] = set()
+    failed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, result = await next_done
+            if isinstance(result, Exception):
+                failed += 1
+                yield {"type": "error", "index": index, "pergunta": questions[index], "error": str(result)}
+                continue
+            sources = result.get("source_documents", [])
+            ids = [chunk_hash(doc.page_content) for doc in sources]
+            new = {cid: doc for cid, doc in zip(ids, sources) if cid not in sent}
+            sent.update(new)
+            yield {
+                "type": "answer",
+                "index": index,
+                "pergunta": questions[index],
+                "answer": result.get("answer", ""),
+                "source_ids": ids,
+                "chunks": new,
+                "metadata": result.get("metadata", {}),
+            }
+    finally:
+        for task in tasks:  # cliente desconectou: não gasta mais LLM
+            task.cancel()
+    yield {
+        "type": "done",
+        "questions": len(questions),
+        "failed": failed,
+        "total_time": time.perf_counter() - start,
+    }
@@ -0,0 +1,198 @@
+# core/bm25.py
+"""
+Índice invertido BM25 em processo e recuperação híbrida (BM25 + denso).
+
+Perguntas jurídicas citam tokens exatos ("Art. 37", "§ 2º", nomes das
+partes) que o e5 sozinho costuma perder. O índice é montado em
+`process_document` sobre os mesmos chunks enviados ao vector store e fundido
+com o retriever denso por Reciprocal Rank Fusion (RRF), o que permite um `k`
+menor no prompt com o mesmo recall.
+
+As postings ficam em arrays NumPy contíguos (formato CSR: offsets por termo,
+IDs de documento int32 e frequências uint16) em vez de dicts aninhados.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from .config import BM25_B, BM25_K1, E5_PASSAGE_PREFIX, HYBRID_CANDIDATES, HYBRID_TOP_K, RRF_K
+from .embedding_cache import chunk_hash
+
+logger = logging.getLogger(__name__)
+
+# ───────────── Tokenização (português jurídico) ─────────────
+_STOPWORDS = frozenset(
+    """
+    a ao aos as com como da das de do dos e ela elas ele eles em entre era essa
+    esse esta este eu foi for ha isso isto ja la lhe mais mas me mesmo na nas
+    nao nem no nos o os ou para pela pelas pelo pelos por qual quando que quem
+    se sem ser seu seus sua suas tambem te tem um uma umas uns
+    """.split()
+)
+# "§", números (com separadores de milhar/decimais) e palavras
+_TOKEN_RE = re.compile(r"§|\d+(?:[.,]\d+)*|[a-z]+")
+_ORDINALS_RE = re.compile("[ºª°]")  # antes do NFKD, que os transformaria em letras
+_COMBINING_RE = re.compile(r"[\u0300-\u036f]")
+
+
+def tokenize_pt(text: str) -> List[str]:
+    """
+    Minúsculas, sem acentos nem indicadores ordinais, sem stopwords. Números
+    perdem os separadores ("8.666" → "8666") e "§" é mantido como token.
+    """
+    if text.startswith(E5_PASSAGE_PREFIX):
+        text = text[len(E5_PASSAGE_PREFIX):]
+    text = _COMBINING_RE.sub("", unicodedata.normalize("NFKD", _ORDINALS_RE.sub("", text).lower()))
+    tokens = []
+    for token in _TOKEN_RE.findall(text):
+        if token[0].isdigit():
+            tokens.append(token.replace(".", "").replace(",", ""))
+        elif token not in _STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+# ───────────── Índice invertido ─────────────
+class BM25Index:
+    """Índice BM25 imutável sobre uma lista de documentos."""
+
+    def __init__(
+        self,
+        vocabulary: Dict[str, int],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        term_freqs: np.ndarray,
+        doc_lengths: np.ndarray,
+        documents: Sequence[Document],
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+    ):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.documents = list(documents)
+        self.k1 = k1
+        self.b = b
+        n_docs = len(self.documents)
+        doc_freqs = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        avg_len = float(doc_lengths.mean()) if n_docs else 1.0
+        # Parte do denominador que só depende do documento, pré-calculada
+        self._norm = (k1 * (1 - b + b * doc_lengths / max(avg_len, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def build(cls, documents: Sequence[Document], **params: Any) -> "BM25Index":
+        vocabulary: Dict[str, int] = {}
+        terms: List[int] = []
+        docs: List[int] = []
+        freqs: List[int] = []
+        lengths = np.zeros(len(documents), dtype=np.float32)
+        for doc_id, doc in enumerate(documents):
+            tokens = tokenize_pt(doc.page_content)
+            lengths[doc_id] = len(tokens)
+            counts = Counter(tokens)
+            terms.extend(vocabulary.setdefault(token, len(vocabulary)) for token in counts)
+            docs.extend([doc_id] * len(counts))
+            freqs.extend(min(tf, 65535) for tf in counts.values())
+
+        term_arr = np.asarray(terms, dtype=np.int32)
+        order = np.argsort(term_arr, kind="stable")  # mantém os docs ordenados em cada posting
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_arr, minlength=len(vocabulary)), out=offsets[1:])
+        return cls(
+            vocabulary,
+            offsets,
+            np.asarray(docs, dtype=np.int32)[order],
+            np.asarray(freqs, dtype=np.uint16)[order],
+            lengths,
+            documents,
+            **params,
+        )
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    @property
+    def nbytes(self) -> int:
+        """Memória das postings e arrays auxiliares (sem o vocabulário/documentos)."""
+        return sum(a.nbytes for a in (self.offsets, self.doc_ids, self.term_freqs, self.doc_lengths, self.idf, self._norm))
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        for token in set(tokenize_pt(query)):
+            term = self.vocabulary.get(token)
+            if term is None:
+                continue
+            start, end = self.offsets[term], self.offsets[term + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end].astype(np.float32)
+            # IDs são únicos dentro de uma posting: soma direta, sem np.add.at
+            scores[docs] += self.idf[term] * tf * (self.k1 + 1) / (tf + self._norm[docs])
+        return scores
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Top-k (posição do documento, score), apenas documentos com score > 0."""
+        scores = self.scores(query)
+        hits = np.flatnonzero(scores > 0)
+        if not len(hits) or k <= 0:
+            return []
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(int(i), float(scores[i])) for i in hits]
+
+
+# ───────────── Fusão ─────────────
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Document]], k: int, rrf_k: int = RRF_K) -> List[Document]:
+    """Soma 1/(rrf_k + posição) de cada lista; documentos identificados pelo hash do texto."""
+    fused: Dict[str, float] = {}
+    first_seen: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = chunk_hash(doc.page_content)
+            fused[key] = fused.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            first_seen.setdefault(key, doc)
+    best = sorted(fused, key=fused.get, reverse=True)[:k]
+    return [first_seen[key] for key in best]
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever denso + BM25 fundidos por RRF; sem índice BM25, repassa o denso."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    dense: Any
+    index: Optional[BM25Index] = None
+    k: int = HYBRID_TOP_K
+    candidates: int = HYBRID_CANDIDATES
+    rrf_k: int = RRF_K
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        start = time.perf_counter()
+        dense_docs = self.dense.invoke(query, config={"callbacks": run_manager.get_child()})
+        if self.index is None:
+            return dense_docs[: self.k]
+        dense_time = time.perf_counter() - start
+        sparse_docs = [self.index.documents[i] for i, _ in self.index.search(query, self.candidates)]
+        fused = reciprocal_rank_fusion([dense_docs, sparse_docs], self.k, self.rrf_k)
+        logger.info(
+            "🔀 Híbrido: %d densos (%.0f ms) + %d BM25 (%.1f ms) → %d",
+            len(dense_docs), dense_time * 1000, len(sparse_docs),
+            (time.perf_counter() - start - dense_time) * 1000, len(fused),
+        )
+        return fused
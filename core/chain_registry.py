@@ -0,0 +1,160 @@
+# core/chain_registry.py
+"""
+Registro de cadeias RAG por documento, limitado e persistente.
+
+As cadeias em memória ficam num LRU com teto de quantidade e de memória
+estimada. Um manifesto JSON guarda doc_id → índice/namespace/config, então
+uma cadeia despejada (ou perdida num restart) é reconstruída sob demanda na
+próxima consulta. A reconstrução só reconecta ao índice e não gera
+embeddings novos.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from .config import CHAIN_REGISTRY_MAX_CHAINS, CHAIN_REGISTRY_MAX_MB
+from .utils import ensure_directory
+
+logger = logging.getLogger(__name__)
+
+ChainBuilder = Callable[[str, Dict[str, Any]], Any]
+
+_BASE_CHAIN_BYTES = 64 * 1024  # grafo, prompt e wrappers (LLM/embeddings são compartilhados)
+
+
+def estimate_chain_bytes(chain: Any) -> int:
+    """Memória própria da cadeia: índice BM25 e texto dos chunks que ela mantém."""
+    size = _BASE_CHAIN_BYTES
+    base = getattr(chain, "original_chain", chain)
+    retriever = getattr(base, "retriever", None)
+    index = getattr(retriever, "index", None)
+    if index is not None and hasattr(index, "nbytes"):
+        size += index.nbytes
+        size += sum(len(doc.page_content.encode("utf-8")) + 256 for doc in index.documents)
+    return size
+
+
+class ChainRegistry:
+    """LRU de cadeias com manifesto persistente para reconstrução preguiçosa."""
+
+    def __init__(
+        self,
+        manifest_path: Union[str, Path],
+        builder: ChainBuilder,
+        max_chains: int = CHAIN_REGISTRY_MAX_CHAINS,
+        max_bytes: int = int(CHAIN_REGISTRY_MAX_MB * 1024 * 1024),
+    ):
+        self.manifest_path = Path(manifest_path)
+        self.builder = builder
+        self.max_chains = max_chains
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._chains: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._manifest: Dict[str, Dict[str, Any]] = {}
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "rebuilds": 0, "evictions": 0, "rebuild_seconds": 0.0}
+        self._load()
+
+    # ───────────── Manifesto ─────────────
+    def _load(self) -> None:
+        if not self.manifest_path.exists():
+            return
+        try:
+            self._manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as exc:
+            logger.warning("Manifesto de cadeias ilegível (%s); começando vazio.", exc)
+
+    def _save(self) -> None:
+        ensure_directory(self.manifest_path.parent)
+        tmp = self.manifest_path.with_suffix(self.manifest_path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self._manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.manifest_path)  # escrita atômica
+
+    def describe(self, doc_id: str, **entry: Any) -> None:
+        """Registra (só no manifesto) como reconstruir a cadeia do documento."""
+        with self._lock:
+            self._manifest[doc_id] = {**entry, "registered_at": datetime.now().isoformat()}
+            self._save()
+
+    def known(self, doc_id: str) -> bool:
+        with self._lock:
+            return doc_id in self._chains or doc_id in self._manifest
+
+    # ───────────── Cadeias em memória ─────────────
+    def register(self, doc_id: str, chain: Any, **entry: Any) -> None:
+        """Guarda a cadeia recém-criada e sua descrição no manifesto."""
+        if entry:
+            self.describe(doc_id, **entry)
+        with self._lock:
+            self._put(doc_id, chain)
+
+    def get(self, doc_id: str) -> Optional[Any]:
+        """Cadeia em memória ou reconstruída a partir do manifesto; None se desconhecida."""
+        with self._lock:
+            cached = self._chains.get(doc_id)
+            if cached is not None:
+                self._chains.move_to_end(doc_id)
+                self._stats["hits"] += 1
+                return cached[0]
+            self._stats["misses"] += 1
+            entry = self._manifest.get(doc_id)
+            if entry is None:
+                return None
+            build_lock = self._build_locks.setdefault(doc_id, threading.Lock())
+
+        # Um build por documento; consultas simultâneas esperam o mesmo resultado
+        with build_lock:
+            with self._lock:
+                cached = self._chains.get(doc_id)
+                if cached is not None:
+                    return cached[0]
+            start = time.perf_counter()
+            chain = self.builder(doc_id, dict(entry))
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._stats["rebuilds"] += 1
+                self._stats["rebuild_seconds"] += elapsed
+                self._put(doc_id, chain)
+            logger.info("♻️ Cadeia de '%s' reconstruída em %.2fs.", doc_id, elapsed)
+            return chain
+
+    def evict(self, doc_id: str) -> bool:
+        with self._lock:
+            cached = self._chains.pop(doc_id, None)
+            if cached is not None:
+                self._bytes -= cached[1]
+            return cached is not None
+
+    def _put(self, doc_id: str, chain: Any) -> None:
+        old = self._chains.pop(doc_id, None)
+        if old is not None:
+            self._bytes -= old[1]
+        size = estimate_chain_bytes(chain)
+        self._chains[doc_id] = (chain, size)
+        self._bytes += size
+        # Sempre mantém a cadeia recém-inserida, mesmo se sozinha passar do teto
+        while len(self._chains) > 1 and (len(self._chains) > self.max_chains or self._bytes > self.max_bytes):
+            evicted_id, (_, evicted_size) = self._chains.popitem(last=False)
+            self._bytes -= evicted_size
+            self._stats["evictions"] += 1
+            logger.info("🗑️ Cadeia de '%s' despejada do registro.", evicted_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rebuilds = self._stats["rebuilds"]
+            return {
+                **self._stats,
+                "loaded": len(self._chains),
+                "max_chains": self.max_chains,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "manifest_documents": len(self._manifest),
+                "avg_rebuild_seconds": self._stats["rebuild_seconds"] / rebuilds if rebuilds else 0.0,
+            }
@@ -48,19 +48,136 @@ if not ANTHROPIC_API_KEY:
 # ========== EMBEDDINGS ==========
 EMBEDDING_MODEL_NAME  = "intfloat/multilingual-e5-large" #"sentence-transformers/all-MiniLM-L6-v2" #"intfloat/multilingual-e5-large"
 EMBEDDING_TOKEN_LIMIT = 512
+EMBEDDING_CHUNK_OVERLAP = 32          # tokens repetidos entre chunks vizinhos
+E5_PASSAGE_PREFIX     = "passage: "
+E5_QUERY_PREFIX       = "query: "
+
+# ========== OCR / AGRUPAMENTO SEMÂNTICO ==========
+SEMANTIC_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+LAYOUT_MODEL_NAME   = "microsoft/layoutlmv2-base-uncased"
+# A codificação LayoutLMv2 não é consumida por nenhuma etapa; só ative se precisar dela
+OCR_LAYOUTLM_ENCODING = _get_secret("OCR_LAYOUTLM_ENCODING", "false").lower() == "true"
+SEMANTIC_BATCH_SIZE = 64
+OCR_DPI             = 300
+OCR_WORKERS         = int(_get_secret("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_PAGE_WINDOW     = 2                  # páginas rasterizadas por vez em cada worker
+OCR_PENDING_PER_WORKER = 2              # janelas em voo por worker (limita a memória de imagens)
 
 # ========== LLM ==========
 LLM_MODEL_NAME = "claude-sonnet-4-20250514"
 TOKEN_LIMIT    = 7000
+LLM_TIMEOUT     = 60.0   # segundos por requisição
+LLM_MAX_RETRIES = 2
+# Contexto de geração: orçamento (tokens do tokenizer do e5, aproximação do LLM)
+CONTEXT_PACKING_ENABLED = _get_secret("CONTEXT_PACKING_ENABLED", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET    = int(_get_secret("CONTEXT_TOKEN_BUDGET", str(TOKEN_LIMIT - 1000)))
+CONTEXT_DEDUP_THRESHOLD = 0.85   # Jaccard de shingles acima do qual um chunk é quase-duplicata
 
 # ========== PINECONE ==========
 PINECONE_INDEX_NAME = "legalmentor"
 PINECONE_BATCH_SIZE = 64
+PINECONE_POOL_THREADS = 4   # conexões HTTP do cliente/índice compartilhados
+# Upsert em paralelo ao embedding dos lotes seguintes (core/ingest_pipeline.py)
+UPSERT_WORKERS       = int(_get_secret("UPSERT_WORKERS", "4"))  # envios simultâneos por ingestão
+UPSERT_MAX_IN_FLIGHT = 8     # lotes embedados aguardando/em envio (limita a memória)
+UPSERT_RETRIES       = 3
+UPSERT_BACKOFF       = 0.5   # segundos; dobra a cada nova tentativa
+
+# ========== INGESTÃO EM BACKGROUND ==========
+INGEST_WORKERS    = int(_get_secret("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(_get_secret("INGEST_QUEUE_SIZE", "16"))
+# Jobs simultâneos permitidos em cada etapa pesada do pipeline
+INGEST_STAGE_CONCURRENCY = {
+    "docling":   int(_get_secret("INGEST_CONCURRENCY_DOCLING", "1")),
+    "ocr":       int(_get_secret("INGEST_CONCURRENCY_OCR", "1")),
+    "embedding": int(_get_secret("INGEST_CONCURRENCY_EMBEDDING", "1")),
+    "upsert":    int(_get_secret("INGEST_CONCURRENCY_UPSERT", "8")),  # requisições de upsert (somando os jobs)
+}
+
+# ========== RECUPERAÇÃO HÍBRIDA (BM25 + DENSO) ==========
+USE_HYBRID_RETRIEVAL = _get_secret("USE_HYBRID_RETRIEVAL", "true").lower() == "true"
+BM25_K1 = 1.5
+BM25_B  = 0.75
+RRF_K   = 60                # constante da Reciprocal Rank Fusion
+HYBRID_CANDIDATES = 30      # candidatos de cada retriever antes da fusão
+HYBRID_TOP_K      = 10      # documentos enviados ao prompt após a fusão
+
+# ========== RE-RANKING (CROSS-ENCODER) ==========
+RERANK_MODEL_NAME = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # multilíngue, roda em CPU
+RERANK_TOP_N      = int(_get_secret("RERANK_TOP_N", "5"))
+# Score mínimo (logit do cross-encoder) para manter um chunk; vazio = só top-n
+_rerank_min_score = _get_secret("RERANK_MIN_SCORE", "")
+RERANK_MIN_SCORE  = float(_rerank_min_score) if _rerank_min_score else None
+RERANK_BATCH_SIZE = 16
+RERANK_MAX_LENGTH = 512
+
+# ========== CACHE SEMÂNTICO DE RESPOSTAS ==========
+ANSWER_CACHE_ENABLED     = _get_secret("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD   = float(_get_secret("ANSWER_CACHE_THRESHOLD", "0.92"))  # cosseno mínimo
+ANSWER_CACHE_MIN_OVERLAP = float(_get_secret("ANSWER_CACHE_MIN_OVERLAP", "0.5"))  # palavras de conteúdo em comum
+ANSWER_CACHE_TTL         = float(_get_secret("ANSWER_CACHE_TTL", "86400"))      # segundos (0 = sem TTL)
+ANSWER_CACHE_MAX_ENTRIES = 2000
+ANSWER_CACHE_MAX_MB      = 64
+
+# ========== CACHE DE RECUPERAÇÃO ==========
+RETRIEVAL_CACHE_ENABLED    = _get_secret("RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"
+RETRIEVAL_CACHE_SIZE       = 512    # consultas (IDs dos chunks) no LRU
+QUERY_EMBEDDING_CACHE_SIZE = 1024   # embeddings de perguntas em memória
 
 # ========== DIRETÓRIOS ==========
 DATA_FOLDER      = Path("data")
 DOCUMENTS_FOLDER = DATA_FOLDER / "documentos"
 INDEX_FOLDER     = DATA_FOLDER / "indexes"
+INGEST_MANIFEST_PATH = INDEX_FOLDER / "ingest_manifest.sqlite"  # o .json antigo é migrado
+EMBEDDING_CACHE_PATH = INDEX_FOLDER / "embeddings.sqlite"
+CHAIN_MANIFEST_PATH  = INDEX_FOLDER / "chain_manifest.json"
+CHUNKS_FOLDER        = INDEX_FOLDER / "chunks"   # chunks por namespace (BM25 na reconstrução)
+MCP_MEMORY_PATH      = DATA_FOLDER / "mcp_memory.sqlite"
+
+# ========== REGISTRO DE CADEIAS (API) ==========
+CHAIN_REGISTRY_MAX_CHAINS = int(_get_secret("CHAIN_REGISTRY_MAX_CHAINS", "32"))
+CHAIN_REGISTRY_MAX_MB     = int(_get_secret("CHAIN_REGISTRY_MAX_MB", "512"))
+
+# ========== MEMÓRIA MCP ==========
+# "memory" (por processo) ou "sqlite" (compartilhada entre workers)
+MCP_BACKEND      = _get_secret("MCP_BACKEND", "memory").lower()
+MCP_MEMORY_SIZE  = 50     # turnos guardados por sessão
+MCP_MAX_SESSIONS = int(_get_secret("MCP_MAX_SESSIONS", "1000"))  # sessões guardadas (LRU / mais recentes)
+MCP_SESSION_IDLE_TTL = float(_get_secret("MCP_SESSION_IDLE_TTL", str(7 * 24 * 3600)))  # s sem escrita até despejar (sqlite)
+MCP_CONTEXT_TOP_K        = 3      # turnos anteriores levados à geração
+MCP_CONTEXT_TOKEN_BUDGET = 400    # tokens do histórico no prompt
+MCP_CONTEXT_MIN_SCORE    = 0.80   # cosseno mínimo (e5) entre a pergunta e um turno antigo
+
+# ========== ESTRATÉGIAS DO PLANNER (MCP) ==========
+# Parâmetros de recuperação/contexto aplicados por requisição conforme o plano
+# (`rerank_top_n` ausente: o rerank mantém `k` chunks)
+STRATEGY_PROFILES = {
+    "default":       {},   # retriever da cadeia como foi criado (MMR k=20 ou híbrido)
+    # Trecho específico: poucos chunks, similaridade pura, contexto curto
+    "extraction":    {"search_type": "similarity", "k": 5, "context_budget": 2000},
+    # Uma busca por lado da comparação, resultados intercalados
+    "comparison":    {"search_type": "mmr", "k": 8, "fetch_k": 40, "lambda_mult": 0.8, "fan_out": True},
+    # Mais chunks e mais diversidade, comprimidos por dedup mais agressivo;
+    # o rerank mantém os 15 melhores dos 40 recuperados
+    "summarization": {"search_type": "mmr", "k": 40, "fetch_k": 150, "lambda_mult": 0.5,
+                      "rerank_top_n": 15, "context_dedup_threshold": 0.6},
+}
+MAX_FAN_OUT_QUERIES = 3   # buscas extras (lados da comparação) por pergunta
+FAN_OUT_WORKERS     = 8   # buscas simultâneas das subconsultas (todas as requisições)
+
+# ========== CONSULTAS EM LOTE (/rag/query/batch) ==========
+BATCH_MAX_QUESTIONS          = 200
+BATCH_GENERATION_CONCURRENCY = int(_get_secret("BATCH_GENERATION_CONCURRENCY", "8"))  # chamadas ao LLM por lote
+
+# ========== VECTOR STORE ==========
+# "pinecone" (remoto) ou "local" (NumPy mapeado em disco, sem rede)
+VECTOR_STORE_BACKEND = _get_secret("VECTOR_STORE_BACKEND", "pinecone").lower()
+LOCAL_INDEX_FOLDER   = INDEX_FOLDER / "local"
+NAMESPACE_LIST_TTL   = 30.0   # segundos entre releituras dos namespaces na busca entre documentos
+
+# ========== MODELOS ==========
+# Nomes (separados por vírgula) carregados no startup da API; vazio = tudo sob demanda
+PRELOAD_MODELS = [m.strip() for m in _get_secret("PRELOAD_MODELS", "").split(",") if m.strip()]
 
 # ========== LANGGRAPH ==========
 USE_LANGGRAPH = _get_secret("USE_LANGGRAPH", "true").lower() == "true"
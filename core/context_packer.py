@@ -0,0 +1,106 @@
+# core/context_packer.py
+"""
+Empacotamento do contexto de geração dentro de um orçamento de tokens.
+
+Antes, todos os chunks recuperados iam para o prompt sem contagem, e o
+`TOKEN_LIMIT` nunca era aplicado. Aqui cada chunk é medido numa única chamada
+do tokenizer. Quase-duplicatas são descartadas por Jaccard de shingles de
+palavras. Depois, o orçamento é preenchido gulosamente na ordem de relevância
+recebida: um chunk que não cabe é pulado e os menores seguintes ainda podem
+entrar.
+"""
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document as LCDocument
+from langchain_core.retrievers import BaseRetriever
+
+from .config import CONTEXT_DEDUP_THRESHOLD, CONTEXT_TOKEN_BUDGET, E5_PASSAGE_PREFIX, EMBEDDING_MODEL_NAME
+from .utils import count_tokens_batch
+
+logger = logging.getLogger(__name__)
+
+_SHINGLE = 3
+
+
+def _shingles(text: str) -> Set[int]:
+    if text.startswith(E5_PASSAGE_PREFIX):
+        text = text[len(E5_PASSAGE_PREFIX):]
+    words = text.lower().split()
+    if len(words) < _SHINGLE:
+        return {hash(" ".join(words))}
+    return {hash(" ".join(words[i:i + _SHINGLE])) for i in range(len(words) - _SHINGLE + 1)}
+
+
+def _jaccard(a: Set[int], b: Set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def pack_context(
+    documents: Sequence[LCDocument],
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+    model_name: str = EMBEDDING_MODEL_NAME,
+) -> Tuple[List[LCDocument], Dict[str, Any]]:
+    """
+    Retorna (documentos mantidos, relatório). O relatório traz tokens usados e
+    descartados e quantos chunks caíram por duplicata ou por orçamento.
+    """
+    costs = count_tokens_batch([doc.page_content for doc in documents], model_name=model_name)
+    kept: List[LCDocument] = []
+    kept_shingles: List[Set[int]] = []
+    used = dropped_tokens = duplicates = over_budget = 0
+    for doc, cost in zip(documents, costs):
+        shingles = _shingles(doc.page_content)
+        if any(_jaccard(shingles, other) >= dedup_threshold for other in kept_shingles):
+            duplicates += 1
+            dropped_tokens += cost
+            continue
+        if used + cost > budget:
+            over_budget += 1
+            dropped_tokens += cost
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+        used += cost
+
+    report = {
+        "budget": budget,
+        "tokens_used": used,
+        "tokens_dropped": dropped_tokens,
+        "chunks_kept": len(kept),
+        "chunks_dropped_duplicate": duplicates,
+        "chunks_dropped_budget": over_budget,
+    }
+    logger.info(
+        "📦 Contexto: %d/%d chunks, %d tokens (orçamento %d, %d descartados).",
+        len(kept), len(documents), used, budget, dropped_tokens,
+    )
+    return kept, report
+
+
+class PackedDocuments(list):
+    """Documentos mantidos por `pack_context`, com o relatório em `report`."""
+
+    def __init__(self, documents: Sequence[LCDocument], report: Dict[str, Any]):
+        super().__init__(documents)
+        self.report = report
+
+
+class PackedRetriever(BaseRetriever):
+    """
+    Aplica `pack_context` ao resultado de outro retriever (cadeia sem LangGraph).
+    O relatório segue junto da lista (`PackedDocuments.report`) até a saída da cadeia.
+    """
+
+    retriever: Any
+    budget: Optional[int] = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[LCDocument]:
+        docs = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return PackedDocuments(*pack_context(docs, budget=self.budget or CONTEXT_TOKEN_BUDGET))
@@ -0,0 +1,197 @@
+# core/embedding_cache.py
+"""
+Cache persistente de embeddings de chunks (SQLite, vetores float32).
+
+A chave é (nome do modelo, SHA-256 do texto do chunk); o mesmo hash gera o
+ID do vetor no índice, o que torna os upserts idempotentes. Na ingestão,
+apenas os chunks ausentes do cache passam pelo modelo.
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .config import EMBEDDING_CACHE_PATH, QUERY_EMBEDDING_CACHE_SIZE
+from .utils import ensure_directory
+
+logger = logging.getLogger(__name__)
+
+_CACHES: Dict[str, "EmbeddingCache"] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def chunk_hash(text: str) -> str:
+    """Hash estável do texto do chunk (também usado como ID do vetor)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Armazena vetores float32 em SQLite, indexados por (modelo, hash do texto)."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        ensure_directory(self.path.parent)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model     TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector    BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        """Busca os vetores já calculados; hashes ausentes simplesmente não aparecem."""
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # Lotes abaixo do limite de parâmetros do SQLite
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model: str, items: Iterable[Tuple[str, Sequence[float]]]) -> None:
+        rows = [
+            (model, text_hash, np.asarray(vector, dtype=np.float32).tobytes())
+            for text_hash, vector in items
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def get_embedding_cache(path: Union[str, Path] = EMBEDDING_CACHE_PATH) -> EmbeddingCache:
+    """Instância única do cache por arquivo, compartilhada no processo."""
+    key = str(Path(path).resolve())
+    with _CACHES_LOCK:
+        if key not in _CACHES:
+            _CACHES[key] = EmbeddingCache(path)
+        return _CACHES[key]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings que consultam o cache em disco antes de chamar o modelo
+    (documentos) e um LRU em memória para as perguntas. `query_prefix` ("query: "
+    no e5) vai só para o modelo: o LRU usa a pergunta crua como chave, então a
+    busca e o cache de respostas reaproveitam o mesmo vetor.
+    """
+
+    def __init__(
+        self,
+        base: Embeddings,
+        model_name: str,
+        cache: EmbeddingCache,
+        query_cache_size: int = QUERY_EMBEDDING_CACHE_SIZE,
+        query_prefix: str = "",
+    ):
+        self.base = base
+        self.query_prefix = query_prefix
+        self.model_name = model_name
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self.query_cache_size = query_cache_size
+        self.query_hits = 0
+        self.query_misses = 0
+        self._queries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._queries_lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [chunk_hash(t) for t in texts]
+        vectors = self.cache.get_many(self.model_name, hashes)
+
+        missing: Dict[str, str] = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in vectors:
+                missing.setdefault(text_hash, text)
+        self.hits += len(texts) - sum(1 for h in hashes if h in missing)
+        self.misses += len(missing)
+
+        if missing:
+            computed = self.base.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), computed))
+            self.cache.put_many(self.model_name, new_items)
+            vectors.update((h, list(v)) for h, v in new_items)
+            logger.info("🧮 Embeddings: %d do cache, %d calculados.", len(texts) - len(missing), len(missing))
+
+        return [vectors[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._queries_lock:
+            vector = self._queries.get(text)
+            if vector is not None:
+                self._queries.move_to_end(text)
+                self.query_hits += 1
+                return vector
+            self.query_misses += 1
+        vector = self.base.embed_query(self.query_prefix + text)
+        self._remember_queries([(text, vector)])
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Várias perguntas de uma vez: as ausentes do LRU passam pelo modelo numa
+        única chamada em lote, pelo mesmo caminho de `embed_query`, e ficam no
+        LRU para as buscas seguintes.
+        """
+        with self._queries_lock:
+            found = {t: self._queries[t] for t in texts if t in self._queries}
+            missing = list(dict.fromkeys(t for t in texts if t not in found))
+            self.query_hits += len(texts) - len(missing)
+            self.query_misses += len(missing)
+        if missing:
+            computed = [list(v) for v in self._embed_query_batch([self.query_prefix + t for t in missing])]
+            self._remember_queries(list(zip(missing, computed)))
+            found.update(zip(missing, computed))
+        return [found[t] for t in texts]
+
+    def _embed_query_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        `embed_query` em lote. O HuggingFaceEmbeddings sem `query_encode_kwargs`
+        próprios codifica perguntas como documentos (mesmos `encode_kwargs`),
+        então `embed_documents` é o mesmo caminho numa só chamada. Com kwargs de
+        pergunta diferentes, ou em outros modelos, uma chamada de `embed_query`
+        por pergunta.
+        """
+        query_kwargs = getattr(self.base, "query_encode_kwargs", None)
+        if query_kwargs is not None and (not query_kwargs or query_kwargs == self.base.encode_kwargs):
+            return self.base.embed_documents(texts)
+        return [self.base.embed_query(text) for text in texts]
+
+    def _remember_queries(self, items: List[Tuple[str, List[float]]]) -> None:
+        if self.query_cache_size <= 0:
+            return
+        with self._queries_lock:
+            for text, vector in items:
+                self._queries[text] = vector
+                self._queries.move_to_end(text)
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
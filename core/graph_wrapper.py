@@ -1,6 +1,9 @@
 from .langgraph_pipeline import LangGraphRAGPipeline
 from .config import USE_LANGGRAPH
+from .strategies import plan_strategy
+import asyncio
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -14,24 +17,107 @@ def wrap_with_langgraph(existing_chain, use_rerank: bool = True):
 
 class GraphChainWrapper:
     """Wrapper that chooses between the original chain or LangGraph pipeline."""
-    def __init__(self, original_chain, use_langgraph: bool = True, use_rerank: bool = True):
+    def __init__(self, original_chain, use_langgraph: bool = True, use_rerank: bool = True,
+                 doc_id=None, answer_cache=None, retrieval_cache=None, strategy_stats=None):
         self.original_chain = original_chain
         self.using_langgraph = use_langgraph
+        # Latência/tokens por estratégia do planner (inputs['plan'])
+        self.strategy_stats = strategy_stats
+        # Cache semântico de respostas (só com doc_id conhecido)
+        self.doc_id = doc_id
+        self.answer_cache = answer_cache if doc_id is not None else None
         if use_langgraph:
             logger.info("⚙️ Initializing LangGraphRAGPipeline")
-            self.active_chain = LangGraphRAGPipeline(original_chain, use_rerank=use_rerank)
+            self.active_chain = LangGraphRAGPipeline(
+                original_chain, use_rerank=use_rerank,
+                retrieval_cache=retrieval_cache, scope=doc_id,
+            )
         else:
             self.active_chain = original_chain
 
+    def _cache_lookup(self, inputs):
+        """Retorna (entradas sem a flag, resposta em cache ou None, vetor da pergunta)."""
+        inputs = dict(inputs)
+        use_cache = inputs.pop('use_cache', True) and self.answer_cache is not None
+        if not use_cache:
+            return inputs, False, None, None
+        cached, vector = self.answer_cache.lookup(self.doc_id, inputs.get('input', ''))
+        return inputs, True, cached, vector
+
+    def _record(self, inputs, start, result):
+        if self.strategy_stats is not None:
+            self.strategy_stats.record(plan_strategy(inputs.get('plan')), time.perf_counter() - start, result)
+
     def invoke(self, inputs):
-        """Executes the chosen chain and annotates metadata."""
+        """Executes the chosen chain and annotates metadata.
+
+        `inputs['plan']` (MCPSystem.plan) sets retrieval/context parameters for this request.
+        """
+        inputs, use_cache, cached, vector = self._cache_lookup(inputs)
+        if cached is not None:
+            return cached
+        start = time.perf_counter()
         result = self.active_chain.invoke(inputs)
         # Ensure metadata exists
         if 'metadata' not in result:
             result['metadata'] = {}
         result['metadata']['using_langgraph'] = self.using_langgraph
+        if use_cache:
+            result['metadata']['answer_cache'] = {'hit': False}
+            self.answer_cache.store(self.doc_id, inputs.get('input', ''), result, vector)
+        self._record(inputs, start, result)
         return result
 
+    def stream(self, inputs):
+        """Repassa os eventos de streaming da chain ativa, anotando o evento final."""
+        inputs, use_cache, cached, vector = self._cache_lookup(inputs)
+        if cached is not None:
+            yield {'type': 'final', **cached}
+            return
+        start = time.perf_counter()
+        for event in self.active_chain.stream(inputs):
+            if event.get('type') == 'final':
+                event.setdefault('metadata', {})['using_langgraph'] = self.using_langgraph
+                result = {k: v for k, v in event.items() if k != 'type'}
+                if use_cache:
+                    event['metadata']['answer_cache'] = {'hit': False}
+                    self.answer_cache.store(self.doc_id, inputs.get('input', ''), result, vector)
+                self._record(inputs, start, result)
+            yield event
+
+    async def ainvoke(self, inputs):
+        """Async version of invoke: cache and stats run off the event loop."""
+        inputs, use_cache, cached, vector = await asyncio.to_thread(self._cache_lookup, inputs)
+        if cached is not None:
+            return cached
+        start = time.perf_counter()
+        result = await self.active_chain.ainvoke(inputs)
+        result.setdefault('metadata', {})['using_langgraph'] = self.using_langgraph
+        if use_cache:
+            result['metadata']['answer_cache'] = {'hit': False}
+            await asyncio.to_thread(self.answer_cache.store, self.doc_id, inputs.get('input', ''), result, vector)
+        await asyncio.to_thread(self._record, inputs, start, result)
+        return result
+
+    async def astream(self, inputs):
+        """Async version of stream (same events)."""
+        inputs, use_cache, cached, vector = await asyncio.to_thread(self._cache_lookup, inputs)
+        if cached is not None:
+            yield {'type': 'final', **cached}
+            return
+        start = time.perf_counter()
+        async for event in self.active_chain.astream(inputs):
+            if event.get('type') == 'final':
+                event.setdefault('metadata', {})['using_langgraph'] = self.using_langgraph
+                result = {k: v for k, v in event.items() if k != 'type'}
+                if use_cache:
+                    event['metadata']['answer_cache'] = {'hit': False}
+                    await asyncio.to_thread(
+                        self.answer_cache.store, self.doc_id, inputs.get('input', ''), result, vector,
+                    )
+                await asyncio.to_thread(self._record, inputs, start, result)
+            yield event
+
     __call__ = invoke
 
     def __getattr__(self, name):
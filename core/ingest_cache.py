@@ -0,0 +1,125 @@
+# core/ingest_cache.py
+"""
+Cache de ingestão endereçado por conteúdo.
+
+O upload é gravado em disco em blocos enquanto o SHA-256 é calculado. Um
+manifesto em SQLite mapeia o hash → documento já indexado, de modo que
+reenviar o mesmo PDF não repete Docling/OCR/embeddings/upsert. O banco é
+compartilhado entre os workers do uvicorn: cada `record` é um INSERT atômico
+e `lookup` só lê. Os contadores de hit/miss ficam em memória, por processo.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Optional, Tuple, Union
+
+from .utils import ensure_directory
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def save_upload(fileobj: BinaryIO, dest_dir: Union[str, Path], suffix: str = ".pdf") -> Tuple[Path, str]:
+    """Grava o upload em `dest_dir/<sha256><suffix>` calculando o hash em streaming."""
+    ensure_directory(dest_dir)
+    hasher = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=dest_dir, suffix=".part", delete=False) as tmp:
+        for block in iter(lambda: fileobj.read(_CHUNK_SIZE), b""):
+            hasher.update(block)
+            tmp.write(block)
+    digest = hasher.hexdigest()
+    final_path = Path(dest_dir) / f"{digest}{suffix}"
+    os.replace(tmp.name, final_path)  # mesmo conteúdo → mesmo arquivo
+    return final_path, digest
+
+
+class IngestCache:
+    """Manifesto persistente hash de conteúdo → documento indexado."""
+
+    def __init__(self, manifest_path: Union[str, Path]):
+        self.manifest_path = Path(manifest_path)
+        ensure_directory(self.manifest_path.parent)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+        self._conn = sqlite3.connect(str(self.manifest_path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                content_hash TEXT PRIMARY KEY,
+                doc_id       TEXT NOT NULL,
+                indexed_at   TEXT NOT NULL,
+                extra        TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_doc_id ON documents (doc_id)")
+        self._conn.commit()
+        self._import_json(self.manifest_path.with_suffix(".json"))
+
+    def _import_json(self, legacy: Path) -> None:
+        """Migra o manifesto JSON antigo (uma vez; o arquivo é renomeado)."""
+        if not legacy.exists() or legacy == self.manifest_path:
+            return
+        try:
+            documents = json.loads(legacy.read_text(encoding="utf-8")).get("documents", {})
+        except (OSError, ValueError) as exc:
+            logger.warning("Manifesto de ingestão JSON ilegível (%s); ignorado.", exc)
+            return
+        with self._lock:
+            for content_hash, entry in documents.items():
+                entry = dict(entry)
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO documents VALUES (?, ?, ?, ?)",
+                    (content_hash, entry.pop("doc_id"), entry.pop("indexed_at", ""), json.dumps(entry)),
+                )
+            self._conn.commit()
+        os.replace(legacy, legacy.with_suffix(".json.migrated"))
+        logger.info("📦 Manifesto de ingestão migrado para SQLite (%d documentos).", len(documents))
+
+    @staticmethod
+    def _entry(row) -> Dict[str, Any]:
+        doc_id, indexed_at, extra = row
+        return {"doc_id": doc_id, "indexed_at": indexed_at, **json.loads(extra)}
+
+    def lookup(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Retorna a entrada do documento já indexado (contabiliza hit/miss em memória)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT doc_id, indexed_at, extra FROM documents WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+            self._stats["hits" if row else "misses"] += 1
+        return self._entry(row) if row else None
+
+    def record(self, content_hash: str, doc_id: str, **extra: Any) -> None:
+        """Registra um documento cuja ingestão terminou com sucesso."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)",
+                (content_hash, doc_id, datetime.now().isoformat(), json.dumps(extra, ensure_ascii=False)),
+            )
+            self._conn.commit()
+
+    def find_by_doc_id(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash, doc_id, indexed_at, extra FROM documents WHERE doc_id = ? LIMIT 1", (doc_id,)
+            ).fetchone()
+        return {"content_hash": row[0], **self._entry(row[1:])} if row else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "documents": documents,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
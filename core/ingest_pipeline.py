@@ -0,0 +1,103 @@
+# core/ingest_pipeline.py
+"""
+Embedding e upsert sobrepostos na ingestão (produtor/consumidor).
+
+O produtor embeda os lotes em sequência (o modelo já ocupa a CPU) e entrega
+cada lote pronto a um pool de workers que faz os upserts em paralelo. Assim a
+CPU não espera a rede nem a rede espera a CPU. No máximo `max_in_flight` lotes
+embedados ficam aguardando ou em envio. Se o índice não acompanha, o produtor
+espera, o que limita a memória. Um upsert que falha é repetido com backoff
+exponencial. Esgotadas as tentativas, a produção para e o erro é relançado.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Sequence
+
+from .config import UPSERT_BACKOFF, UPSERT_MAX_IN_FLIGHT, UPSERT_RETRIES, UPSERT_WORKERS
+from .jobs import ProgressCallback, no_progress, stage_slot
+
+logger = logging.getLogger(__name__)
+
+
+def embed_and_upsert(
+    documents: Sequence[Any],
+    embed: Callable[[List[str]], List[List[float]]],
+    upsert: Callable[[Sequence[Any], List[List[float]]], None],
+    batch_size: int,
+    progress: ProgressCallback = no_progress,
+    workers: int = UPSERT_WORKERS,
+    max_in_flight: int = UPSERT_MAX_IN_FLIGHT,
+    retries: int = UPSERT_RETRIES,
+    backoff: float = UPSERT_BACKOFF,
+) -> Dict[str, float]:
+    """
+    Embeda `documents` em lotes de `batch_size` e envia cada lote com
+    `upsert(lote, vetores)`. Devolve a vazão de cada etapa: chunks/s embedados
+    (sobre o tempo de embedding) e vetores/s enviados (sobre a janela entre o
+    primeiro e o último upsert).
+    """
+    total = len(documents)
+    in_flight = threading.BoundedSemaphore(max(1, max_in_flight))
+    failed = threading.Event()
+    lock = threading.Lock()
+    state = {"upserted": 0, "retries": 0, "first": None, "last": None}
+
+    def send(batch: Sequence[Any], vectors: List[List[float]]) -> None:
+        try:
+            started = time.perf_counter()
+            for attempt in range(retries + 1):
+                try:
+                    with stage_slot("upsert"):
+                        upsert(batch, vectors)
+                    break
+                except Exception as exc:
+                    if attempt == retries or failed.is_set():
+                        raise
+                    delay = backoff * 2 ** attempt
+                    logger.warning(
+                        "⚠️ Upsert falhou (%s); nova tentativa em %.1fs (%d/%d).", exc, delay, attempt + 1, retries,
+                    )
+                    with lock:
+                        state["retries"] += 1
+                    time.sleep(delay)
+            with lock:
+                state["first"] = min(started, state["first"] or started)
+                state["last"] = time.perf_counter()
+                state["upserted"] += len(batch)
+                progress("upserting", chunks_upserted=state["upserted"], chunks_total=total)
+        except Exception:
+            failed.set()  # o produtor para de embedar lotes que não seriam enviados
+            raise
+        finally:
+            in_flight.release()
+
+    start = time.perf_counter()
+    embed_seconds = 0.0
+    futures = []
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="upsert") as pool:
+        for offset in range(0, total, batch_size):
+            if failed.is_set():
+                break
+            batch = documents[offset:offset + batch_size]
+            embed_start = time.perf_counter()
+            with stage_slot("embedding"):
+                vectors = embed([doc.page_content for doc in batch])
+            embed_seconds += time.perf_counter() - embed_start
+            progress("embedding", chunks_embedded=offset + len(batch), chunks_total=total)
+            in_flight.acquire()  # espera um envio terminar se o limite foi atingido
+            futures.append(pool.submit(send, batch, vectors))
+        for future in futures:
+            future.result()  # relança o primeiro erro de upsert
+
+    upsert_seconds = (state["last"] - state["first"]) if state["first"] is not None else 0.0
+    return {
+        "chunks": total,
+        "embed_seconds": round(embed_seconds, 3),
+        "embed_chunks_per_s": round(total / embed_seconds, 1) if embed_seconds else 0.0,
+        "upsert_seconds": round(upsert_seconds, 3),
+        "upsert_vectors_per_s": round(total / upsert_seconds, 1) if upsert_seconds else 0.0,
+        "upsert_retries": state["retries"],
+        "total_seconds": round(time.perf_counter() - start, 3),
+    }
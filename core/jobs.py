@@ -0,0 +1,157 @@
+# core/jobs.py
+"""
+Fila de jobs de ingestão em background, com progresso por etapa.
+
+O upload devolve um job_id na hora; um pool fixo de workers consome uma
+fila limitada e cada job expõe etapa + contadores (páginas com OCR, chunks
+embedados/enviados). Semáforos por etapa limitam a concorrência das fases
+pesadas entre jobs simultâneos.
+"""
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .config import INGEST_QUEUE_SIZE, INGEST_STAGE_CONCURRENCY, INGEST_WORKERS
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[..., None]
+
+# ───────────── Limites de concorrência por etapa ─────────────
+_STAGE_SEMAPHORES = {
+    stage: threading.BoundedSemaphore(max(limit, 1))
+    for stage, limit in INGEST_STAGE_CONCURRENCY.items()
+}
+
+
+@contextmanager
+def stage_slot(stage: str) -> Iterator[None]:
+    """Ocupa uma vaga da etapa (sem limite se a etapa não estiver configurada)."""
+    semaphore = _STAGE_SEMAPHORES.get(stage)
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
+
+
+def no_progress(stage: str, **counters: Any) -> None:
+    """Callback de progresso nulo (execução síncrona)."""
+
+
+class QueueFullError(RuntimeError):
+    """A fila de ingestão atingiu o limite configurado."""
+
+
+class IngestionJob:
+    """Estado de um job; `update` é o callback de progresso passado ao pipeline."""
+
+    def __init__(self, job_id: str, key: Optional[str] = None, **info: Any):
+        self.job_id = job_id
+        self.key = key
+        self.info = info
+        self.status = "queued"
+        self.stage = "queued"
+        self.progress: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self._lock = threading.Lock()
+
+    def update(self, stage: str, **counters: Any) -> None:
+        with self._lock:
+            self.stage = stage
+            self.progress.update(counters)
+            self.updated_at = time.time()
+
+    def _set_status(self, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.status = status
+            self.stage = status
+            self.error = error
+            self.updated_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": dict(self.progress),
+                "error": self.error,
+                "elapsed": round(self.updated_at - self.created_at, 2),
+                **self.info,
+            }
+
+
+class IngestionQueue:
+    """Pool fixo de workers consumindo uma fila limitada de jobs."""
+
+    def __init__(self, workers: int = INGEST_WORKERS, max_queued: int = INGEST_QUEUE_SIZE, history: int = 200):
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queued)
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._active: Dict[str, IngestionJob] = {}
+        self._history = history
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"ingest-{i}", daemon=True)
+            for i in range(max(workers, 1))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn: Callable[..., Any], *args: Any, key: Optional[str] = None, **info: Any) -> IngestionJob:
+        """
+        Enfileira `fn(job, *args)`. Um job ativo com a mesma `key` é reaproveitado.
+        Levanta QueueFullError se a fila estiver cheia.
+        """
+        with self._lock:
+            if key is not None and key in self._active:
+                return self._active[key]
+            job = IngestionJob(uuid.uuid4().hex, key=key, **info)
+            try:
+                self._queue.put_nowait((job, fn, args))
+            except queue.Full:
+                raise QueueFullError("Fila de ingestão cheia; tente novamente em instantes.") from None
+            self._jobs[job.job_id] = job
+            if key is not None:
+                self._active[key] = job
+            self._trim()
+            return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _trim(self) -> None:
+        # Descarta os jobs terminados mais antigos além do histórico
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self._history:
+                break
+            if self._jobs[job_id].status in ("done", "failed"):
+                del self._jobs[job_id]
+
+    def _worker(self) -> None:
+        while True:
+            job, fn, args = self._queue.get()
+            job._set_status("running")
+            try:
+                fn(job, *args)
+                job._set_status("done")
+            except Exception as exc:  # noqa: BLE001
+                logger.exception("Job de ingestão %s falhou: %s", job.job_id, exc)
+                job._set_status("failed", error=str(exc))
+            finally:
+                with self._lock:
+                    if job.key is not None:
+                        self._active.pop(job.key, None)
+                self._queue.task_done()
+
+    def join(self) -> None:
+        """Aguarda a fila esvaziar (útil em testes)."""
+        self._queue.join()
@@ -1,13 +1,41 @@
-from typing import Dict, Any, List
+from typing import AsyncIterator, Callable, Dict, Any, Iterator, List, Optional, Sequence, Tuple
+from functools import partial
 from langchain.schema import Document as LCDocument
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 from langgraph.graph.state import CompiledStateGraph
 from typing_extensions import TypedDict
+import asyncio
+import json
 import logging
+import threading
 import time
 
+from .strategies import (
+    configure_retriever,
+    aretrieve_many,
+    packing_kwargs,
+    params_fingerprint,
+    plan_queries,
+    retrieval_params,
+    retrieve_many,
+)
+
 logger = logging.getLogger(__name__)
 
+
+def message_text(message: Any) -> str:
+    """Extrai o texto de um chunk de mensagem (str ou lista de blocos de conteúdo)."""
+    content = getattr(message, "content", message)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            block.get("text", "") if isinstance(block, dict) else str(block)
+            for block in content
+        )
+    return ""
+
 class RAGState(TypedDict):
     """Estado compartilhado entre os nós do grafo"""
     query: str
@@ -15,12 +43,26 @@ class RAGState(TypedDict):
     answer: str
     metadata: Dict[str, Any]
     step_count: int
+    plan: Dict[str, Any]
+    generation_query: str
+    sub_queries: List[str]
+
+# reranker(query, documentos, top_n=...) → pares (documento, score)
+Reranker = Callable[..., List[Tuple[LCDocument, float]]]
 
 class LangGraphRAGPipeline:
     """Pipeline RAG usando LangGraph - Wrapper do pipeline existente"""
-    def __init__(self, existing_chain, use_rerank: bool = True):
+    def __init__(self, existing_chain, use_rerank: bool = True, reranker: Optional[Reranker] = None,
+                 retrieval_cache=None, scope: Optional[str] = None):
         self.existing_chain = existing_chain
         self.use_rerank = use_rerank
+        # Cache exato de recuperação, por documento (escopo) e parâmetros do retriever
+        self.retrieval_cache = retrieval_cache
+        self.scope = scope
+        if reranker is None and use_rerank:
+            from .rerank import rerank_documents  # cross-encoder só quando o rerank está ativo
+            reranker = rerank_documents
+        self.reranker = reranker
         # Captura o retriever na inicialização
         if hasattr(existing_chain, 'retriever'):
             self.retriever = existing_chain.retriever
@@ -29,86 +71,270 @@ class LangGraphRAGPipeline:
                 "Chain existente não expõe 'retriever'. "
                 "Defina ou injete o atributo antes de usar LangGraph."
             )
+        # Empacotador de contexto (orçamento de tokens) exposto pela chain, se houver
+        self.packer = getattr(existing_chain, 'packer', None)
+        # Retrievers configurados por estratégia do planner (cópias rasas, reaproveitadas)
+        self._planned: Dict[str, Tuple[Any, str]] = {}
+        self._planned_lock = threading.Lock()
         self.graph = self._build_graph()
     
     def _build_graph(self) -> CompiledStateGraph:
         """Constrói e compila o grafo de nós"""
         workflow = StateGraph(RAGState)
-        # 1) Recuperação de documentos
-        workflow.add_node("retrieve", self._retrieve_node)
-        # 2) Re-ranking opcional (stub)
+        # Cada nó tem versão síncrona (invoke/stream) e assíncrona (ainvoke/astream)
+        # 1) Decomposição (comparações → uma subconsulta por lado)
+        workflow.add_node("decompose", self._decompose_node)
+        # 2) Recuperação de documentos (subconsultas em paralelo)
+        workflow.add_node("retrieve", RunnableLambda(self._retrieve_node, afunc=self._aretrieve_node))
+        # 3) Re-ranking opcional (cross-encoder)
         if self.use_rerank:
-            workflow.add_node("rerank", self._rerank_node)
-        # 3) Geração de resposta
-        workflow.add_node("generate", self._generate_node)
+            workflow.add_node("rerank", RunnableLambda(
+                self._rerank_node, afunc=partial(self._athread_node, self._rerank_node),
+            ))
+        # 4) Empacotamento do contexto no orçamento de tokens
+        if self.packer is not None:
+            workflow.add_node("pack", RunnableLambda(
+                self._pack_node, afunc=partial(self._athread_node, self._pack_node),
+            ))
+        # 5) Geração de resposta
+        workflow.add_node("generate", RunnableLambda(self._generate_node, afunc=self._agenerate_node))
         # Define fluxo de execução
-        workflow.set_entry_point("retrieve")
+        workflow.set_entry_point("decompose")
+        steps = ["decompose", "retrieve"]
         if self.use_rerank:
-            workflow.add_edge("retrieve", "rerank")
-            workflow.add_edge("rerank", "generate")
-        else:
-            workflow.add_edge("retrieve", "generate")
+            steps.append("rerank")
+        if self.packer is not None:
+            steps.append("pack")
+        steps.append("generate")
+        for src, dst in zip(steps, steps[1:]):
+            workflow.add_edge(src, dst)
         workflow.add_edge("generate", END)
         return workflow.compile()
     
-    def _retrieve_node(self, state: RAGState) -> RAGState:
-        """Nó de recuperação de documentos"""
-        logger.info(f"🔍 Retrieving documents for query: {state['query']}")
-        # invoke retriever usando o novo método para evitar warning de depreciação
-        docs = self.retriever.invoke(state['query'], {})
+    def _retriever_for(self, params: Dict[str, Any]) -> Tuple[Any, str]:
+        """Retriever com os parâmetros da estratégia e sua impressão digital (chave de cache)."""
+        key = json.dumps(params, sort_keys=True)
+        with self._planned_lock:
+            if key not in self._planned:
+                retriever = configure_retriever(self.retriever, params)
+                fingerprint = ""
+                if self.retrieval_cache is not None:
+                    from .retrieval_cache import retriever_fingerprint
+                    fingerprint = retriever_fingerprint(retriever)
+                self._planned[key] = (retriever, fingerprint)
+            return self._planned[key]
+
+    def _decompose_node(self, state: RAGState) -> RAGState:
+        """Nó de decomposição: pergunta de comparação → pergunta + um lado por subconsulta"""
+        state['sub_queries'] = plan_queries(state['query'], state.get('plan'))
+        if len(state['sub_queries']) > 1:
+            state['metadata']['sub_queries'] = state['sub_queries'][1:]
+            logger.info(f"🪓 Decomposed into {len(state['sub_queries'])} queries")
+        state['step_count'] += 1
+        return state
+
+    def _cached_retrieval(self, state: RAGState):
+        """Retriever do plano, subconsultas, chave de cache e documentos (se hit)."""
+        queries = state.get('sub_queries') or [state['query']]
+        if state['metadata'].get('prefetched'):
+            # Documentos já recuperados pelo chamador (ex.: consultas em lote)
+            return None, queries, None, state['documents']
+        params = retrieval_params(state.get('plan'))
+        retriever, fingerprint = self._retriever_for(params)
+        docs, key = None, None
+        if self.retrieval_cache is not None:
+            fingerprint += params_fingerprint(params, queries)
+            key = self.retrieval_cache.key(self.scope, state['query'], fingerprint)
+            docs = self.retrieval_cache.get(key)
+            state['metadata']['retrieval_cache'] = {'hit': docs is not None}
+        return retriever, queries, key, docs
+
+    def _store_retrieval(self, state: RAGState, key, docs, branches, start: float) -> RAGState:
+        if branches is not None:
+            if len(branches) > 1:
+                # Latência por ramo; o tempo total fica perto do ramo mais lento
+                state['metadata']['fan_out'] = branches
+            if key is not None:
+                self.retrieval_cache.put(key, docs)
+        if key is not None:
+            state['metadata']['retrieval_cache'].update(self.retrieval_cache.stats())
         state['documents'] = docs
         state['step_count'] += 1
         state['metadata']['retrieve_count'] = len(docs)
+        state['metadata']['retrieve_latency'] = time.perf_counter() - start
         logger.info(f"📥 Retrieved {len(docs)} documents")
         return state
+
+    def _retrieve_node(self, state: RAGState) -> RAGState:
+        """Nó de recuperação de documentos (parâmetros do plano, se houver)"""
+        logger.info(f"🔍 Retrieving documents for query: {state['query']}")
+        start = time.perf_counter()
+        retriever, queries, key, docs = self._cached_retrieval(state)
+        branches = None
+        if docs is None:
+            docs, branches = retrieve_many(retriever, queries)
+        return self._store_retrieval(state, key, docs, branches, start)
+
+    async def _aretrieve_node(self, state: RAGState) -> RAGState:
+        """Versão assíncrona: subconsultas via `retriever.ainvoke` concorrentes"""
+        logger.info(f"🔍 Retrieving documents for query: {state['query']}")
+        start = time.perf_counter()
+        retriever, queries, key, docs = self._cached_retrieval(state)
+        branches = None
+        if docs is None:
+            docs, branches = await aretrieve_many(retriever, queries)
+        return self._store_retrieval(state, key, docs, branches, start)
     
     def _rerank_node(self, state: RAGState) -> RAGState:
-        """Nó de re-ranking (opcional stub)"""
+        """Nó de re-ranking: mantém só os chunks mais relevantes para o prompt"""
         logger.info("🔄 Reranking documents")
+        start = time.perf_counter()
+        # O plano define quantos chunks a estratégia leva ao prompt
+        params = retrieval_params(state.get('plan'))
+        top_n = params.get('rerank_top_n', params.get('k'))
+        kwargs = {'top_n': top_n} if top_n is not None else {}
+        ranked = self.reranker(state['query'], state['documents'], **kwargs)
+        # Cópias: os documentos originais podem estar em caches/índices compartilhados
+        state['documents'] = [
+            LCDocument(page_content=doc.page_content, metadata={**doc.metadata, 'rerank_score': score})
+            for doc, score in ranked
+        ]
         state['metadata']['rerank_applied'] = True
+        state['metadata']['rerank_latency'] = time.perf_counter() - start
+        state['metadata']['rerank_kept'] = len(ranked)
         state['step_count'] += 1
-        logger.info(f"✅ Reranked {len(state['documents'])} documents")
+        logger.info(f"✅ Reranked → {len(ranked)} documents")
         return state
 
-    def _generate_node(self, state: RAGState) -> RAGState:
-        """Nó de geração via LLM sem re-recuperar documentos"""
-        logger.info("🤖 Generating response from retrieved documents")
-        # Executa apenas a parte de combinação e geração
-        # Use o retriever_chain (combine_docs_chain) com as chaves esperadas
-        # 'input' para pergunta e 'context' para documentos
-        chain = self.existing_chain._chain
-        response = chain.invoke({
-            "input": state['query'],
+    def _pack_node(self, state: RAGState) -> RAGState:
+        """Nó de empacotamento: remove quase-duplicatas e respeita o orçamento de tokens"""
+        docs, report = self.packer(state['documents'], **packing_kwargs(state.get('plan')))
+        state['documents'] = docs
+        state['metadata']['context_packing'] = report
+        state['step_count'] += 1
+        return state
+
+    @staticmethod
+    def _generation_inputs(state: RAGState) -> Dict[str, Any]:
+        # Executa apenas a combinação + geração (document_chain), com as chaves
+        # 'input' para pergunta e 'context' para os documentos já recuperados
+        return {
+            # Pergunta com o histórico do MCP, se houver; a busca usou só a pergunta
+            "input": state.get('generation_query') or state['query'],
             "context": state['documents']
-        })
-        answer = response.get('answer') or response.get('output') or ''
-        state['answer'] = answer
+        }
+
+    @staticmethod
+    def _store_answer(state: RAGState, answer: Optional[str]) -> RAGState:
+        state['answer'] = answer or ''
         state['step_count'] += 1
         state['metadata']['generation_complete'] = True
         logger.info("✅ Response generated")
         return state
-    
-    def invoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
-        """Executa o grafo e retorna o resultado no formato compatível"""
-        initial_state: RAGState = {
-            'query': inputs.get('input') or inputs.get('question', ''),
-            'documents': [],
+
+    def _generate_node(self, state: RAGState) -> RAGState:
+        """Nó de geração via LLM sem re-recuperar documentos"""
+        logger.info("🤖 Generating response from retrieved documents")
+        answer = self.existing_chain.document_chain.invoke(self._generation_inputs(state))
+        return self._store_answer(state, answer)
+
+    async def _agenerate_node(self, state: RAGState) -> RAGState:
+        """Versão assíncrona: a chamada ao LLM não prende uma thread"""
+        logger.info("🤖 Generating response from retrieved documents")
+        answer = await self.existing_chain.document_chain.ainvoke(self._generation_inputs(state))
+        return self._store_answer(state, answer)
+
+    async def _athread_node(self, node: Callable[[RAGState], RAGState], state: RAGState) -> RAGState:
+        # Nós de CPU (cross-encoder, tokenizer) rodam fora do event loop
+        return await asyncio.to_thread(node, state)
+
+    def _initial_state(self, inputs: Dict[str, Any]) -> RAGState:
+        query = inputs.get('input') or inputs.get('question', '')
+        return {
+            'query': query,
+            'generation_query': inputs.get('generation_input') or query,
+            'sub_queries': [],
+            'documents': list(inputs.get('documents') or []),
             'answer': '',
             'metadata': {
                 'langgraph_used': True,
+                'prefetched': inputs.get('documents') is not None,
                 'start_time': time.time()
             },
-            'step_count': 0
+            'step_count': 0,
+            'plan': inputs.get('plan') or {},
         }
-        final_state = self.graph.invoke(initial_state)
+
+    @staticmethod
+    def _result(final_state: RAGState) -> Dict[str, Any]:
         end_time = time.time()
         final_state['metadata']['total_time'] = end_time - final_state['metadata']['start_time']
         final_state['metadata']['total_steps'] = final_state['step_count']
+        if final_state.get('plan'):
+            final_state['metadata']['strategy'] = final_state['plan'].get('strategy', 'default')
         return {
             'answer': final_state['answer'],
             'source_documents': final_state['documents'],
             'metadata': final_state['metadata']
         }
     
+    def invoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Executa o grafo e retorna o resultado no formato compatível"""
+        final_state = self.graph.invoke(self._initial_state(inputs))
+        return self._result(final_state)
+
+    async def ainvoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Igual a `invoke`, sem bloquear o event loop durante a busca e o LLM"""
+        final_state = await self.graph.ainvoke(self._initial_state(inputs))
+        return self._result(final_state)
+
+    def stream(self, inputs: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Executa o grafo emitindo os tokens do nó `generate` assim que chegam
+        ({'type': 'token'}) e, ao final, um evento {'type': 'final'} com
+        resposta, fontes e metadados (incluindo o time-to-first-token).
+        """
+        final_state = self._initial_state(inputs)
+        start = final_state['metadata']['start_time']
+        ttft = None
+        for mode, payload in self.graph.stream(final_state, stream_mode=["messages", "values"]):
+            if mode == "values":
+                final_state = payload
+                continue
+            message, meta = payload
+            if meta.get("langgraph_node") != "generate":
+                continue
+            text = message_text(message)
+            if not text:
+                continue
+            if ttft is None:
+                ttft = time.time() - start
+            yield {"type": "token", "content": text}
+        result = self._result(final_state)
+        result['metadata']['ttft'] = ttft
+        yield {"type": "final", **result}
+
+    async def astream(self, inputs: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Versão assíncrona de `stream` (mesmos eventos)"""
+        final_state = self._initial_state(inputs)
+        start = final_state['metadata']['start_time']
+        ttft = None
+        async for mode, payload in self.graph.astream(final_state, stream_mode=["messages", "values"]):
+            if mode == "values":
+                final_state = payload
+                continue
+            message, meta = payload
+            if meta.get("langgraph_node") != "generate":
+                continue
+            text = message_text(message)
+            if not text:
+                continue
+            if ttft is None:
+                ttft = time.time() - start
+            yield {"type": "token", "content": text}
+        result = self._result(final_state)
+        result['metadata']['ttft'] = ttft
+        yield {"type": "final", **result}
+    
     # Permite chamar diretamente como chain
     __call__ = invoke
@@ -1,24 +1,57 @@
-from transformers import LayoutLMv2Processor
 from PIL import Image
 import pytesseract
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+import os
 import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+import numpy as np
 import streamlit as st
 from langsmith import traceable
 
 from langchain_core.documents import Document as LCDocument
-from sentence_transformers import SentenceTransformer, util
-from typing import List
-from core.config import EMBEDDING_TOKEN_LIMIT
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from core.config import (
+    EMBEDDING_TOKEN_LIMIT,
+    SEMANTIC_BATCH_SIZE,
+    SEMANTIC_MODEL_NAME,
+    LAYOUT_MODEL_NAME,
+    OCR_LAYOUTLM_ENCODING,
+    OCR_DPI,
+    OCR_WORKERS,
+    OCR_PAGE_WINDOW,
+    OCR_PENDING_PER_WORKER,
+)
+from .models import get_model, register_model
 from .utils import (split_text_by_token_limit, 
                    adjust_chunks_to_token_limit)
 
-# ======== MODELOS =========
-# LayoutLMv2
-processor = LayoutLMv2Processor.from_pretrained("microsoft/layoutlmv2-base-uncased")
+# ======== MODELOS (carregados só no primeiro uso) =========
+LAYOUT_PROCESSOR = "layoutlmv2_processor"
+SEMANTIC_MODEL = "semantic_grouping"
 
-# Sentence-BERT (MiniLM para agrupamento semântico)
-semantic_model = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+
+def _load_layout_processor():
+    from transformers import LayoutLMv2Processor
+    return LayoutLMv2Processor.from_pretrained(LAYOUT_MODEL_NAME)
+
+
+def _load_semantic_model():
+    # Sentence-BERT (MiniLM para agrupamento semântico)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(SEMANTIC_MODEL_NAME)
+
+
+register_model(LAYOUT_PROCESSOR, _load_layout_processor)
+register_model(SEMANTIC_MODEL, _load_semantic_model)
+
+
+def get_layout_processor():
+    return get_model(LAYOUT_PROCESSOR)
+
+
+def get_semantic_model():
+    return get_model(SEMANTIC_MODEL)
 
 
 # ======== ETAPA 1: OCR + Estrutura Visual ========
@@ -26,6 +59,7 @@ semantic_model = SentenceTransformer("sentence-transformers/paraphrase-multiling
 def image_to_layout_chunks(image: Image.Image, page_number: int = 1) -> List[LCDocument]:
     """
     Aplica OCR com bounding boxes e LayoutLMv2 para estruturar o conteúdo.
+    A codificação LayoutLMv2 só roda com OCR_LAYOUTLM_ENCODING ativo.
     """
     width, height = image.size
     ocr_data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, lang="por")
@@ -47,7 +81,8 @@ def image_to_layout_chunks(image: Image.Image, page_number: int = 1) -> List[LCD
     if not words:
         return []
 
-    encoding = processor(image, words=words, boxes=boxes, return_tensors="pt", truncation=True, padding="max_length")
+    if OCR_LAYOUTLM_ENCODING:
+        get_layout_processor()(image, words=words, boxes=boxes, return_tensors="pt", truncation=True, padding="max_length")
 
     # Agrupamento por linhas
     lines = {}
@@ -109,47 +144,133 @@ def adaptive_similarity_threshold(chunk_text: str) -> float:
     return 0.80 if len(chunk_text) < 300 else 0.70
 
 @traceable(name="🔗 Agrupamento Semântico")
-def group_similar_chunks(chunks: List[LCDocument]) -> List[LCDocument]:
+def group_similar_chunks(chunks: List[LCDocument], batch_size: int = SEMANTIC_BATCH_SIZE) -> List[LCDocument]:
     """
     Agrupa chunks juridicamente próximos com base em similaridade semântica adaptativa.
+    Todos os chunks são codificados de uma vez (embeddings normalizados), e o
+    agrupamento guloso percorre as similaridades já calculadas.
     """
     grouped_chunks = []
     if not chunks:
         return grouped_chunks
 
-    current_text = chunks[0].page_content
+    texts = [chunk.page_content for chunk in chunks]
+    embeddings = get_semantic_model().encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+    # Similaridade cosseno entre vizinhos em uma única operação
+    adjacent = np.einsum("ij,ij->i", embeddings[:-1], embeddings[1:])
+
+    anchor = 0  # o grupo é comparado com o seu primeiro chunk, como no critério original
+    current_text = texts[0]
     current_meta = chunks[0].metadata
-    current_embedding = semantic_model.encode(current_text, convert_to_tensor=True)
 
     for i in range(1, len(chunks)):
-        next_text = chunks[i].page_content
-        next_embedding = semantic_model.encode(next_text, convert_to_tensor=True)
-        similarity = util.cos_sim(current_embedding, next_embedding).item()
+        if anchor == i - 1:
+            similarity = float(adjacent[i - 1])
+        else:
+            similarity = float(embeddings[anchor] @ embeddings[i])
 
         if similarity >= adaptive_similarity_threshold(current_text):
-            current_text += "\n" + next_text
+            current_text += "\n" + texts[i]
         else:
             grouped_chunks.append(LCDocument(page_content=current_text.strip(), metadata=current_meta))
-            current_text = next_text
+            current_text = texts[i]
             current_meta = chunks[i].metadata
-            current_embedding = next_embedding
+            anchor = i
 
     grouped_chunks.append(LCDocument(page_content=current_text.strip(), metadata=current_meta))
     return grouped_chunks
 
 
+# ======== Rasterização + OCR em janelas de páginas ========
+PageWindow = Tuple[int, int]
+
+
+def _init_ocr_worker() -> None:
+    # Um Tesseract por processo: evita que o OpenMP dispute os núcleos
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+
+def _page_windows(total_pages: int, window: int) -> List[PageWindow]:
+    window = max(window, 1)
+    return [(first, min(first + window - 1, total_pages)) for first in range(1, total_pages + 1, window)]
+
+
+def _ocr_page_window(file_path: str, first_page: int, last_page: int, dpi: int) -> List[Tuple[int, List[LCDocument]]]:
+    """Rasteriza apenas as páginas da janela e aplica OCR + regex em cada uma."""
+    pages = convert_from_path(file_path, dpi=dpi, first_page=first_page, last_page=last_page)
+    results = []
+    for offset, page in enumerate(pages):
+        page_number = first_page + offset
+        results.append((page_number, image_to_layout_chunks(page, page_number=page_number)))
+    return results
+
+
+def _ocr_windows_parallel(
+    file_path: str,
+    windows: Iterable[PageWindow],
+    dpi: int,
+    workers: int,
+    max_pending: int,
+    on_page: Optional[Callable[[int], None]] = None,
+) -> Dict[int, List[LCDocument]]:
+    """Distribui as janelas num pool de processos com no máximo `max_pending` em voo."""
+    by_page: Dict[int, List[LCDocument]] = {}
+    remaining = iter(windows)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_ocr_worker) as pool:
+        pending = {
+            pool.submit(_ocr_page_window, file_path, first, last, dpi)
+            for first, last in islice(remaining, max(max_pending, 1))
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                by_page.update(future.result())
+                if on_page:
+                    on_page(len(by_page))
+            for first, last in islice(remaining, len(done)):
+                pending.add(pool.submit(_ocr_page_window, file_path, first, last, dpi))
+    return by_page
+
+
 # ======== Função Principal ========
 @traceable(name="🧠 OCR Fallback (LayoutLM)")
-def layout_ocr_from_pdf(file_path: str) -> List[LCDocument]:
+def layout_ocr_from_pdf(
+    file_path: str,
+    workers: int = OCR_WORKERS,
+    page_window: int = OCR_PAGE_WINDOW,
+    dpi: int = OCR_DPI,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> List[LCDocument]:
     """
     Converte um PDF imagem em chunks estruturados com OCR + LayoutLM + Regex + Agrupamento semântico.
+    As páginas são rasterizadas em janelas de `page_window` páginas (nunca o PDF inteiro)
+    e o OCR roda em `workers` processos; o resultado volta na ordem das páginas.
+    `on_progress(paginas_prontas, total)` é chamado a cada janela concluída.
     """
-    pages = convert_from_path(file_path, dpi=300)
-    all_chunks = []
+    total_pages = pdfinfo_from_path(file_path)["Pages"]
+    windows = _page_windows(total_pages, page_window)
+    on_page = (lambda done: on_progress(done, total_pages)) if on_progress else None
+
+    if workers > 1 and len(windows) > 1:
+        # Limite de janelas em voo proporcional aos workers desta chamada
+        max_pending = workers * OCR_PENDING_PER_WORKER
+        by_page = _ocr_windows_parallel(file_path, windows, dpi, workers, max_pending, on_page)
+    else:
+        by_page = {}
+        for first, last in windows:
+            by_page.update(_ocr_page_window(file_path, first, last, dpi))
+            if on_page:
+                on_page(len(by_page))
 
-    for i, page in enumerate(pages):
-        page_chunks = image_to_layout_chunks(page, page_number=i + 1)
-        all_chunks.extend(page_chunks)
+    all_chunks = []
+    for page_number in sorted(by_page):
+        all_chunks.extend(by_page[page_number])
 
     # Final: agrupar semanticamente
     grouped_chunks = group_similar_chunks(all_chunks)
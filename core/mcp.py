@@ -1,18 +1,118 @@
 # core/mcp.py
 """
 MCP Minimalista - Memory, Controller, Planner em um arquivo
+
+A memória fica num backend plugável (core/mcp_store.py), por sessão:
+`mcp_instance.session(id)` devolve uma visão da sessão sobre o mesmo backend.
+
+Cada turno guarda o embedding da pergunta (float16 em base64). O contexto
+da geração traz o turno mais recente e os turnos antigos mais parecidos com
+a pergunta atual, dentro de um orçamento de tokens. A busca vetorial usa só
+a pergunta: `prepare_inputs` separa a consulta (`input`) do texto enviado
+ao LLM (`generation_input`).
 """
-from typing import Dict, List, Optional, Any
-from collections import deque
-import json
+from typing import Callable, Dict, List, Optional, Any, Sequence
 from datetime import datetime
+import base64
+import re
+
+import numpy as np
+
+from .config import (
+    MAX_FAN_OUT_QUERIES,
+    MCP_BACKEND,
+    MCP_CONTEXT_MIN_SCORE,
+    MCP_CONTEXT_TOKEN_BUDGET,
+    MCP_CONTEXT_TOP_K,
+    MCP_MAX_SESSIONS,
+    MCP_SESSION_IDLE_TTL,
+    MCP_MEMORY_PATH,
+    MCP_MEMORY_SIZE,
+    STRATEGY_PROFILES,
+)
+from .mcp_store import InMemoryStore, create_store
+
+DEFAULT_SESSION = "global"
+
+Embedder = Callable[[str], Sequence[float]]
+TokenCounter = Callable[[List[str]], List[int]]
+
+def _pack_vector(vector: Sequence[float]) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float16).tobytes()).decode("ascii")
+
+def _unpack_vector(encoded: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(encoded), dtype=np.float16).astype(np.float32)
+
+def _approx_tokens(texts: List[str]) -> List[int]:
+    """Estimativa sem tokenizer (~4 caracteres por token)."""
+    return [len(text) // 4 + 1 for text in texts]
+
+def _embed_query(text: str) -> Sequence[float]:
+    from .resources import get_embeddings  # modelo só quando o MCP é usado
+    return get_embeddings().embed_query(text)
+
+def _count_tokens(texts: List[str]) -> List[int]:
+    from .utils import count_tokens_batch
+    return count_tokens_batch(texts)
+
+# Só marcadores explícitos de comparação separam os lados: "e", "com" e
+# vírgulas soltas aparecem em perguntas comuns e gerariam buscas inúteis
+_VERSUS = re.compile(r"\s+(?:versus|vs\.?)\s+", re.IGNORECASE)
+_DIFFERENCE_BETWEEN = re.compile(r"\bdiferenças?\s+entre\s+(.+?)\s+e\s+(.+)$", re.IGNORECASE)
+_COMPARE_WITH = re.compile(r"\bcompar(?:ar|e)\s+(.+?)\s+com\s+(.+)$", re.IGNORECASE)
+_COMPARE_LEAD = re.compile(r"^.*?\bcompar(?:ar|e)\s+", re.IGNORECASE)
+
+_COMPARISON_WORDS = ("comparar", "versus", "diferença")
+
+def is_comparison(question: str) -> bool:
+    q_lower = question.lower()
+    return any(word in q_lower for word in _COMPARISON_WORDS)
+
+def comparison_queries(question: str, limit: int = MAX_FAN_OUT_QUERIES) -> List[str]:
+    """
+    Lados de uma comparação explícita: "A versus/vs B", "diferença entre A e B"
+    ou "comparar A com B" (→ uma busca por lado). Sem esses marcadores, nada.
+    """
+    body = question.strip().rstrip("?.!")
+    if _VERSUS.search(body):
+        parts = _VERSUS.split(_COMPARE_LEAD.sub("", body, count=1))
+    else:
+        match = _DIFFERENCE_BETWEEN.search(body) or _COMPARE_WITH.search(body)
+        parts = list(match.groups()) if match else []
+    parts = [p.strip(" ,;") for p in parts if p.strip(" ,;")]
+    return parts[:limit] if len(parts) > 1 else []
 
 class MCPSystem:
     """Sistema MCP completo e simples"""
     
-    def __init__(self, memory_size: int = 50):  # Aumentado de 20 para 50
-        # Memory: guarda contexto
-        self.memory = deque(maxlen=memory_size)
+    def __init__(self, memory_size: int = 50, store: Any = None, session_id: str = DEFAULT_SESSION,
+                 embedder: Optional[Embedder] = None, token_counter: Optional[TokenCounter] = None):
+        # Memory: guarda contexto (sem backend → deque própria em memória)
+        self.store = store if store is not None else InMemoryStore(memory_size, max_sessions=1)
+        self.session_id = session_id
+        # Sem embedder, o contexto é só o histórico mais recente
+        self.embedder = embedder
+        self.token_counter = token_counter or _approx_tokens
+
+    @property
+    def memory(self):
+        """Turnos guardados da sessão (a deque, no backend em memória)."""
+        return self.store.view(self.session_id)
+
+    def session(self, session_id: str) -> "MCPSystem":
+        """Visão de outra sessão sobre o mesmo backend (não copia nada)."""
+        return MCPSystem(
+            store=self.store, session_id=session_id,
+            embedder=self.embedder, token_counter=self.token_counter,
+        )
+
+    def size(self) -> int:
+        """Quantos turnos a sessão guarda."""
+        return self.store.count(self.session_id)
+
+    def forget(self) -> None:
+        """Apaga a memória da sessão."""
+        self.store.drop(self.session_id)
         
     def plan(self, question: str) -> Dict[str, Any]:
         """Planner: analisa a pergunta e cria estratégia"""
@@ -25,7 +125,7 @@ class MCPSystem:
         }
         
         # Estratégias baseadas no tipo de pergunta
-        if any(word in q_lower for word in ["comparar", "versus", "diferença"]):
+        if is_comparison(question):
             plan["strategy"] = "comparison"
             plan["enrichments"].append("buscar_multiplos_docs")
             
@@ -36,6 +136,11 @@ class MCPSystem:
         elif any(word in q_lower for word in ["cláusula", "artigo", "seção"]):
             plan["strategy"] = "extraction"
             plan["enrichments"].append("buscar_trecho_especifico")
+
+        # Parâmetros de execução da estratégia (aplicados por requisição na cadeia)
+        plan["retrieval"] = dict(STRATEGY_PROFILES.get(plan["strategy"], {}))
+        if plan["retrieval"].get("fan_out"):
+            plan["queries"] = comparison_queries(question)
             
         return plan
     
@@ -47,31 +152,64 @@ class MCPSystem:
         else:
             answer = str(answer)[:500]  # Limita tamanho
             
-        self.memory.append({
+        turn = {
             "question": question[:200],  # Limita tamanho
             "answer": answer,
             "metadata": metadata or {},
             "timestamp": datetime.now().isoformat()
-        })
+        }
+        if self.embedder is not None:
+            # Mesma pergunta que acabou de ser buscada: embedding vem do cache de consultas
+            turn["embedding"] = _pack_vector(self.embedder(question))
+        self.store.append(self.session_id, turn)
     
-    def get_context(self, n: int = 3) -> str:
-        """Memory: recupera contexto relevante"""
-        if not self.memory:
-            return ""
-        
-        # Pega últimas N interações
-        recent = list(self.memory)[-n:]
-        
-        context_parts = []
-        for item in recent:
-            context_parts.append(f"P: {item['question'][:100]}...")
-            context_parts.append(f"R: {item['answer'][:100]}...")
-        
-        return "\n".join(context_parts)
+    def relevant_turns(self, question: Optional[str] = None, n: int = MCP_CONTEXT_TOP_K,
+                       budget: int = MCP_CONTEXT_TOKEN_BUDGET) -> List[Dict]:
+        """
+        Memory: o turno mais recente mais os turnos antigos mais parecidos com
+        a pergunta (cosseno ≥ MCP_CONTEXT_MIN_SCORE), até `n` turnos e `budget`
+        tokens, em ordem cronológica. Sem pergunta ou sem embedder: os `n` mais recentes.
+        """
+        ranked = self.embedder is not None and bool(question)
+        turns = self.store.recent(self.session_id, self.store.memory_size if ranked else n)
+        if not turns:
+            return []
+        # Posições em `turns`, em ordem de prioridade
+        order = list(range(len(turns) - 1, -1, -1))
+        if ranked:
+            order = [len(turns) - 1]
+            indexed = [i for i, turn in enumerate(turns[:-1]) if "embedding" in turn]
+            if indexed:
+                # Índice vetorial da sessão: poucas dezenas de vetores, busca exata
+                matrix = np.stack([_unpack_vector(turns[i]["embedding"]) for i in indexed])
+                query = np.asarray(self.embedder(question), dtype=np.float32)
+                scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-9)
+                for pos in np.argsort(-scores):
+                    if scores[pos] < MCP_CONTEXT_MIN_SCORE:
+                        break
+                    order.append(indexed[pos])
+        order = order[:n]
+
+        # Orçamento: pula turnos que não cabem (os menores seguintes ainda podem entrar)
+        costs = self.token_counter([self._format_turn(turns[i]) for i in order])
+        kept, used = [], 0
+        for i, cost in zip(order, costs):
+            if used + cost <= budget:
+                kept.append(i)
+                used += cost
+        return [turns[i] for i in sorted(kept)]
+
+    @staticmethod
+    def _format_turn(item: Dict) -> str:
+        return f"P: {item['question']}\nR: {item['answer']}"
+
+    def get_context(self, n: int = MCP_CONTEXT_TOP_K, question: Optional[str] = None) -> str:
+        """Memory: recupera contexto relevante (só os turnos escolhidos, sem copiar a memória)"""
+        return "\n".join(self._format_turn(item) for item in self.relevant_turns(question, n))
     
     def enrich_question(self, question: str) -> str:
-        """Controller: enriquece pergunta com contexto"""
-        context = self.get_context()
+        """Controller: enriquece pergunta com contexto (texto para a geração)"""
+        context = self.get_context(question=question)
         
         if context:
             return f"""Contexto anterior:
@@ -80,10 +218,14 @@ class MCPSystem:
 Pergunta atual: {question}"""
         
         return question
+
+    def prepare_inputs(self, question: str) -> Dict[str, str]:
+        """Controller: busca só pela pergunta; o histórico vai apenas para o LLM."""
+        return {"input": question, "generation_input": self.enrich_question(question)}
     
     def get_serializable_memory(self, last_n: int = 5) -> List[Dict]:
         """Retorna memória em formato serializável para JSON"""
-        recent = list(self.memory)[-last_n:]
+        recent = self.store.recent(self.session_id, last_n)
         
         # Garantir que tudo é serializável
         safe_memory = []
@@ -101,5 +243,10 @@ Pergunta atual: {question}"""
             
         return safe_memory
 
-# Instância global (singleton simples)
-mcp_instance = MCPSystem(memory_size=50)  # Aumentado para 50
\ No newline at end of file
+# Instância global (singleton simples); sessões via mcp_instance.session(id)
+mcp_instance = MCPSystem(
+    memory_size=MCP_MEMORY_SIZE,
+    store=create_store(MCP_BACKEND, MCP_MEMORY_SIZE, MCP_MAX_SESSIONS, MCP_MEMORY_PATH, MCP_SESSION_IDLE_TTL),
+    embedder=_embed_query,
+    token_counter=_count_tokens,
+)
@@ -0,0 +1,257 @@
+# core/mcp_store.py
+"""
+Backends de memória do MCP, por sessão.
+
+- InMemoryStore: uma deque limitada por sessão (processo único). Sessões sem
+  uso há mais de `idle_ttl` são despejadas, e acima de `max_sessions` sai a
+  menos usada (LRU).
+- SQLiteStore: tabela compartilhada entre workers do uvicorn (WAL). As
+  leituras pegam só os N turnos mais recentes pelo índice (sessão, id).
+  Cada append insere o turno e apaga (DELETE) os que passam do limite da
+  sessão. Periodicamente, as
+  sessões ociosas (e as que passam de `max_sessions`) são despejadas pela
+  hora da última escrita.
+
+Os dois expõem append / recent / count / drop. `recent` devolve só os
+últimos N turnos, sem copiar o histórico inteiro.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+Turn = Dict[str, Any]
+
+
+class InMemoryStore:
+    """
+    Deques por sessão; sessões ociosas há mais de `idle_ttl` saem, e acima de
+    `max_sessions` sai a menos usada.
+    """
+
+    def __init__(self, memory_size: int = 50, max_sessions: int = 1000, idle_ttl: float = 7 * 24 * 3600):
+        self.memory_size = memory_size
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        # Ordem de uso (LRU) e hora do último uso de cada sessão
+        self._sessions: "OrderedDict[str, deque]" = OrderedDict()
+        self._active: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def view(self, session_id: str) -> deque:
+        """A deque da sessão (criada se preciso)."""
+        with self._lock:
+            return self._touch(session_id)
+
+    def _touch(self, session_id: str) -> deque:
+        now = time.time()
+        self._evict(now)
+        turns = self._sessions.get(session_id)
+        if turns is None:
+            turns = self._sessions[session_id] = deque(maxlen=self.memory_size)
+            while len(self._sessions) > self.max_sessions:
+                self._pop_oldest()
+        else:
+            self._sessions.move_to_end(session_id)
+        self._active[session_id] = now
+        return turns
+
+    def _pop_oldest(self) -> None:
+        session_id, _ = self._sessions.popitem(last=False)
+        self._active.pop(session_id, None)
+        self.evictions += 1
+
+    def _evict(self, now: float) -> None:
+        # A ordem LRU é a ordem de uso: as ociosas estão no começo
+        cutoff = now - self.idle_ttl
+        while self._sessions and self._active.get(next(iter(self._sessions)), 0.0) < cutoff:
+            self._pop_oldest()
+
+    def evict_idle(self, now: Optional[float] = None) -> None:
+        """Despeja já as sessões ociosas (o uso de qualquer sessão também faz isso)."""
+        with self._lock:
+            self._evict(time.time() if now is None else now)
+
+    def append(self, session_id: str, turn: Turn) -> None:
+        with self._lock:
+            self._touch(session_id).append(turn)
+
+    def recent(self, session_id: str, n: int) -> List[Turn]:
+        with self._lock:
+            turns = self._sessions.get(session_id)
+            if not turns or n <= 0:
+                return []
+            self._sessions.move_to_end(session_id)
+            self._active[session_id] = time.time()
+            # Só os n últimos, do mais antigo para o mais novo
+            return list(islice(reversed(turns), n))[::-1]
+
+    def count(self, session_id: str) -> int:
+        with self._lock:
+            return len(self._sessions.get(session_id, ()))
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._active.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": "memory", "sessions": len(self._sessions), "evictions": self.evictions}
+
+
+class SQLiteStore:
+    """Turnos em SQLite, compartilhados entre processos, com limite por sessão."""
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        memory_size: int = 50,
+        max_sessions: int = 1000,
+        idle_ttl: float = 7 * 24 * 3600,
+        evict_interval: float = 300.0,
+    ):
+        self.path = Path(path)
+        self.memory_size = memory_size
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.evict_interval = evict_interval
+        self.evictions = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._evicted_at = 0.0
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS mcp_turns (
+                id       INTEGER PRIMARY KEY AUTOINCREMENT,
+                session  TEXT NOT NULL,
+                turn     TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS mcp_turns_session ON mcp_turns (session, id)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS mcp_sessions (
+                session      TEXT PRIMARY KEY,
+                last_active  REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS mcp_sessions_active ON mcp_sessions (last_active)")
+        # Bancos anteriores à tabela de sessões: contam como ativas agora
+        self._conn.execute(
+            "INSERT OR IGNORE INTO mcp_sessions (session, last_active) SELECT session, ? FROM mcp_turns GROUP BY session",
+            (time.time(),),
+        )
+        self._conn.commit()
+
+    def view(self, session_id: str) -> List[Turn]:
+        return self.recent(session_id, self.memory_size)
+
+    def append(self, session_id: str, turn: Turn) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO mcp_turns (session, turn) VALUES (?, ?)",
+                (session_id, json.dumps(turn, ensure_ascii=False, default=str)),
+            )
+            self._conn.execute(
+                """
+                INSERT INTO mcp_sessions (session, last_active) VALUES (?, ?)
+                ON CONFLICT(session) DO UPDATE SET last_active = excluded.last_active
+                """,
+                (session_id, now),
+            )
+            self._prune(session_id)
+            if now - self._evicted_at >= self.evict_interval:
+                self._evict(now)
+            self._conn.commit()
+
+    def _prune(self, session_id: str) -> None:
+        # Mantém só os `memory_size` turnos mais recentes da sessão (pelo índice)
+        self._conn.execute(
+            """
+            DELETE FROM mcp_turns WHERE session = ? AND id <= (
+                SELECT id FROM mcp_turns WHERE session = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+            )
+            """,
+            (session_id, session_id, self.memory_size),
+        )
+
+    def _evict(self, now: float) -> None:
+        idle = self._conn.execute(
+            "DELETE FROM mcp_sessions WHERE last_active < ?", (now - self.idle_ttl,)
+        ).rowcount
+        over = self._conn.execute(
+            """
+            DELETE FROM mcp_sessions WHERE session NOT IN (
+                SELECT session FROM mcp_sessions ORDER BY last_active DESC LIMIT ?
+            )
+            """,
+            (self.max_sessions,),
+        ).rowcount
+        if idle or over:
+            self._conn.execute("DELETE FROM mcp_turns WHERE session NOT IN (SELECT session FROM mcp_sessions)")
+            self.evictions += idle + over
+        self._evicted_at = now
+
+    def evict_idle(self, now: Optional[float] = None) -> None:
+        """Despeja já as sessões ociosas (o append faz isso a cada `evict_interval`)."""
+        with self._lock:
+            self._evict(time.time() if now is None else now)
+            self._conn.commit()
+
+    def recent(self, session_id: str, n: int) -> List[Turn]:
+        n = min(n, self.memory_size)
+        if n <= 0:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT turn FROM mcp_turns WHERE session = ? ORDER BY id DESC LIMIT ?",
+                (session_id, n),
+            ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def count(self, session_id: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM mcp_turns WHERE session = ?", (session_id,)
+            ).fetchone()[0]
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM mcp_turns WHERE session = ?", (session_id,))
+            self._conn.execute("DELETE FROM mcp_sessions WHERE session = ?", (session_id,))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions = self._conn.execute("SELECT COUNT(*) FROM mcp_sessions").fetchone()[0]
+        return {"backend": "sqlite", "sessions": sessions, "evictions": self.evictions, "path": str(self.path)}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_store(
+    backend: str,
+    memory_size: int,
+    max_sessions: int,
+    path: Union[str, Path],
+    idle_ttl: float = 7 * 24 * 3600,
+):
+    """Backend configurado em MCP_BACKEND ("memory" ou "sqlite")."""
+    if backend == "memory":
+        return InMemoryStore(memory_size, max_sessions, idle_ttl=idle_ttl)
+    if backend == "sqlite":
+        return SQLiteStore(path, memory_size, max_sessions=max_sessions, idle_ttl=idle_ttl)
+    raise ValueError(f"MCP_BACKEND desconhecido: {backend!r}")
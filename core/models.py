@@ -0,0 +1,70 @@
+# core/models.py
+"""
+Registro preguiçoso de modelos pesados (um por processo).
+
+Cada modelo é registrado com uma função de carga e só é instanciado no
+primeiro `get_model`. `preload_models` permite aquecer o processo
+explicitamente (ex.: no startup da API).
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+_LOADERS: Dict[str, Callable[[], Any]] = {}
+_MODELS: Dict[str, Any] = {}
+_LOAD_TIMES: Dict[str, float] = {}
+_KEY_LOCKS: Dict[str, threading.Lock] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def register_model(name: str, loader: Callable[[], Any]) -> None:
+    """Registra (ou substitui) a função de carga de um modelo."""
+    with _REGISTRY_LOCK:
+        _LOADERS[name] = loader
+        _KEY_LOCKS.setdefault(name, threading.Lock())
+        _MODELS.pop(name, None)
+        _LOAD_TIMES.pop(name, None)
+
+
+def get_model(name: str) -> Any:
+    """Retorna o modelo, carregando-o na primeira chamada."""
+    model = _MODELS.get(name)
+    if model is not None:
+        return model
+    try:
+        loader, key_lock = _LOADERS[name], _KEY_LOCKS[name]
+    except KeyError:
+        raise KeyError(f"Modelo '{name}' não registrado.") from None
+
+    # Lock por modelo: carregar um não bloqueia o acesso aos demais
+    with key_lock:
+        model = _MODELS.get(name)
+        if model is None:
+            start = time.perf_counter()
+            model = loader()
+            _LOAD_TIMES[name] = time.perf_counter() - start
+            _MODELS[name] = model
+            logger.info("📦 Modelo '%s' carregado em %.2fs.", name, _LOAD_TIMES[name])
+    return model
+
+
+def preload_models(names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """Carrega os modelos indicados (ou todos os registrados) e devolve os tempos de carga."""
+    for name in list(names if names is not None else _LOADERS):
+        get_model(name)
+    return loaded_models()
+
+
+def loaded_models() -> Dict[str, float]:
+    """Modelos já carregados neste processo → segundos gastos na carga."""
+    return dict(_LOAD_TIMES)
+
+
+def unload_models() -> None:
+    """Descarta as instâncias carregadas (os registros permanecem)."""
+    with _REGISTRY_LOCK:
+        _MODELS.clear()
+        _LOAD_TIMES.clear()
@@ -13,17 +13,38 @@ from .utils import (
 )
 from .config import (
     EMBEDDING_MODEL_NAME,
-    LLM_MODEL_NAME,
     TOKEN_LIMIT,
     PINECONE_INDEX_NAME,
     EMBEDDING_TOKEN_LIMIT,
     PINECONE_BATCH_SIZE,
-    PINECONE_API_KEY,
+    CHUNKS_FOLDER,
     USE_LANGGRAPH,
     USE_RERANKING,
-    ANTHROPIC_API_KEY,
+    USE_HYBRID_RETRIEVAL,
+    HYBRID_CANDIDATES,
+    ANSWER_CACHE_ENABLED,
+    RETRIEVAL_CACHE_ENABLED,
+    CONTEXT_PACKING_ENABLED,
 )
 from .setup_langsmith import tracing_enabled
+from .embedding_cache import chunk_hash
+from .resources import get_embeddings, get_llm
+from .vectorstores import ALL_NAMESPACES, as_vectorstore, doc_namespace, open_vector_index
+from .bm25 import BM25Index, HybridRetriever
+from .answer_cache import get_answer_cache
+from .retrieval_cache import get_retrieval_cache
+from .context_packer import PackedRetriever, pack_context
+from .strategies import (
+    aretrieve_planned,
+    configure_retriever,
+    get_strategy_stats,
+    packing_kwargs,
+    plan_strategy,
+    retrieval_params,
+    retrieve_planned,
+)
+from .jobs import ProgressCallback, no_progress, stage_slot
+from .ingest_pipeline import embed_and_upsert
 
 # ────────── Streamlit opcional (dummy se não instalado) ──────────
 try:
@@ -35,14 +56,15 @@ except ImportError:                         # backend não tem Streamlit
     st = _Dummy()
 
 # ───────────── Imports externos ─────────────
+import asyncio
+import json
 import logging
-from typing import List, Dict, Any
-from langchain_huggingface import HuggingFaceEmbeddings
+import os
+import time
+from typing import List, Dict, Any, AsyncIterator, Iterator
+from langchain_core.embeddings import Embeddings
 from langchain_core.vectorstores import VectorStore
-from langchain_community.vectorstores import Pinecone as PineconeLang
-from pinecone import Pinecone
 from langchain_core.documents import Document as LCDocument
-from langchain_anthropic import ChatAnthropic
 from langchain_core.prompts import ChatPromptTemplate
 from langchain.chains.combine_documents.stuff import create_stuff_documents_chain
 from langchain.chains.retrieval import create_retrieval_chain
@@ -65,49 +87,80 @@ def load_documents_with_docling(
     return loader.load()
 
 # ════════════════════════════════════════════════════════════════
-@traceable(name="🧊 Create/Load Vectorstore (Pinecone)")
+@traceable(name="🧊 Create/Load Vectorstore")
 @log_time
 def create_or_load_vectorstore(
     file_path: str,
     documents: List[LCDocument],
-    embeddings: HuggingFaceEmbeddings
+    embeddings: Embeddings,
+    progress: ProgressCallback = no_progress,
+    namespace: str = "default",
+    throughput: Dict[str, float] | None = None,
 ) -> VectorStore | None:
+    """
+    Envia os chunks ao `namespace` e devolve o VectorStore restrito a ele.
+    `throughput`, se informado, recebe a vazão das etapas de embedding e upsert.
+    """
     try:
-        pc = Pinecone(api_key=PINECONE_API_KEY)
-        index_name = PINECONE_INDEX_NAME
-
-        if index_name not in pc.list_indexes().names():
-            logger.error("Index '%s' não existe no Pinecone.", index_name)
+        # Backend conforme VECTOR_STORE_BACKEND (handle compartilhado; o
+        # from_documents criaria um cliente novo)
+        index = open_vector_index(PINECONE_INDEX_NAME)
+        if index is None:
             return None
 
         for doc in documents:
             doc.metadata = sanitize_metadata(doc.metadata)
 
-        return PineconeLang.from_documents(
-            documents=documents,
-            embedding=embeddings,
-            index_name=index_name,
-            namespace="default",
+        # Embedding do próximo lote enquanto os anteriores são enviados
+        report = embed_and_upsert(
+            documents,
+            embeddings.embed_documents,
+            lambda batch, vectors: _upsert_batch(index, batch, vectors, namespace=namespace),
             batch_size=PINECONE_BATCH_SIZE,
+            progress=progress,
         )
+        if throughput is not None:
+            throughput.update(report)
+
+        return as_vectorstore(index, embeddings, namespace=namespace)
 
     except Exception as exc:  # noqa: BLE001
-        logger.exception("Erro ao conectar ao Pinecone: %s", exc)
+        logger.exception("Erro ao abrir o vector store: %s", exc)
         return None
 
-# ════════════════════════════════════════════════════════════════
-def create_rag_chain(vectorstore: VectorStore):
-    retriever = vectorstore.as_retriever(
-        search_type="mmr",
-        search_kwargs={"k": 20, "fetch_k": 100, "lambda_mult": 0.8},
+def _upsert_batch(index, documents: List[LCDocument], vectors: List[List[float]], namespace: str) -> None:
+    """Envia um lote ao índice (Pinecone ou local) com o texto em metadata['text']."""
+    # IDs derivados do conteúdo: reingestão sobrescreve em vez de duplicar
+    index.upsert(
+        vectors=[
+            (chunk_hash(doc.page_content), vector, {**doc.metadata, "text": doc.page_content})
+            for doc, vector in zip(documents, vectors)
+        ],
+        namespace=namespace,
     )
 
-    llm = ChatAnthropic(
-        temperature=0.1,
-        model_name=LLM_MODEL_NAME,
-        api_key=ANTHROPIC_API_KEY,
-        max_tokens=1000,
-    )
+# ════════════════════════════════════════════════════════════════
+def create_rag_chain(
+    vectorstore: VectorStore,
+    documents: List[LCDocument] | None = None,
+    doc_id: str | None = None,
+):
+    if USE_HYBRID_RETRIEVAL and documents:
+        # BM25 sobre os mesmos chunks, fundido por RRF → k final menor
+        retriever = HybridRetriever(
+            dense=vectorstore.as_retriever(
+                search_type="mmr",
+                search_kwargs={"k": HYBRID_CANDIDATES, "fetch_k": 100, "lambda_mult": 0.8},
+            ),
+            index=_build_bm25(documents),
+        )
+    else:
+        retriever = vectorstore.as_retriever(
+            search_type="mmr",
+            search_kwargs={"k": 20, "fetch_k": 100, "lambda_mult": 0.8},
+        )
+
+    llm = get_llm()  # cliente compartilhado por todas as cadeias
 
     template = """
 Você é um assistente jurídico especializado. Analise cuidadosamente o seguinte contexto extraído de documentos jurídicos e responda de forma objetiva, sem adicionar informações externas.
@@ -124,67 +177,267 @@ Resposta:
 """
     prompt = ChatPromptTemplate.from_template(template)
     document_chain = create_stuff_documents_chain(llm=llm, prompt=prompt)
-    retrieval_chain = create_retrieval_chain(retriever, document_chain)
+    packer = pack_context if CONTEXT_PACKING_ENABLED else None
+    retrieval_chain = create_retrieval_chain(
+        PackedRetriever(retriever=retriever) if packer else retriever,
+        document_chain,
+    )
 
     class RagChainWrapper:
         def __init__(self, chain):  # noqa: D401
             self._chain = chain
 
+        def _run(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+            if inputs.get("plan") or inputs.get("generation_input") or inputs.get("documents") is not None:
+                # Parâmetros por requisição: mesmo caminho do streaming, consumido inteiro
+                return _collect(self.stream(inputs))
+            return _invoke_core(self._chain, inputs, template)
+
         # ────── Método único (traceable se LangSmith ativo) ──────
         if tracing_enabled:
             @traceable(name="LegalMentor-RAG")
             def invoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:  # noqa: D401
-                return _invoke_core(self._chain, inputs, template)
+                return self._run(inputs)
         else:
             def invoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
-                return _invoke_core(self._chain, inputs, template)
+                return self._run(inputs)
+
+        async def _arun(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+            if inputs.get("plan") or inputs.get("generation_input") or inputs.get("documents") is not None:
+                return await _acollect(self.astream(inputs))
+            return await _ainvoke_core(self._chain, inputs, template)
+
+        if tracing_enabled:
+            @traceable(name="LegalMentor-RAG")
+            async def ainvoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:  # noqa: D401
+                return await self._arun(inputs)
+        else:
+            async def ainvoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+                return await self._arun(inputs)
+
+        def stream(self, inputs: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+            return _stream_core(self.retriever, self.document_chain, inputs, self.packer)
+
+        def astream(self, inputs: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+            return _astream_core(self.retriever, self.document_chain, inputs, self.packer)
 
         __call__ = invoke
 
     base_chain = RagChainWrapper(retrieval_chain)
     setattr(base_chain, "retriever", retriever)
+    setattr(base_chain, "document_chain", document_chain)
+    setattr(base_chain, "packer", packer)  # o LangGraph empacota depois do rerank
     return GraphChainWrapper(
         base_chain,
         use_langgraph=USE_LANGGRAPH,
-        use_rerank=USE_RERANKING
+        use_rerank=USE_RERANKING,
+        doc_id=doc_id,
+        answer_cache=get_answer_cache() if ANSWER_CACHE_ENABLED else None,
+        retrieval_cache=get_retrieval_cache() if RETRIEVAL_CACHE_ENABLED else None,
+        strategy_stats=get_strategy_stats(),
+    )
+
+@traceable(name="🔤 Build BM25 Index")
+def _build_bm25(documents: List[LCDocument]) -> BM25Index:
+    start = time.perf_counter()
+    index = BM25Index.build(documents)
+    logger.info(
+        "🔤 BM25: %d chunks, %d termos, %.1f KB em %.0f ms.",
+        len(index), len(index.vocabulary), index.nbytes / 1024, (time.perf_counter() - start) * 1000,
     )
+    return index
 
 # ----------------------------------------------------------------
 def _invoke_core(chain, inputs, template):
+    return _finish_output(chain.invoke(inputs), inputs, template)
+
+async def _ainvoke_core(chain, inputs, template):
+    output = await chain.ainvoke(inputs)
+    # Tokenizer fora do event loop
+    return await asyncio.to_thread(_finish_output, output, inputs, template)
+
+def _finish_output(output, inputs, template):
+    """Pós-processamento comum a invoke/ainvoke: relatório do empacotamento, log do prompt e formatação."""
+    # Tokens do contexto já medidos pelo empacotamento (PackedDocuments.report)
+    packing = getattr(output.get("context"), "report", None)
     approx = count_tokens(
         template.format(context="", input=inputs.get("input", "")),
         model_name=EMBEDDING_MODEL_NAME,
     )
-    logger.info("Prompt ~%d tokens (limite %d).", approx, TOKEN_LIMIT)
+    if packing is not None:
+        output.setdefault("metadata", {})["context_packing"] = packing
+        approx += packing["tokens_used"]
+        logger.info("Prompt ~%d tokens, %d de contexto (limite %d).", approx, packing["tokens_used"], TOKEN_LIMIT)
+    else:
+        logger.info("Prompt ~%d tokens sem o contexto (limite %d).", approx, TOKEN_LIMIT)
 
-    output = chain.invoke(inputs)
     if "answer" in output:
         output["answer"] = format_response(output["answer"])
     return output
 
+def _stream_core(retriever, document_chain, inputs, packer=None) -> Iterator[Dict[str, Any]]:
+    """Recupera o contexto e emite os tokens da resposta à medida que o LLM gera."""
+    start = time.time()
+    question = inputs.get("input", "")
+    plan = inputs.get("plan")
+    if plan:
+        retriever = configure_retriever(retriever, retrieval_params(plan))
+    docs = inputs.get("documents")  # já recuperados pelo chamador (ex.: consultas em lote)
+    if docs is None:
+        docs = retrieve_planned(retriever, question, plan)
+    metadata: Dict[str, Any] = {"retrieve_latency": time.time() - start}
+    if plan:
+        metadata["strategy"] = plan_strategy(plan)
+    if packer is not None:
+        docs, metadata["context_packing"] = packer(docs, **packing_kwargs(plan))
+    parts, ttft = [], None
+    # Histórico do MCP só na geração; a busca usou a pergunta pura
+    generation_input = inputs.get("generation_input") or question
+    for chunk in document_chain.stream({"input": generation_input, "context": docs}):
+        if not chunk:
+            continue
+        if ttft is None:
+            ttft = time.time() - start
+        parts.append(chunk)
+        yield {"type": "token", "content": chunk}
+    yield {
+        "type": "final",
+        "answer": format_response("".join(parts)),
+        "source_documents": docs,
+        "metadata": {**metadata, "ttft": ttft, "total_time": time.time() - start},
+    }
+
+async def _astream_core(retriever, document_chain, inputs, packer=None) -> AsyncIterator[Dict[str, Any]]:
+    """Versão assíncrona de `_stream_core`: busca e LLM sem prender threads."""
+    start = time.time()
+    question = inputs.get("input", "")
+    plan = inputs.get("plan")
+    if plan:
+        retriever = configure_retriever(retriever, retrieval_params(plan))
+    docs = inputs.get("documents")
+    if docs is None:
+        docs = await aretrieve_planned(retriever, question, plan)
+    metadata: Dict[str, Any] = {"retrieve_latency": time.time() - start}
+    if plan:
+        metadata["strategy"] = plan_strategy(plan)
+    if packer is not None:
+        docs, metadata["context_packing"] = await asyncio.to_thread(packer, docs, **packing_kwargs(plan))
+    parts, ttft = [], None
+    generation_input = inputs.get("generation_input") or question
+    async for chunk in document_chain.astream({"input": generation_input, "context": docs}):
+        if not chunk:
+            continue
+        if ttft is None:
+            ttft = time.time() - start
+        parts.append(chunk)
+        yield {"type": "token", "content": chunk}
+    yield {
+        "type": "final",
+        "answer": format_response("".join(parts)),
+        "source_documents": docs,
+        "metadata": {**metadata, "ttft": ttft, "total_time": time.time() - start},
+    }
+
+def _collect(events: Iterator[Dict[str, Any]]) -> Dict[str, Any]:
+    """Resultado do evento final de um stream (descarta os tokens)."""
+    for event in events:
+        if event["type"] == "final":
+            return {k: v for k, v in event.items() if k != "type"}
+    return {}
+
+async def _acollect(events: AsyncIterator[Dict[str, Any]]) -> Dict[str, Any]:
+    async for event in events:
+        if event["type"] == "final":
+            return {k: v for k, v in event.items() if k != "type"}
+    return {}
+
 # ════════════════════════════════════════════════════════════════
 @traceable(name="🧩 Pipeline: Processar Documento", metadata={"modelo": EMBEDDING_MODEL_NAME})
 @log_time
-def process_document(file_path: str | None = None):
+def process_document(
+    file_path: str | None = None,
+    progress: ProgressCallback = no_progress,
+    doc_id: str | None = None,
+    namespace: str | None = None,
+):
+    """
+    `progress(etapa, **contadores)` recebe o andamento (usado pelos jobs de ingestão).
+    `doc_id` identifica o documento nos caches (padrão: o próprio caminho) e
+    define o namespace da busca; sem documento ("default"), a busca cobre
+    todos os namespaces.
+    """
+    doc_id = doc_id or file_path or "default"
+    if namespace is None:
+        namespace = ALL_NAMESPACES if doc_id == "default" else doc_namespace(doc_id)
     # 1. Carrega & prefixa
     if file_path:
-        docs = load_documents_with_docling(file_path)
+        # Reingestão: respostas e recuperações antigas do documento deixam de valer
+        get_answer_cache().invalidate(doc_id)
+        get_retrieval_cache().invalidate(doc_id)
+        progress("loading")
+        with stage_slot("docling"):
+            docs = load_documents_with_docling(file_path)
         if not docs or all(not d.page_content.strip() for d in docs):
             logger.warning("Docling não encontrou texto; usando OCR fallback.")
-            docs = layout_ocr_from_pdf(file_path)
+            progress("ocr", pages_done=0)
+            with stage_slot("ocr"):
+                docs = layout_ocr_from_pdf(
+                    file_path,
+                    on_progress=lambda done, total: progress("ocr", pages_done=done, pages_total=total),
+                )
 
         logger.info("📚 Documento carregado com %d chunks.", len(docs))
+        progress("chunking")
         docs = prefix_documents_for_e5(docs)
         docs = adjust_chunks_to_token_limit(docs, EMBEDDING_TOKEN_LIMIT)
+        for doc in docs:
+            doc.metadata = {**doc.metadata, "doc_id": doc_id}
         logger.info("🔍 Após ajuste: %d chunks.", len(docs))
     else:
         docs = []
 
-    # 2. Embeddings + vectorstore
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-    vs = create_or_load_vectorstore(file_path or "default", docs, embeddings)
+    # 2. Embeddings + vectorstore (recursos compartilhados do processo)
+    throughput: Dict[str, float] = {}
+    vs = create_or_load_vectorstore(
+        file_path or "default", docs, get_embeddings(), progress=progress, namespace=namespace,
+        throughput=throughput,
+    )
     if vs is None:
         raise RuntimeError("Vectorstore não pôde ser criado/carregado.")
 
-    # 3. Cadeia RAG
-    return create_rag_chain(vs)
+    # 3. Cadeia RAG (BM25 sobre os chunks recém-processados ou, numa
+    #    reconstrução, sobre os gravados na ingestão — sem reembedar)
+    if file_path:
+        _save_chunks(namespace, docs)
+    elif namespace != ALL_NAMESPACES:
+        docs = _load_chunks(namespace)
+    chain = create_rag_chain(vs, docs, doc_id=doc_id)
+
+    # 4. Vazão da ingestão (também no progresso do job)
+    if throughput.get("chunks"):
+        logger.info(
+            "📈 Ingestão: %.1f chunks/s embedados, %.1f vetores/s enviados (%d chunks em %.2fs).",
+            throughput["embed_chunks_per_s"], throughput["upsert_vectors_per_s"],
+            throughput["chunks"], throughput["total_seconds"],
+        )
+        progress("indexed", throughput=throughput)
+    return chain
+
+def _chunks_path(namespace: str):
+    return CHUNKS_FOLDER / f"{namespace}.jsonl"
+
+def _save_chunks(namespace: str, docs: List[LCDocument]) -> None:
+    path = _chunks_path(namespace)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".jsonl.tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        for doc in docs:
+            fh.write(json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+def _load_chunks(namespace: str) -> List[LCDocument]:
+    path = _chunks_path(namespace)
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as fh:
+        return [LCDocument(**json.loads(line)) for line in fh if line.strip()]
@@ -0,0 +1,74 @@
+# core/rerank.py
+"""
+Re-ranking de chunks com cross-encoder em CPU.
+
+Os pares (pergunta, chunk) são pontuados em lotes por um modelo único por
+processo (registro de modelos). Ficam só os `top_n` melhores, e a lista é
+cortada mais cedo quando os scores caem abaixo de `min_score`. Assim o
+prompt recebe bem menos tokens de contexto.
+"""
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document as LCDocument
+
+from .config import (
+    E5_PASSAGE_PREFIX,
+    RERANK_BATCH_SIZE,
+    RERANK_MAX_LENGTH,
+    RERANK_MIN_SCORE,
+    RERANK_MODEL_NAME,
+    RERANK_TOP_N,
+)
+from .models import get_model, register_model
+
+logger = logging.getLogger(__name__)
+
+CROSS_ENCODER = "cross_encoder"
+
+
+def _load_cross_encoder():
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(RERANK_MODEL_NAME, max_length=RERANK_MAX_LENGTH, device="cpu")
+
+
+register_model(CROSS_ENCODER, _load_cross_encoder)
+
+
+def get_cross_encoder():
+    return get_model(CROSS_ENCODER)
+
+
+def _passage_text(doc: LCDocument) -> str:
+    # O prefixo do e5 não faz sentido para o cross-encoder
+    text = doc.page_content
+    return text[len(E5_PASSAGE_PREFIX):] if text.startswith(E5_PASSAGE_PREFIX) else text
+
+
+def rerank_documents(
+    query: str,
+    documents: Sequence[LCDocument],
+    top_n: int = RERANK_TOP_N,
+    min_score: Optional[float] = RERANK_MIN_SCORE,
+    batch_size: int = RERANK_BATCH_SIZE,
+) -> List[Tuple[LCDocument, float]]:
+    """
+    Pontua (query, chunk) e devolve até `top_n` pares (documento, score) em
+    ordem decrescente. Os abaixo de `min_score` são descartados, mas o melhor
+    chunk sempre fica para a geração ter algum contexto.
+    """
+    if not documents:
+        return []
+    scores = get_cross_encoder().predict(
+        [(query, _passage_text(doc)) for doc in documents],
+        batch_size=batch_size,
+        show_progress_bar=False,
+    )
+    ranked = sorted(zip(documents, (float(s) for s in scores)), key=lambda pair: pair[1], reverse=True)
+    kept = []
+    for doc, score in ranked[:max(top_n, 1)]:
+        if kept and min_score is not None and score < min_score:
+            break  # ordem decrescente: o resto também está abaixo do limiar
+        kept.append((doc, score))
+    logger.info("🎯 Rerank: %d → %d chunks (melhor score %.3f).", len(documents), len(kept), kept[0][1])
+    return kept
@@ -0,0 +1,103 @@
+# core/resources.py
+"""
+Pool de recursos compartilhados pelo processo: modelo de embeddings (com
+cache em disco), cliente Pinecone com handles de índice reaproveitados e
+cliente LLM (conexões HTTP reutilizadas). Todas as cadeias usam as mesmas
+instâncias, criadas sob demanda pelo registro de modelos.
+"""
+import logging
+import threading
+from typing import Any, Dict, Optional, Set
+
+from .config import (
+    ANTHROPIC_API_KEY,
+    E5_QUERY_PREFIX,
+    EMBEDDING_MODEL_NAME,
+    LLM_MAX_RETRIES,
+    LLM_MODEL_NAME,
+    LLM_TIMEOUT,
+    PINECONE_API_KEY,
+    PINECONE_POOL_THREADS,
+)
+from .embedding_cache import CachedEmbeddings, get_embedding_cache
+from .models import get_model, register_model
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS = "embeddings"
+PINECONE_CLIENT = "pinecone_client"
+LLM = "llm"
+
+_index_handles: Dict[str, Any] = {}
+_index_names: Optional[Set[str]] = None
+_index_lock = threading.Lock()
+
+
+def _load_embeddings() -> CachedEmbeddings:
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return CachedEmbeddings(
+        HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME),
+        EMBEDDING_MODEL_NAME,
+        get_embedding_cache(),
+        query_prefix=E5_QUERY_PREFIX,
+    )
+
+
+def _load_pinecone():
+    from pinecone import Pinecone
+    return Pinecone(api_key=PINECONE_API_KEY, pool_threads=PINECONE_POOL_THREADS)
+
+
+def _load_llm():
+    from langchain_anthropic import ChatAnthropic
+    return ChatAnthropic(
+        temperature=0.1,
+        model_name=LLM_MODEL_NAME,
+        api_key=ANTHROPIC_API_KEY,
+        max_tokens=1000,
+        max_retries=LLM_MAX_RETRIES,
+        default_request_timeout=LLM_TIMEOUT,
+    )
+
+
+register_model(EMBEDDINGS, _load_embeddings)
+register_model(PINECONE_CLIENT, _load_pinecone)
+register_model(LLM, _load_llm)
+
+
+def get_embeddings() -> CachedEmbeddings:
+    """Modelo de embeddings único do processo (e5 + cache de chunks)."""
+    return get_model(EMBEDDINGS)
+
+
+def get_llm():
+    """Cliente LLM único do processo; o pool HTTP é reaproveitado entre cadeias."""
+    return get_model(LLM)
+
+
+def get_pinecone():
+    return get_model(PINECONE_CLIENT)
+
+
+def pinecone_index_exists(name: str) -> bool:
+    """Consulta `list_indexes` uma vez; só repete se o índice não for encontrado."""
+    global _index_names
+    with _index_lock:
+        if _index_names is None or name not in _index_names:
+            _index_names = set(get_pinecone().list_indexes().names())
+        return name in _index_names
+
+
+def get_pinecone_index(name: str):
+    """Handle do índice, criado uma única vez por nome."""
+    with _index_lock:
+        if name not in _index_handles:
+            _index_handles[name] = get_pinecone().Index(name, pool_threads=PINECONE_POOL_THREADS)
+        return _index_handles[name]
+
+
+def reset_index_cache() -> None:
+    global _index_names
+    with _index_lock:
+        _index_handles.clear()
+        _index_names = None
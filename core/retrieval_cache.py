@@ -0,0 +1,122 @@
+# core/retrieval_cache.py
+"""
+Cache exato de resultados de recuperação (nó `retrieve` do LangGraph).
+
+A chave é (escopo do documento, pergunta normalizada, parâmetros do
+retriever); o valor guarda só os IDs dos chunks (escopo, hash do texto). O
+Document fica num armazém com contagem de referências e só é devolvido quando
+há hit. O escopo entra no ID porque dois documentos podem ter o mesmo texto
+(ex.: uma cláusula padrão) com metadados diferentes (doc_id, página, fonte). Perguntas idênticas não reembedam nem consultam o
+índice; com MCP a busca usa só a pergunta (o histórico vai só para a
+geração), então a chave não muda a cada turno.
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document as LCDocument
+
+from .answer_cache import normalize_question
+from .config import RETRIEVAL_CACHE_SIZE
+from .embedding_cache import chunk_hash
+
+CacheKey = Tuple[str, str, str]
+ChunkKey = Tuple[str, str]  # (escopo, hash do texto)
+
+_CACHE: Optional["RetrievalCache"] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def retriever_fingerprint(retriever: Any) -> str:
+    """Parâmetros que mudam o resultado da busca (tipo, kwargs, k da fusão...)."""
+    params: Dict[str, Any] = {"type": type(retriever).__name__}
+    for attr in ("search_type", "search_kwargs", "k", "candidates", "rrf_k"):
+        if hasattr(retriever, attr):
+            params[attr] = getattr(retriever, attr)
+    vectorstore = getattr(retriever, "vectorstore", None)
+    if vectorstore is not None:
+        params["namespace"] = getattr(vectorstore, "_namespace", None)
+    dense = getattr(retriever, "dense", None)
+    if dense is not None:
+        params["dense"] = retriever_fingerprint(dense)
+    index = getattr(retriever, "index", None)
+    if index is not None:
+        params["sparse"] = id(index)  # índice BM25 novo → resultados novos
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+class RetrievalCache:
+    """LRU limitado de (escopo, pergunta, parâmetros) → IDs dos chunks recuperados."""
+
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[CacheKey, List[ChunkKey]]" = OrderedDict()
+        self._chunks: Dict[ChunkKey, LCDocument] = {}
+        self._refs: Dict[ChunkKey, int] = {}
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def key(scope: Hashable, query: str, params: str) -> CacheKey:
+        return (str(scope), normalize_question(query), params)
+
+    def get(self, key: CacheKey) -> Optional[List[LCDocument]]:
+        with self._lock:
+            ids = self._entries.get(key)
+            if ids is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            # Hidratação só no hit: IDs → Documents do armazém compartilhado
+            return [self._chunks[i] for i in ids]
+
+    def put(self, key: CacheKey, documents: Sequence[LCDocument]) -> None:
+        ids = [(key[0], chunk_hash(doc.page_content)) for doc in documents]
+        with self._lock:
+            if key in self._entries:
+                self._release(self._entries.pop(key))
+            for chunk_id, doc in zip(ids, documents):
+                self._chunks.setdefault(chunk_id, doc)
+                self._refs[chunk_id] = self._refs.get(chunk_id, 0) + 1
+            self._entries[key] = ids
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._release(evicted)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, scope: Hashable) -> int:
+        """Remove os resultados de um documento (ex.: reingestão)."""
+        scope = str(scope)
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == scope]
+            for key in keys:
+                self._release(self._entries.pop(key))
+            return len(keys)
+
+    def _release(self, ids: List[ChunkKey]) -> None:
+        for chunk_id in ids:
+            self._refs[chunk_id] -= 1
+            if not self._refs[chunk_id]:
+                del self._refs[chunk_id]
+                del self._chunks[chunk_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "chunks": len(self._chunks),
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
+
+
+def get_retrieval_cache() -> RetrievalCache:
+    """Instância única do processo."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = RetrievalCache()
+        return _CACHE
@@ -0,0 +1,242 @@
+# core/strategies.py
+"""
+Execução do plano do MCP: parâmetros de recuperação e de contexto por
+requisição, e métricas por estratégia.
+
+O plano (`MCPSystem.plan`) chega em `inputs["plan"]` e traz `retrieval`
+(ver STRATEGY_PROFILES). O retriever da cadeia é copiado com esses
+parâmetros, sem ser reconstruído: `extraction` busca poucos chunks por
+similaridade, `comparison` faz uma busca por lado da comparação e
+`summarization` busca mais chunks e comprime o contexto. Sem plano, ou na
+estratégia `default`, o retriever da cadeia é usado como está.
+
+Perguntas de comparação viram subconsultas (uma por lado), buscadas em
+paralelo num pool limitado e fundidas sem repetir chunks.
+"""
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document as LCDocument
+
+from .config import FAN_OUT_WORKERS
+from .embedding_cache import chunk_hash
+from .mcp import comparison_queries, is_comparison
+
+_SEARCH_KEYS = ("k", "fetch_k", "lambda_mult")
+
+# Limita as buscas simultâneas de todas as requisições (não só de uma)
+_FAN_OUT_POOL = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS, thread_name_prefix="fan-out")
+# Contagem de tokens das métricas, fora do caminho da requisição
+_COUNT_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="token-count")
+
+_STATS: Optional["StrategyStats"] = None
+_STATS_LOCK = threading.Lock()
+
+
+def plan_strategy(plan: Optional[Dict[str, Any]]) -> str:
+    return (plan or {}).get("strategy", "default")
+
+
+def retrieval_params(plan: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return dict((plan or {}).get("retrieval") or {})
+
+
+def packing_kwargs(plan: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Orçamento/dedup do empacotamento definidos pela estratégia (se houver)."""
+    params = retrieval_params(plan)
+    kwargs: Dict[str, Any] = {}
+    if "context_budget" in params:
+        kwargs["budget"] = params["context_budget"]
+    if "context_dedup_threshold" in params:
+        kwargs["dedup_threshold"] = params["context_dedup_threshold"]
+    return kwargs
+
+
+def configure_retriever(retriever: Any, params: Dict[str, Any]) -> Any:
+    """Cópia rasa do retriever com k/tipo de busca da estratégia (o índice é compartilhado)."""
+    if "k" not in params:
+        return retriever
+    k = params["k"]
+    if hasattr(retriever, "dense"):
+        # Híbrido: k final da fusão; candidatos densos/BM25 proporcionais a k
+        candidates = max(k, min(retriever.candidates, 3 * k))
+        dense = configure_retriever(retriever.dense, {**params, "k": candidates})
+        return retriever.model_copy(update={"dense": dense, "k": k, "candidates": candidates})
+    if hasattr(retriever, "search_kwargs"):
+        search_type = params.get("search_type", retriever.search_type)
+        kwargs = {key: value for key, value in retriever.search_kwargs.items() if key not in _SEARCH_KEYS}
+        kwargs["k"] = k
+        if search_type == "mmr":
+            kwargs["fetch_k"] = max(k, params.get("fetch_k", retriever.search_kwargs.get("fetch_k", 4 * k)))
+            kwargs["lambda_mult"] = params.get("lambda_mult", retriever.search_kwargs.get("lambda_mult", 0.5))
+        return retriever.model_copy(update={"search_type": search_type, "search_kwargs": kwargs})
+    if hasattr(retriever, "k"):
+        return retriever.model_copy(update={"k": k})
+    return retriever
+
+
+def plan_queries(query: str, plan: Optional[Dict[str, Any]]) -> List[str]:
+    """
+    Decomposição: consulta principal mais uma subconsulta por lado da
+    comparação (do plano do MCP ou, sem plano, detectadas na própria pergunta).
+    """
+    if plan:
+        if not retrieval_params(plan).get("fan_out"):
+            return [query]
+        return [query, *(plan.get("queries") or [])]
+    return [query, *comparison_queries(query)] if is_comparison(query) else [query]
+
+
+def interleave(rankings: Sequence[Sequence[LCDocument]]) -> List[LCDocument]:
+    """Intercala os resultados das buscas (1º de cada, 2º de cada...) sem repetir chunks."""
+    seen, merged = set(), []
+    for rank in range(max((len(r) for r in rankings), default=0)):
+        for ranking in rankings:
+            if rank < len(ranking):
+                chunk_id = chunk_hash(ranking[rank].page_content)
+                if chunk_id not in seen:
+                    seen.add(chunk_id)
+                    merged.append(ranking[rank])
+    return merged
+
+
+def _timed_search(retriever: Any, query: str) -> Tuple[List[LCDocument], float]:
+    start = time.perf_counter()
+    docs = retriever.invoke(query)
+    return docs, time.perf_counter() - start
+
+
+def retrieve_many(retriever: Any, queries: Sequence[str]) -> Tuple[List[LCDocument], List[Dict[str, Any]]]:
+    """
+    Busca as subconsultas em paralelo e funde os resultados. Retorna
+    (documentos, latência e quantidade por ramo).
+    """
+    if len(queries) == 1:
+        docs, latency = _timed_search(retriever, queries[0])
+        return docs, [{"query": queries[0], "latency": latency, "count": len(docs)}]
+    futures = [_FAN_OUT_POOL.submit(_timed_search, retriever, q) for q in queries]
+    results = [future.result() for future in futures]
+    branches = [
+        {"query": q, "latency": latency, "count": len(docs)}
+        for q, (docs, latency) in zip(queries, results)
+    ]
+    return interleave([docs for docs, _ in results]), branches
+
+
+async def _atimed_search(retriever: Any, query: str, limit: asyncio.Semaphore) -> Tuple[List[LCDocument], float]:
+    async with limit:
+        start = time.perf_counter()
+        docs = await retriever.ainvoke(query)
+        return docs, time.perf_counter() - start
+
+
+async def aretrieve_many(retriever: Any, queries: Sequence[str]) -> Tuple[List[LCDocument], List[Dict[str, Any]]]:
+    """Versão assíncrona de `retrieve_many` (até FAN_OUT_WORKERS buscas por vez)."""
+    limit = asyncio.Semaphore(FAN_OUT_WORKERS)
+    results = await asyncio.gather(*(_atimed_search(retriever, q, limit) for q in queries))
+    branches = [
+        {"query": q, "latency": latency, "count": len(docs)}
+        for q, (docs, latency) in zip(queries, results)
+    ]
+    if len(results) == 1:
+        return results[0][0], branches
+    return interleave([docs for docs, _ in results]), branches
+
+
+def retrieve_planned(retriever: Any, query: str, plan: Optional[Dict[str, Any]]) -> List[LCDocument]:
+    """Recupera com os parâmetros do plano (retriever já configurado por `configure_retriever`)."""
+    return retrieve_many(retriever, plan_queries(query, plan))[0]
+
+
+async def aretrieve_planned(retriever: Any, query: str, plan: Optional[Dict[str, Any]]) -> List[LCDocument]:
+    """Versão assíncrona de `retrieve_planned`."""
+    return (await aretrieve_many(retriever, plan_queries(query, plan)))[0]
+
+
+def params_fingerprint(params: Dict[str, Any], queries: Sequence[str]) -> str:
+    """Parte da chave do cache de recuperação que depende do plano."""
+    return json.dumps({"params": params, "queries": list(queries[1:])}, sort_keys=True, default=str)
+
+
+class StrategyStats:
+    """
+    Latência e tokens (contexto e resposta) acumulados por estratégia.
+
+    A contagem de tokens roda numa thread à parte: a requisição só enfileira os
+    textos e `stats()` espera as contagens pendentes antes de responder.
+    """
+
+    def __init__(self, token_counter: Optional[Callable[[List[str]], List[int]]] = None):
+        self._token_counter = token_counter
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, float]] = {}
+        self._pending: List[Future] = []
+
+    def _count(self, texts: List[str]) -> List[int]:
+        if self._token_counter is None:
+            from .utils import count_tokens_batch  # tokenizer só quando há o que medir
+            self._token_counter = count_tokens_batch
+        return self._token_counter(texts)
+
+    def _totals_for(self, strategy: str) -> Dict[str, float]:
+        return self._totals.setdefault(strategy, {
+            "requests": 0, "latency": 0.0, "retrieve_latency": 0.0,
+            "chunks": 0, "context_tokens": 0, "answer_tokens": 0,
+        })
+
+    def _add_tokens(self, strategy: str, texts: List[str], packed_tokens: Optional[int]) -> None:
+        counts = self._count(texts)
+        with self._lock:
+            totals = self._totals_for(strategy)
+            totals["context_tokens"] += packed_tokens if packed_tokens is not None else sum(counts[1:])
+            totals["answer_tokens"] += counts[0]
+
+    def record(self, strategy: str, latency: float, result: Dict[str, Any]) -> None:
+        metadata = result.get("metadata") or {}
+        docs = result.get("source_documents") or result.get("context") or []
+        packing = metadata.get("context_packing")
+        texts = [result.get("answer") or ""]
+        if packing is None:
+            texts += [doc.page_content for doc in docs]
+        # O empacotador já contou o contexto; sobra contar a resposta (fora da requisição)
+        packed_tokens = packing["tokens_used"] if packing is not None else None
+        future = _COUNT_POOL.submit(self._add_tokens, strategy, texts, packed_tokens)
+        with self._lock:
+            totals = self._totals_for(strategy)
+            totals["requests"] += 1
+            totals["latency"] += latency
+            totals["retrieve_latency"] += metadata.get("retrieve_latency", 0.0)
+            totals["chunks"] += len(docs)
+            self._pending = [f for f in self._pending if not f.done()] + [future]
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+        with self._lock:
+            return {
+                strategy: {
+                    "requests": int(t["requests"]),
+                    "avg_latency": t["latency"] / t["requests"],
+                    "avg_retrieve_latency": t["retrieve_latency"] / t["requests"],
+                    "avg_chunks": t["chunks"] / t["requests"],
+                    "avg_context_tokens": t["context_tokens"] / t["requests"],
+                    "avg_answer_tokens": t["answer_tokens"] / t["requests"],
+                }
+                for strategy, t in self._totals.items()
+            }
+
+
+def get_strategy_stats() -> StrategyStats:
+    """Instância única do processo."""
+    global _STATS
+    with _STATS_LOCK:
+        if _STATS is None:
+            _STATS = StrategyStats()
+        return _STATS
+
@@ -2,12 +2,106 @@ import os
 from typing import List
 import time
 import hashlib
+import threading
 from langsmith import traceable
 from langchain_core.documents import Document as LCDocument
 from transformers import AutoTokenizer
-from typing import Union
+from typing import Any, Dict, Sequence, Tuple, Union
 from pathlib import Path
-from .config import EMBEDDING_TOKEN_LIMIT
+from .config import (
+    EMBEDDING_TOKEN_LIMIT,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_CHUNK_OVERLAP,
+    E5_PASSAGE_PREFIX,
+)
+
+# ───────────── Tokenizers compartilhados (um por modelo, por processo) ─────────────
+_TOKENIZERS: Dict[str, Tuple[Any, threading.Lock]] = {}
+_TOKENIZERS_LOCK = threading.Lock()
+
+
+def _tokenizer_entry(model_name: str) -> Tuple[Any, threading.Lock]:
+    entry = _TOKENIZERS.get(model_name)
+    if entry is None:
+        with _TOKENIZERS_LOCK:
+            entry = _TOKENIZERS.get(model_name)
+            if entry is None:
+                entry = (AutoTokenizer.from_pretrained(model_name), threading.Lock())
+                _TOKENIZERS[model_name] = entry
+    return entry
+
+
+def get_tokenizer(model_name: str = EMBEDDING_MODEL_NAME):
+    """Retorna o tokenizer do modelo, carregado uma única vez por processo."""
+    return _tokenizer_entry(model_name)[0]
+
+
+def clear_tokenizer_cache() -> None:
+    """Descarta os tokenizers carregados (útil em testes)."""
+    with _TOKENIZERS_LOCK:
+        _TOKENIZERS.clear()
+
+
+def _encode_batch(texts: Sequence[str], model_name: str, **kwargs) -> Dict[str, Any]:
+    """Codifica uma lista de textos em uma única chamada do tokenizer."""
+    tokenizer, lock = _tokenizer_entry(model_name)
+    # Tokenizers "fast" não toleram chamadas concorrentes na mesma instância
+    with lock:
+        return tokenizer(list(texts), truncation=False, **kwargs)
+
+
+# ───────────── Fronteiras preferidas para o corte dos chunks ─────────────
+_SENTENCE_END = ".!?"
+_CLAUSE_END = ";:,)"
+
+
+def _boundary_rank(text: str, offsets: Sequence[Tuple[int, int]], j: int) -> int:
+    """Qualidade do corte antes do token j: 2 = parágrafo/frase, 1 = oração, 0 = nenhuma."""
+    prev_end, next_start = offsets[j - 1][1], offsets[j][0]
+    # Alguns tokenizers (Metaspace) incluem o espaço inicial no offset do token
+    while next_start < offsets[j][1] and text[next_start].isspace():
+        next_start += 1
+    gap = text[prev_end:next_start]
+    if "\n" in gap:
+        return 2
+    if not gap or not gap.isspace():
+        return 0  # corte colado no meio de palavra/pontuação
+    last = text[prev_end - 1]
+    if last in _SENTENCE_END:
+        return 2
+    if last in _CLAUSE_END:
+        return 1
+    return 0
+
+
+def _token_spans(
+    text: str,
+    offsets: Sequence[Tuple[int, int]],
+    budget: int,
+    overlap: int,
+) -> List[Tuple[int, int]]:
+    """Calcula os intervalos de caracteres de cada chunk a partir do offset mapping."""
+    n = len(offsets)
+    overlap = min(overlap, budget // 2)
+    lookback = max(budget // 4, 1)
+    spans = []
+    start = 0
+    while start < n:
+        end = min(start + budget, n)
+        if end < n:
+            best, best_rank = end, 0
+            for j in range(end, max(start + overlap + 1, end - lookback), -1):
+                rank = _boundary_rank(text, offsets, j)
+                if rank > best_rank:
+                    best, best_rank = j, rank
+                    if rank == 2:
+                        break
+            end = best
+        spans.append((offsets[start][0], offsets[end - 1][1]))
+        if end >= n:
+            break
+        start = max(end - overlap, start + 1)
+    return spans
 
 @traceable(name="🧼 Sanitizar Metadados")
 def sanitize_metadata(metadata: dict) -> dict:
@@ -25,30 +119,80 @@ def sanitize_metadata(metadata: dict) -> dict:
 @traceable(name="✂️ Ajustar Chunks por Token", metadata={"limite_tokens": EMBEDDING_TOKEN_LIMIT})
 def adjust_chunks_to_token_limit(docs: List[LCDocument], max_tokens: int) -> List[LCDocument]:
     adjusted = []
-    for doc in docs:
-        sub_chunks = split_text_by_token_limit(doc.page_content, max_tokens=max_tokens)
+    split = split_batch(
+        [doc.page_content for doc in docs],
+        max_tokens=max_tokens,
+        overlap=EMBEDDING_CHUNK_OVERLAP,
+        prefix=E5_PASSAGE_PREFIX,
+    )
+    for doc, sub_chunks in zip(docs, split):
         for chunk in sub_chunks:
             adjusted.append(LCDocument(page_content=chunk, metadata=doc.metadata))
     return adjusted
 
 @traceable(name="🧮 Contar Tokens")
-def count_tokens(text: str, model_name: str = "intfloat/multilingual-e5-large") -> int:
+def count_tokens(text: str, model_name: str = EMBEDDING_MODEL_NAME) -> int:
     """Conta quantos tokens o texto possui com base no modelo informado."""
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    return len(tokenizer.encode(text))
+    return count_tokens_batch([text], model_name=model_name)[0]
+
+@traceable(name="🧮 Contar Tokens (lote)")
+def count_tokens_batch(texts: Sequence[str], model_name: str = EMBEDDING_MODEL_NAME) -> List[int]:
+    """Conta os tokens de vários textos em uma única chamada do tokenizer."""
+    if not texts:
+        return []
+    return [len(ids) for ids in _encode_batch(texts, model_name)["input_ids"]]
 
 @traceable(name="✂️ Quebrar Texto por Limite de Tokens")
-def split_text_by_token_limit(text: str, max_tokens: int = 512, model_name: str = "intfloat/multilingual-e5-large") -> List[str]:
+def split_text_by_token_limit(
+    text: str,
+    max_tokens: int = 512,
+    model_name: str = EMBEDDING_MODEL_NAME,
+    overlap: int = 0,
+    prefix: str = "",
+) -> List[str]:
     """Divide o texto em partes menores respeitando o limite de tokens do modelo."""
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    tokens = tokenizer.encode(text, truncation=False)
-    
-    chunks = []
-    for i in range(0, len(tokens), max_tokens):
-        chunk_tokens = tokens[i:i + max_tokens]
-        chunk_text = tokenizer.decode(chunk_tokens, skip_special_tokens=True)
-        chunks.append(chunk_text.strip())
-    
+    return split_batch([text], max_tokens=max_tokens, model_name=model_name, overlap=overlap, prefix=prefix)[0]
+
+@traceable(name="✂️ Quebrar Textos por Limite de Tokens (lote)")
+def split_batch(
+    texts: Sequence[str],
+    max_tokens: int = 512,
+    model_name: str = EMBEDDING_MODEL_NAME,
+    overlap: int = 0,
+    prefix: str = "",
+) -> List[List[str]]:
+    """
+    Divide vários textos respeitando o limite de tokens, codificando todos de uma vez.
+
+    Os cortes usam o offset mapping do tokenizer e fatiam a string original
+    (sem decode), preferindo fim de frase/oração perto do limite. Se o texto
+    começar com `prefix` (ex.: "passage: "), o prefixo é descontado do
+    orçamento e repetido em cada parte. `overlap` é medido em tokens.
+    """
+    if not texts:
+        return []
+    tokenizer = get_tokenizer(model_name)
+    bodies, prefixed = [], []
+    for text in texts:
+        has_prefix = bool(prefix) and text.startswith(prefix)
+        prefixed.append(has_prefix)
+        bodies.append(text[len(prefix):] if has_prefix else text)
+
+    encoded = _encode_batch(bodies, model_name, add_special_tokens=False, return_offsets_mapping=True)
+    reserved = tokenizer.num_special_tokens_to_add()
+    prefix_cost = len(_encode_batch([prefix], model_name, add_special_tokens=False)["input_ids"][0]) if prefix else 0
+
+    chunks: List[List[str]] = []
+    for body, has_prefix, offsets in zip(bodies, prefixed, encoded["offset_mapping"]):
+        head = prefix if has_prefix else ""
+        budget = max(max_tokens - reserved - (prefix_cost if has_prefix else 0), 1)
+        if len(offsets) <= budget:
+            chunks.append([f"{head}{body.strip()}"])
+            continue
+        chunks.append([
+            f"{head}{body[start:end].strip()}"
+            for start, end in _token_spans(body, offsets, budget, overlap)
+        ])
     return chunks
 
 @traceable(name="🔤 Prefixar para E5")
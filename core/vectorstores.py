@@ -0,0 +1,566 @@
+# core/vectorstores.py
+"""
+Backends de vector store selecionáveis por `VECTOR_STORE_BACKEND`.
+
+- "pinecone": índice remoto (handle compartilhado de core.resources).
+- "local": índice em processo, matriz NumPy float32 mapeada em memória sob
+  `LOCAL_INDEX_FOLDER`, com namespaces, filtros de metadados e appends
+  incrementais. A busca é um produto escalar vetorizado sobre vetores
+  normalizados (cosseno exato), sem round trip de rede.
+
+Os dois expõem o mesmo `upsert(vectors=[(id, vetor, metadata)], namespace=...)`,
+então a ingestão não precisa saber qual backend está ativo.
+
+Cada documento ingerido ganha seu próprio namespace (`doc_namespace`), e a
+busca de uma cadeia fica restrita a ele: a latência acompanha o tamanho do
+documento, não do corpus. `ALL_NAMESPACES` mantém a busca entre documentos
+(fluxo /rag/init), consultando todos os namespaces num pool limitado a
+PINECONE_POOL_THREADS buscas simultâneas.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+from .config import (
+    LOCAL_INDEX_FOLDER,
+    NAMESPACE_LIST_TTL,
+    PINECONE_INDEX_NAME,
+    PINECONE_POOL_THREADS,
+    VECTOR_STORE_BACKEND,
+)
+from .embedding_cache import chunk_hash
+from .utils import ensure_directory
+
+logger = logging.getLogger(__name__)
+
+MetadataFilter = Dict[str, Any]
+
+ALL_NAMESPACES = "*"          # busca entre todos os documentos
+LEGACY_NAMESPACE = "default"  # uploads anteriores aos namespaces por documento
+
+_INDEXES: Dict[str, "LocalIndex"] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+# ───────────── Filtros de metadados (subconjunto da sintaxe do Pinecone) ─────────────
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "$eq": lambda value, arg: value == arg,
+    "$ne": lambda value, arg: value != arg,
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$gte": lambda value, arg: value is not None and value >= arg,
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+}
+
+
+def matches_filter(metadata: Dict[str, Any], flt: Optional[MetadataFilter]) -> bool:
+    """`{"campo": valor}` ou `{"campo": {"$in": [...]}}`; `$and`/`$or` com listas."""
+    if not flt:
+        return True
+    for key, cond in flt.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in cond):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = metadata.get(key)
+            for op, arg in cond.items():
+                if op not in _OPERATORS:
+                    raise ValueError(f"Operador de filtro não suportado: {op}")
+                if not _OPERATORS[op](value, arg):
+                    return False
+        elif metadata.get(key) != cond:
+            return False
+    return True
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+# ───────────── Índice local ─────────────
+class _Namespace:
+    """
+    Um namespace em disco: `vectors.f32` (linhas float32 contíguas, só cresce)
+    e `records.jsonl` (log de id/linha/metadata; a última entrada de um id vale).
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.dim: Optional[int] = None
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.rows: Dict[str, int] = {}
+        self._matrix: Optional[np.memmap] = None
+        self._load()
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.path / "vectors.f32"
+
+    @property
+    def _records_path(self) -> Path:
+        return self.path / "records.jsonl"
+
+    def _load(self) -> None:
+        info_path = self.path / "info.json"
+        if not info_path.exists():
+            return
+        self.dim = json.loads(info_path.read_text(encoding="utf-8"))["dim"]
+        with open(self._records_path, encoding="utf-8") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                row = record["row"]
+                if row == len(self.ids):
+                    self.ids.append(record["id"])
+                    self.metadata.append(record["metadata"])
+                else:
+                    self.metadata[row] = record["metadata"]
+                self.rows[record["id"]] = row
+        # Linhas gravadas sem registro (queda no meio de um append) são ignoradas
+        self._remap()
+
+    def _remap(self) -> None:
+        n = len(self.ids)
+        self._matrix = (
+            np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+            if n else None
+        )
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._matrix
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def upsert(self, ids: Sequence[str], vectors: np.ndarray, metadatas: Sequence[Dict[str, Any]]) -> None:
+        if self.dim is None:
+            ensure_directory(self.path)
+            self.dim = int(vectors.shape[1])
+            (self.path / "info.json").write_text(json.dumps({"dim": self.dim}), encoding="utf-8")
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Dimensão {vectors.shape[1]} difere da do namespace ({self.dim}).")
+
+        vectors = _normalize(vectors.astype(np.float32, copy=False))
+        records, updates, appends = [], [], []
+        # Dentro do próprio lote, o último vetor de um id prevalece
+        latest: Dict[str, int] = {}
+        for i, vid in enumerate(ids):
+            latest[vid] = i
+        for vid, i in latest.items():
+            row = self.rows.get(vid)
+            if row is None:
+                row = len(self.ids) + len(appends)
+                appends.append(i)
+            else:
+                updates.append((row, i))
+            records.append({"id": vid, "row": row, "metadata": metadatas[i]})
+
+        self._matrix = None  # solta o mapeamento antes de escrever
+        if updates:
+            writable = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(len(self.ids), self.dim))
+            for row, i in updates:
+                writable[row] = vectors[i]
+            writable.flush()
+            del writable
+        if appends:
+            with open(self._vectors_path, "ab") as fh:
+                fh.write(np.ascontiguousarray(vectors[appends]).tobytes())
+        with open(self._records_path, "a", encoding="utf-8") as fh:
+            for record in records:
+                fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        for record in records:
+            if record["row"] == len(self.ids):
+                self.ids.append(record["id"])
+                self.metadata.append(record["metadata"])
+            else:
+                self.metadata[record["row"]] = record["metadata"]
+            self.rows[record["id"]] = record["row"]
+        self._remap()
+
+    def query(self, vector: np.ndarray, k: int, flt: Optional[MetadataFilter]) -> List[Tuple[int, float]]:
+        """Top-k por cosseno (vetores já normalizados); retorna (linha, score)."""
+        if not self.ids or k <= 0:
+            return []
+        query = _normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+        scores = self.matrix @ query
+        if flt:
+            mask = np.fromiter((matches_filter(md, flt) for md in self.metadata), dtype=bool, count=len(self.ids))
+            scores = np.where(mask, scores, -np.inf)
+            k = min(k, int(mask.sum()))
+            if k == 0:
+                return []
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+
+class LocalIndex:
+    """Índice local com a mesma interface de upsert do índice Pinecone."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        ensure_directory(self.path)
+        self._lock = threading.RLock()
+        self._namespaces: Dict[str, _Namespace] = {}
+
+    def _namespace(self, name: str) -> _Namespace:
+        if name not in self._namespaces:
+            self._namespaces[name] = _Namespace(self.path / (name or "_"))
+        return self._namespaces[name]
+
+    def upsert(self, vectors: Iterable[Tuple[str, Sequence[float], Dict[str, Any]]], namespace: str = "") -> Dict[str, int]:
+        items = list(vectors)
+        if not items:
+            return {"upserted_count": 0}
+        ids = [vid for vid, _, _ in items]
+        matrix = np.asarray([vec for _, vec, _ in items], dtype=np.float32)
+        with self._lock:
+            self._namespace(namespace).upsert(ids, matrix, [md or {} for _, _, md in items])
+        return {"upserted_count": len(items)}
+
+    def query(
+        self,
+        vector: Sequence[float],
+        top_k: int,
+        namespace: str = "",
+        filter: Optional[MetadataFilter] = None,
+        include_values: bool = False,
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            ns = self._namespace(namespace)
+            hits = ns.query(np.asarray(vector, dtype=np.float32), top_k, filter)
+            return [
+                {
+                    "id": ns.ids[row],
+                    "score": score,
+                    "metadata": ns.metadata[row],
+                    **({"values": np.array(ns.matrix[row])} if include_values else {}),
+                }
+                for row, score in hits
+            ]
+
+    def describe_index_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            for child in self.path.iterdir():
+                if child.is_dir():
+                    self._namespace("" if child.name == "_" else child.name)
+            counts = {name: {"vector_count": len(ns)} for name, ns in self._namespaces.items() if len(ns)}
+            return {
+                "namespaces": counts,
+                "total_vector_count": sum(c["vector_count"] for c in counts.values()),
+            }
+
+
+def get_local_index(path: Union[str, Path, None] = None) -> LocalIndex:
+    """Instância única do índice local por diretório, compartilhada no processo."""
+    path = path or LOCAL_INDEX_FOLDER
+    key = str(Path(path).resolve())
+    with _INDEXES_LOCK:
+        if key not in _INDEXES:
+            _INDEXES[key] = LocalIndex(path)
+        return _INDEXES[key]
+
+
+# ───────────── Adaptador LangChain ─────────────
+class LocalVectorStore(VectorStore):
+    """VectorStore sobre um LocalIndex; mesma assinatura do wrapper Pinecone do LangChain."""
+
+    def __init__(self, index: LocalIndex, embedding: Embeddings, text_key: str = "text", namespace: str = ""):
+        self._index = index
+        self._embedding = embedding
+        self._text_key = text_key
+        self._namespace = namespace
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        namespace: Optional[str] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [chunk_hash(t) for t in texts]
+        vectors = self._embedding.embed_documents(texts)
+        self._index.upsert(
+            vectors=[
+                (vid, vec, {**md, self._text_key: text})
+                for vid, vec, md, text in zip(ids, vectors, metadatas, texts)
+            ],
+            namespace=self._namespace if namespace is None else namespace,
+        )
+        return ids
+
+    def _to_document(self, match: Dict[str, Any]) -> Document:
+        metadata = dict(match["metadata"])
+        text = metadata.pop(self._text_key, "")
+        return Document(page_content=text, metadata=metadata, id=match["id"])
+
+    def similarity_search_by_vector_with_score(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[MetadataFilter] = None,
+        namespace: Optional[str] = None,
+    ) -> List[Tuple[Document, float]]:
+        matches = self._index.query(
+            embedding, top_k=k, filter=filter,
+            namespace=self._namespace if namespace is None else namespace,
+        )
+        return [(self._to_document(m), m["score"]) for m in matches]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[MetadataFilter] = None,
+        namespace: Optional[str] = None, **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(
+            self._embedding.embed_query(query), k=k, filter=filter, namespace=namespace
+        )
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[MetadataFilter] = None,
+        namespace: Optional[str] = None, **kwargs: Any,
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter, namespace)]
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[MetadataFilter] = None,
+        namespace: Optional[str] = None, **kwargs: Any,
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter, namespace)]
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[MetadataFilter] = None,
+        namespace: Optional[str] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        matches = self._index.query(
+            embedding, top_k=fetch_k, filter=filter, include_values=True,
+            namespace=self._namespace if namespace is None else namespace,
+        )
+        if not matches:
+            return []
+        selected = maximal_marginal_relevance(
+            np.asarray(embedding, dtype=np.float32),
+            [m["values"] for m in matches],
+            k=k,
+            lambda_mult=lambda_mult,
+        )
+        return [self._to_document(matches[i]) for i in selected]
+
+    def max_marginal_relevance_search(
+        self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5,
+        filter: Optional[MetadataFilter] = None, namespace: Optional[str] = None, **kwargs: Any,
+    ) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self._embedding.embed_query(query), k, fetch_k, lambda_mult, filter, namespace
+        )
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Cosseno em [-1, 1] → relevância em [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        index: Optional[LocalIndex] = None,
+        namespace: str = "",
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(index or get_local_index(), embedding, namespace=namespace)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+# ───────────── Namespaces por documento ─────────────
+def doc_namespace(doc_id: str) -> str:
+    """Namespace estável e curto derivado do doc_id."""
+    return "doc-" + hashlib.sha256(doc_id.encode("utf-8")).hexdigest()[:16]
+
+
+def list_namespace_sizes(index) -> Dict[str, int]:
+    """Namespaces do índice e quantos vetores cada um tem."""
+    stats = index.describe_index_stats()
+    namespaces = stats["namespaces"] if isinstance(stats, dict) else stats.namespaces
+    return {
+        name: info["vector_count"] if isinstance(info, dict) else info.vector_count
+        for name, info in namespaces.items()
+    }
+
+
+
+# Limita as buscas simultâneas ao índice de todas as requisições (não só de uma)
+_SEARCH_POOL = ThreadPoolExecutor(max_workers=PINECONE_POOL_THREADS, thread_name_prefix="ns-search")
+
+
+class MultiNamespaceVectorStore(VectorStore):
+    """
+    Busca entre documentos (fluxo /rag/init). A pergunta é embedada uma vez e
+    todos os namespaces não vazios são consultados, com os resultados mesclados
+    por score. As consultas passam por um pool com PINECONE_POOL_THREADS
+    threads, então muitos documentos aumentam a latência, mas nenhum fica de
+    fora da busca. A lista é relida a cada `ttl` segundos, então documentos
+    novos entram sem recriar a cadeia.
+
+    É um VectorStore comum: `as_retriever` aceita MMR, `fetch_k`,
+    `lambda_mult` e `filter`. No MMR, os vetores dos candidatos vêm de
+    `embed_documents`. Com o CachedEmbeddings, esses textos já foram embedados
+    na ingestão, então os vetores saem do cache em disco.
+    """
+
+    def __init__(
+        self,
+        index,
+        embeddings: Embeddings,
+        ttl: float = NAMESPACE_LIST_TTL,
+    ):
+        self._index = index
+        self._embedding = embeddings
+        self._ttl = ttl
+        self._stores: Dict[str, VectorStore] = {}
+        self._active: List[VectorStore] = []
+        self._listed_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def stores(self) -> List[VectorStore]:
+        with self._lock:
+            if time.monotonic() - self._listed_at > self._ttl:
+                counts = list_namespace_sizes(self._index)
+                names = sorted(name for name, count in counts.items() if count)
+                for name in names:
+                    if name not in self._stores:
+                        self._stores[name] = as_vectorstore(self._index, self._embedding, namespace=name)
+                self._active = [self._stores[name] for name in names]
+                self._listed_at = time.monotonic()
+            return list(self._active)
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: List[float], k: int = 4, filter: Optional[MetadataFilter] = None, **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        futures = [
+            _SEARCH_POOL.submit(store.similarity_search_by_vector_with_score, embedding, k=k, filter=filter)
+            for store in self.stores()
+        ]
+        merged = [pair for future in futures for pair in future.result()]
+        merged.sort(key=lambda pair: pair[1], reverse=True)
+        return merged[:k]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[MetadataFilter] = None, **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[MetadataFilter] = None, **kwargs: Any,
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[MetadataFilter] = None, **kwargs: Any,
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[MetadataFilter] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        candidates = [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, fetch_k, filter)]
+        if not candidates:
+            return []
+        vectors = self._embedding.embed_documents([doc.page_content for doc in candidates])
+        selected = maximal_marginal_relevance(
+            np.asarray(embedding, dtype=np.float32), vectors, k=k, lambda_mult=lambda_mult,
+        )
+        return [candidates[i] for i in selected]
+
+    def max_marginal_relevance_search(
+        self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5,
+        filter: Optional[MetadataFilter] = None, **kwargs: Any,
+    ) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self._embedding.embed_query(query), k, fetch_k, lambda_mult, filter
+        )
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return lambda score: (score + 1.0) / 2.0
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("A ingestão grava no namespace do documento (doc_namespace).")
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, **kwargs: Any):
+        raise NotImplementedError("Use as_vectorstore(index, embeddings, ALL_NAMESPACES).")
+
+
+# ───────────── Seleção de backend ─────────────
+def open_vector_index(name: str = PINECONE_INDEX_NAME, backend: str = VECTOR_STORE_BACKEND):
+    """Handle do índice do backend configurado, ou None se o índice remoto não existir."""
+    if backend == "local":
+        return get_local_index()
+    if backend == "pinecone":
+        from .resources import get_pinecone_index, pinecone_index_exists
+        if not pinecone_index_exists(name):
+            logger.error("Index '%s' não existe no Pinecone.", name)
+            return None
+        return get_pinecone_index(name)
+    raise ValueError(f"VECTOR_STORE_BACKEND desconhecido: {backend!r}")
+
+
+def as_vectorstore(index, embeddings: Embeddings, namespace: str = LEGACY_NAMESPACE) -> VectorStore:
+    """Envolve o handle do índice no VectorStore LangChain correspondente."""
+    if namespace == ALL_NAMESPACES:
+        return MultiNamespaceVectorStore(index, embeddings)
+    if isinstance(index, LocalIndex):
+        return LocalVectorStore(index, embeddings, "text", namespace=namespace)
+    from langchain_community.vectorstores import Pinecone as PineconeLang
+    return PineconeLang(index, embeddings, "text", namespace=namespace)
@@ -1,4 +1,7 @@
 import sys
+import json
+import time
+import uuid
 import requests
 import streamlit as st
 
@@ -21,6 +24,8 @@ if "use_mcp"         not in st.session_state: st.session_state.use_mcp = False
 # chave nova para LangGraph
 if "use_langgraph"   not in st.session_state: st.session_state.use_langgraph = True
 if "pergunta"        not in st.session_state: st.session_state.pergunta = ""
+# memória MCP própria desta aba do navegador
+if "session_id"      not in st.session_state: st.session_state.session_id = uuid.uuid4().hex
 
 # ───────────── Sidebar (MCP switch + LangGraph) ──────────
 with st.sidebar:
@@ -31,10 +36,17 @@ with st.sidebar:
         value=st.session_state.use_mcp,
         help="Ativa memória + planner (MCP)"
     )
-    if st.session_state.use_mcp:
+    if st.session_state.use_mcp and st.session_state.doc_id:
         if st.button("👁️ Ver memória MCP"):
             try:
-                mem = requests.get(f"{API_URL}/mcp/memory?last_n=10").json()
+                mem = requests.get(
+                    f"{API_URL}/mcp/memory",
+                    params={
+                        "doc_id":     st.session_state.doc_id,
+                        "session_id": st.session_state.session_id,
+                        "last_n":     10,
+                    },
+                ).json()
                 st.write(f"Interações armazenadas: **{mem['memory_size']}**")
                 st.json(mem["recent_interactions"])
             except Exception as e:
@@ -49,16 +61,53 @@ with st.sidebar:
     )
 
 # ───────────── Upload de PDF ─────────────────
+ETAPAS = {
+    "queued":    "Na fila",
+    "running":   "Iniciando",
+    "loading":   "Lendo o PDF (Docling)",
+    "ocr":       "OCR das páginas",
+    "chunking":  "Dividindo em trechos",
+    "embedding": "Gerando embeddings",
+    "upserting": "Enviando ao índice",
+}
+
+def acompanhar_job(job_id: str) -> dict:
+    """Consulta /rag/jobs/{id} até o job terminar, mostrando o progresso."""
+    barra = st.progress(0.0, text="Na fila…")
+    while True:
+        job = requests.get(f"{API_URL}/rag/jobs/{job_id}").json()
+        if job["status"] in ("done", "failed"):
+            barra.empty()
+            return job
+        prog = job.get("progress", {})
+        if job["stage"] == "ocr" and prog.get("pages_total"):
+            frac = prog.get("pages_done", 0) / prog["pages_total"]
+            detalhe = f"{prog.get('pages_done', 0)}/{prog['pages_total']} páginas"
+        elif prog.get("chunks_total"):
+            feitos = prog.get("chunks_upserted" if job["stage"] == "upserting" else "chunks_embedded", 0)
+            frac = feitos / prog["chunks_total"]
+            detalhe = f"{feitos}/{prog['chunks_total']} trechos"
+        else:
+            frac, detalhe = 0.0, ""
+        barra.progress(min(frac, 1.0), text=f"{ETAPAS.get(job['stage'], job['stage'])}… {detalhe}")
+        time.sleep(1)
+
 uploaded_file = st.file_uploader("📎 Envie um PDF jurídico", type=["pdf"])
-if uploaded_file:
+if uploaded_file and st.session_state.get("uploaded_name") != uploaded_file.name:
     try:
-        with st.spinner("Enviando e processando no back-end…"):
+        with st.spinner("Enviando o documento…"):
             resp = requests.post(
                 f"{API_URL}/rag/upload",
                 files={"file": (uploaded_file.name, uploaded_file, "application/pdf")}
             )
         resp.raise_for_status()
-        st.session_state.doc_id = resp.json()["doc_id"]
+        data = resp.json()
+        if data.get("job_id"):
+            job = acompanhar_job(data["job_id"])
+            if job["status"] == "failed":
+                raise RuntimeError(job.get("error") or "ingestão falhou")
+        st.session_state.doc_id = data["doc_id"]
+        st.session_state.uploaded_name = uploaded_file.name
         st.success("✅ Documento processado! Agora faça perguntas.")
     except Exception as e:
         st.error(f"❌ Falha no upload/processamento: {e}")
@@ -107,20 +156,38 @@ if st.session_state.doc_id:
 
     if enviar and pergunta:
         try:
-            with st.spinner("Consultando o back-end…"):
-                resp = requests.post(
-                    f"{API_URL}/rag/query",
-                    json={
-                        "doc_id":         st.session_state.doc_id,
-                        "pergunta":       pergunta,
-                        "use_mcp":        st.session_state.use_mcp,
-                        "use_langgraph":  st.session_state.use_langgraph,
-                    }
-                )
+            st.markdown(f"**Você:** {pergunta}")
+            area_resposta = st.empty()
+            area_resposta.markdown("**IA:** _consultando o back-end…_")
+            resp = requests.post(
+                f"{API_URL}/rag/query/stream",
+                json={
+                    "doc_id":         st.session_state.doc_id,
+                    "pergunta":       pergunta,
+                    "use_mcp":        st.session_state.use_mcp,
+                    "use_langgraph":  st.session_state.use_langgraph,
+                    "session_id":     st.session_state.session_id,
+                },
+                stream=True,
+            )
             resp.raise_for_status()
-            data     = resp.json()
-            resposta = data.get("answer", "❌ Sem resposta.")
+
+            # Renderiza os tokens conforme chegam (Server-Sent Events)
+            parcial, data, evento = "", {}, None
+            for linha in resp.iter_lines(decode_unicode=True):
+                if linha.startswith("event:"):
+                    evento = linha.split(":", 1)[1].strip()
+                elif linha.startswith("data:"):
+                    payload = json.loads(linha.split(":", 1)[1])
+                    if evento == "token":
+                        parcial += payload["content"]
+                        area_resposta.markdown(f"**IA:** {parcial}▌")
+                    elif evento == "final":
+                        data = payload
+
+            resposta = data.get("answer") or parcial or "❌ Sem resposta."
             mcp_on   = data.get("mcp_used", False)
+            area_resposta.markdown(f"**IA:** {resposta}")
 
             st.session_state.history.append({
                 "question": pergunta,
@@ -128,8 +195,9 @@ if st.session_state.doc_id:
                 "mcp":      mcp_on
             })
 
-            st.markdown(f"**Você:** {pergunta}")
-            st.markdown(f"**IA:** {resposta}")
+            ttft = data.get("metadata", {}).get("ttft")
+            if ttft is not None:
+                st.caption(f"⏱️ Primeiro token em {ttft:.2f}s")
             if mcp_on and data.get("plan"):
                 with st.expander("📋 Estratégia MCP"):
                     st.json(data["plan"])
@@ -0,0 +1,163 @@
+import time
+
+import pytest
+
+from core.answer_cache import SemanticAnswerCache, normalize_question, word_overlap
+from core.graph_wrapper import GraphChainWrapper
+
+# Embedding de brinquedo: perguntas sobre prazo caem no mesmo eixo
+_AXES = {"prazo": 0, "vigencia": 0, "multa": 1, "foro": 2}
+
+
+def toy_embed(text):
+    vector = [0.0, 0.0, 0.0, 0.01]
+    for word in text.lower().replace("ê", "e").strip("?!. ").split():
+        if word in _AXES:
+            vector[_AXES[word]] += 1.0
+    return vector
+
+
+class CountingEmbed:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return toy_embed(text)
+
+
+def result(answer):
+    return {"answer": answer, "source_documents": [], "metadata": {"total_time": 1.0}}
+
+
+def test_paraphrase_hits_within_same_document_only():
+    cache = SemanticAnswerCache(threshold=0.9, embed_fn=toy_embed)
+    cache.store("contrato.pdf", "qual o prazo de vigência?", result("12 meses"))
+    hit, _ = cache.lookup("contrato.pdf", "prazo do contrato?")
+    assert hit["answer"] == "12 meses"
+    assert hit["metadata"]["answer_cache"]["hit"] is True
+    assert cache.lookup("contrato.pdf", "qual a multa?")[0] is None
+    assert cache.lookup("outro.pdf", "prazo do contrato?")[0] is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+    assert stats["hit_rate"] == pytest.approx(1 / 3)
+
+
+def test_close_vectors_without_shared_words_miss():
+    # Como o e5 com perguntas do mesmo contrato: tudo muito próximo no espaço
+    cache = SemanticAnswerCache(threshold=0.9, embed_fn=lambda text: [1.0, 0.0])
+    cache.store("contrato.pdf", "qual o prazo de vigência?", result("12 meses"))
+    assert cache.lookup("contrato.pdf", "qual o valor da multa?")[0] is None
+    hit, _ = cache.lookup("contrato.pdf", "prazo do contrato?")
+    assert hit["answer"] == "12 meses"
+    assert word_overlap("prazo de vigência", "valor da multa") == 0.0
+    assert word_overlap("Qual o prazo?", "prazo de vigência do contrato") == 1.0
+
+
+def test_lookup_reuses_the_retrieval_query_vector(tmp_path):
+    from core.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+    class Model:
+        def __init__(self):
+            self.queries = []
+
+        def embed_query(self, text):
+            self.queries.append(text)
+            return toy_embed(text.removeprefix("query: "))
+
+    model = Model()
+    embeddings = CachedEmbeddings(model, "e5", EmbeddingCache(tmp_path / "e.sqlite"), query_prefix="query: ")
+    cache = SemanticAnswerCache(embed_fn=embeddings.embed_query)
+    cache.lookup("d", "prazo do contrato?")             # documento sem respostas: nem embeda
+    cache.store("d", "qual o prazo de vigência?", result("12 meses"))
+    hit, _ = cache.lookup("d", "Qual o prazo?")
+    embeddings.embed_query("Qual o prazo?")             # a busca do mesmo pedido sai do LRU
+    assert hit is not None
+    assert model.queries == ["query: qual o prazo de vigência?", "query: Qual o prazo?"]
+
+
+def test_exact_question_skips_embedding_and_miss_vector_is_reused():
+    embed = CountingEmbed()
+    cache = SemanticAnswerCache(embed_fn=embed)
+    cache.store("d", "Qual o prazo?", result("x"))
+    assert embed.calls == 1
+    assert cache.lookup("d", "  qual o PRAZO ")[0]["answer"] == "x"
+    assert embed.calls == 1
+    hit, vector = cache.lookup("d", "qual a multa")
+    assert hit is None and embed.calls == 2
+    cache.store("d", "qual a multa", result("y"), vector)
+    assert embed.calls == 2
+
+
+def test_lru_ttl_and_memory_bound():
+    cache = SemanticAnswerCache(max_entries=2, embed_fn=toy_embed)
+    cache.store("d", "prazo", result("a"))
+    cache.store("d", "multa", result("b"))
+    cache.lookup("d", "prazo")  # "prazo" vira o mais recente
+    cache.store("d", "foro", result("c"))
+    assert cache.lookup("d", "multa")[0] is None
+    assert cache.stats()["evictions"] == 1
+
+    small = SemanticAnswerCache(max_bytes=1500, embed_fn=toy_embed)
+    small.store("d", "prazo", result("a" * 800))
+    small.store("d", "multa", result("b" * 800))
+    assert small.stats()["entries"] == 1 and small.stats()["bytes"] <= 1500
+
+    expiring = SemanticAnswerCache(ttl=0.01, embed_fn=toy_embed)
+    expiring.store("d", "prazo", result("a"))
+    time.sleep(0.02)
+    assert expiring.lookup("d", "prazo")[0] is None
+    assert expiring.stats()["expired"] == 1
+
+
+def test_invalidate_on_reingest():
+    cache = SemanticAnswerCache(embed_fn=toy_embed)
+    cache.store("d", "prazo", result("a"))
+    cache.store("e", "prazo", result("b"))
+    assert cache.invalidate("d") == 1
+    assert cache.lookup("d", "prazo")[0] is None
+    assert cache.lookup("e", "prazo")[0]["answer"] == "b"
+
+
+class FakeChain:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, inputs):
+        self.calls += 1
+        assert "use_cache" not in inputs
+        return result(f"resposta {self.calls}")
+
+    def stream(self, inputs):
+        yield {"type": "token", "content": "res"}
+        yield {"type": "final", **self.invoke(inputs)}
+
+
+def test_graph_wrapper_serves_repeated_questions_from_cache():
+    chain = FakeChain()
+    cache = SemanticAnswerCache(embed_fn=toy_embed)
+    wrapper = GraphChainWrapper(chain, use_langgraph=False, doc_id="d", answer_cache=cache)
+    first = wrapper.invoke({"input": "qual o prazo de vigência?"})
+    second = wrapper.invoke({"input": "prazo?"})
+    assert first["metadata"]["answer_cache"] == {"hit": False}
+    assert second["answer"] == "resposta 1" and chain.calls == 1
+    # Pergunta enriquecida pelo MCP não usa o cache
+    assert wrapper.invoke({"input": "prazo?", "use_cache": False})["answer"] == "resposta 2"
+    assert normalize_question("Prazo?") == "prazo"
+
+
+def test_graph_wrapper_stream_serves_cache_hit_as_single_final_event():
+    chain = FakeChain()
+    cache = SemanticAnswerCache(embed_fn=toy_embed)
+    wrapper = GraphChainWrapper(chain, use_langgraph=False, doc_id="d", answer_cache=cache)
+    events = list(wrapper.stream({"input": "qual o prazo?"}))
+    assert [e["type"] for e in events] == ["token", "final"]
+    assert events[-1]["metadata"]["answer_cache"] == {"hit": False}
+    cached = list(wrapper.stream({"input": "prazo?"}))
+    assert [e["type"] for e in cached] == ["final"]
+    assert cached[0]["answer"] == "resposta 1" and chain.calls == 1
+
+
+def test_graph_wrapper_without_doc_id_has_no_cache():
+    wrapper = GraphChainWrapper(FakeChain(), use_langgraph=False, answer_cache=SemanticAnswerCache(embed_fn=toy_embed))
+    assert wrapper.answer_cache is None
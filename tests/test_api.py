@@ -0,0 +1,205 @@
+import contextlib
+import importlib
+import json
+import sys
+import time
+import types
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+
+import core.config as real_config
+
+
+def import_with_stubs(name, stubs):
+    """
+    Importa `name` com os stubs em sys.modules e restaura o estado anterior.
+    Os módulos core.* importados sobre os stubs saem de sys.modules depois.
+    """
+    saved = {key: sys.modules.get(key) for key in stubs}
+    loaded = set(sys.modules)
+    sys.modules.update(stubs)
+    try:
+        return importlib.import_module(name)
+    finally:
+        package = sys.modules['core']
+        for key in set(sys.modules) - loaded:
+            if key.startswith('core.') and key not in stubs:
+                module = sys.modules.pop(key)
+                attr = key.split('.', 1)[1]
+                if package.__dict__.get(attr) is module:
+                    delattr(package, attr)
+        for key, module in saved.items():
+            if module is None:
+                sys.modules.pop(key, None)
+            else:
+                sys.modules[key] = module
+
+
+class Retriever:
+    async def ainvoke(self, query, config=None):
+        return [Document(page_content="cláusula comum"), Document(page_content=f"trecho sobre {query}")]
+
+
+class FakeChain:
+    """Mesma interface da cadeia do pipeline: ainvoke/astream e o retriever."""
+
+    retriever = Retriever()
+
+    def __init__(self):
+        self.inputs = []
+
+    def _result(self, inputs):
+        self.inputs.append(inputs)
+        docs = inputs.get("documents") or [Document(page_content="Art. 1º", metadata={"page": 1})]
+        return {
+            "answer": f"resposta {inputs['input']}",
+            "source_documents": docs,
+            "metadata": {"context_packing": {"tokens_used": 12}, "total_time": 0.1},
+        }
+
+    async def ainvoke(self, inputs):
+        return self._result(inputs)
+
+    async def astream(self, inputs):
+        yield {"type": "token", "content": "resp"}
+        yield {"type": "token", "content": "osta"}
+        yield {"type": "final", **self._result(inputs), "metadata": {"ttft": 0.01}}
+
+
+class Embeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_queries(self, texts):
+        self.calls.append(list(texts))
+        return [[1.0] for _ in texts]
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    root = tmp_path_factory.mktemp("api")
+    config = {k: v for k, v in vars(real_config).items() if k.isupper()}
+    config.update(
+        PRELOAD_MODELS=[],
+        INGEST_MANIFEST_PATH=root / "ingest.sqlite",
+        CHAIN_MANIFEST_PATH=root / "chains.json",
+        MCP_BACKEND="memory",
+    )
+    stubs = {
+        'core.config': types.ModuleType('core.config'),
+        'core.rag_pipeline': types.ModuleType('core.rag_pipeline'),
+    }
+    vars(stubs['core.config']).update(config)
+    stubs['core.rag_pipeline'].process_document = lambda doc_id, progress=None, namespace=None: FakeChain()
+    with contextlib.chdir(root):  # uploaded_docs/ criado no import
+        module = import_with_stubs('backend.api', stubs)
+    module.UPLOAD_DIR = root / "uploaded_docs"
+    return module
+
+
+@pytest.fixture
+def client(api, monkeypatch):
+    monkeypatch.setattr(api.mcp_instance, "embedder", None)
+    monkeypatch.setattr(api.mcp_instance, "token_counter", lambda texts: [len(t) // 4 + 1 for t in texts])
+    chain = FakeChain()
+    api.app.state.chains.register("doc", chain, namespace="doc-ns", index="i", backend="local")
+    with TestClient(api.app) as test_client:
+        test_client.chain = chain
+        yield test_client
+
+
+def test_query_returns_answer_sources_and_packing_report(client):
+    body = client.post("/rag/query", json={"doc_id": "doc", "pergunta": "Qual o prazo?"}).json()
+    assert body["answer"] == "resposta Qual o prazo?"
+    assert body["mcp_used"] is False
+    assert body["source_documents"][0]["page_content"] == "Art. 1º"
+    assert body["metadata"]["context_packing"] == {"tokens_used": 12}
+    assert client.post("/rag/query", json={"doc_id": "outro", "pergunta": "x"}).status_code == 404
+
+
+def test_query_with_mcp_sends_plan_and_remembers(client, api):
+    payload = {"doc_id": "doc", "pergunta": "Faça um resumo do contrato", "use_mcp": True, "session_id": "s1"}
+    body = client.post("/rag/query", json=payload).json()
+    assert body["mcp_used"] is True and body["plan"]["strategy"] == "summarization"
+    assert client.chain.inputs[-1]["use_cache"] is False
+    memory = client.get("/mcp/memory", params={"doc_id": "doc", "session_id": "s1"}).json()
+    assert memory["memory_size"] == 1
+    assert memory["recent_interactions"][0]["question"] == "Faça um resumo do contrato"
+
+
+def test_stream_emits_tokens_then_final_event(client):
+    response = client.post("/rag/query/stream", json={"doc_id": "doc", "pergunta": "Qual o foro?"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (block.split("\n")[0].removeprefix("event: "), json.loads(block.split("\n")[1].removeprefix("data: ")))
+        for block in response.text.strip().split("\n\n")
+    ]
+    assert events[:2] == [("token", {"content": "resp"}), ("token", {"content": "osta"})]
+    kind, final = events[-1]
+    assert kind == "final"
+    assert set(final) == {"answer", "sources", "metadata", "mcp_used"}
+    assert final["sources"] == [{"page_content": "Art. 1º", "metadata": {"page": 1}}]
+    assert final["metadata"]["ttft"] == 0.01
+
+
+def test_batch_streams_ndjson_with_each_chunk_sent_once(client, api, monkeypatch):
+    embeddings = Embeddings()
+    monkeypatch.setattr(api, "get_embeddings", lambda: embeddings)
+    questions = ["prazo", "multa"]
+    response = client.post("/rag/query/batch", json={"doc_id": "doc", "perguntas": questions})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [e["type"] for e in events] == ["retrieval", "answer", "answer", "done"]
+    assert embeddings.calls == [questions]
+    answers = events[1:3]
+    assert sorted(a["pergunta"] for a in answers) == sorted(questions)
+    sent = [cid for a in answers for cid in a["chunks"]]
+    assert len(sent) == len(set(sent)) == 3      # o chunk comum vai uma vez só
+    chunk = next(iter(answers[0]["chunks"].values()))
+    assert set(chunk) == {"page_content", "metadata"}
+    assert events[-1]["failed"] == 0
+    assert client.post("/rag/query/batch", json={"doc_id": "doc", "perguntas": []}).status_code == 400
+
+
+def test_upload_runs_job_and_second_upload_hits_cache(client, api):
+    pdf = ("contrato.pdf", b"%PDF-1.4 conteudo", "application/pdf")
+    first = client.post("/rag/upload", files={"file": pdf}).json()
+    assert first["cached"] is False and first["status"] in {"queued", "running", "done"}
+    job = {}
+    for _ in range(100):
+        job = client.get(f"/rag/jobs/{first['job_id']}").json()
+        if job["status"] in {"done", "failed"}:
+            break
+        time.sleep(0.02)
+    assert job["status"] == "done" and job["doc_id"] == first["doc_id"]
+    assert set(job) >= {"job_id", "status", "stage", "progress", "error", "elapsed"}
+    again = client.post("/rag/upload", files={"file": pdf}).json()
+    assert again == {"doc_id": first["doc_id"], "cached": True, "status": "done"}
+    assert client.get("/rag/jobs/desconhecido").status_code == 404
+    assert client.post("/rag/upload", files={"file": ("a.txt", b"x", "text/plain")}).status_code == 400
+
+
+def test_stats_endpoints_report_their_counters(client, api, monkeypatch):
+    from core.strategies import StrategyStats
+    stats = StrategyStats(token_counter=lambda texts: [len(t.split()) for t in texts])
+    monkeypatch.setattr(api, "get_strategy_stats", lambda: stats)
+    upload = client.get("/rag/upload/stats").json()
+    assert {"hits", "misses", "documents", "hit_rate"} <= set(upload)
+    chains = client.get("/rag/chains/stats").json()
+    assert {"loaded", "max_chains", "bytes", "manifest_documents"} <= set(chains)
+    cache = client.get("/rag/cache/stats").json()
+    assert {"hits", "misses", "entries", "hit_rate"} <= set(cache)
+    stats.record("extraction", 0.2, {
+        "answer": "sim", "source_documents": [], "metadata": {"context_packing": {"tokens_used": 12}},
+    })
+    extraction = client.get("/mcp/strategies/stats").json()["extraction"]
+    assert set(extraction) == {
+        "requests", "avg_latency", "avg_retrieve_latency", "avg_chunks", "avg_context_tokens", "avg_answer_tokens",
+    }
+
+
+def test_init_registers_cross_document_chain(client, api):
+    assert client.post("/rag/init").json() == {"doc_id": "default"}
+    assert api.app.state.chains.known("default")
@@ -0,0 +1,132 @@
+import asyncio
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+
+from core.batch import answer_batch
+from core.embedding_cache import chunk_hash
+from core.langgraph_pipeline import LangGraphRAGPipeline
+
+
+class Retriever:
+    def __init__(self):
+        self.queries = []
+
+    async def ainvoke(self, query, config=None):
+        self.queries.append(query)
+        return [Document(page_content="cláusula comum"), Document(page_content=f"trecho sobre {query}")]
+
+
+class Embeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_queries(self, texts):
+        self.calls.append(list(texts))
+        return [[0.0] for _ in texts]
+
+
+class Chain:
+    """Geração com atraso decrescente: a última pergunta termina primeiro."""
+
+    def __init__(self, retriever, delays):
+        self.retriever = retriever
+        self.delays = delays
+        self.running = 0
+        self.peak = 0
+        self.inputs = []
+
+    async def ainvoke(self, inputs):
+        self.inputs.append(inputs)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(self.delays[inputs["input"]])
+        self.running -= 1
+        return {"answer": f"resposta {inputs['input']}", "source_documents": inputs["documents"]}
+
+
+async def collect(*args, **kwargs):
+    return [event async for event in answer_batch(*args, **kwargs)]
+
+
+def test_batch_embeds_once_shares_chunks_and_caps_generation():
+    questions = [f"q{i}" for i in range(6)]
+    chain = Chain(Retriever(), {q: 0.05 * (6 - i) for i, q in enumerate(questions)})
+    embeddings = Embeddings()
+    events = asyncio.run(collect(chain, questions, embeddings=embeddings, concurrency=2))
+
+    assert embeddings.calls == [questions]
+    assert sorted(chain.retriever.queries) == questions
+    assert chain.peak == 2
+    retrieval, *answers, done = events
+    assert (retrieval["chunks_retrieved"], retrieval["unique_chunks"]) == (12, 7)
+    assert done == {**done, "type": "done", "questions": 6, "failed": 0}
+    # Mesmo Document para o chunk comum em todas as perguntas
+    common = {id(inputs["documents"][0]) for inputs in chain.inputs}
+    assert len(common) == 1
+    # Cada chunk é enviado uma só vez, mas referenciado por todas as respostas
+    sent = [cid for event in answers for cid in event["chunks"]]
+    assert len(sent) == len(set(sent)) == 7
+    assert all(chunk_hash("cláusula comum") in event["source_ids"] for event in answers)
+
+
+def test_batch_embeds_each_question_once_with_answer_cache_on(tmp_path):
+    from core.answer_cache import SemanticAnswerCache
+    from core.embedding_cache import CachedEmbeddings, EmbeddingCache
+    from core.graph_wrapper import GraphChainWrapper
+
+    class Model:
+        def __init__(self):
+            self.batches, self.single = [], []
+            self.encode_kwargs, self.query_encode_kwargs = {}, {}
+
+        def embed_documents(self, texts):
+            self.batches.append(list(texts))
+            return [[1.0, float(len(t))] for t in texts]
+
+        def embed_query(self, text):
+            self.single.append(text)
+            return [1.0, float(len(text))]
+
+    model = Model()
+    embeddings = CachedEmbeddings(model, "e5", EmbeddingCache(tmp_path / "e.sqlite"), query_prefix="query: ")
+    questions = ["qual o prazo?", "qual a multa?", "qual o foro?"]
+    chain = Chain(Retriever(), {q: 0.0 for q in questions})
+    wrapper = GraphChainWrapper(
+        chain, use_langgraph=False, doc_id="d", answer_cache=SemanticAnswerCache(embed_fn=embeddings.embed_query),
+    )
+    events = asyncio.run(collect(wrapper, questions, embeddings=embeddings))
+    assert events[-1]["failed"] == 0
+    # Uma passada em lote; o cache de respostas lê os mesmos vetores do LRU
+    assert model.batches == [[f"query: {q}" for q in questions]]
+    assert model.single == []
+
+
+def test_batch_streams_in_completion_order_and_isolates_failures():
+    questions = ["lenta", "rápida", "quebra"]
+
+    class Flaky(Chain):
+        async def ainvoke(self, inputs):
+            if inputs["input"] == "quebra":
+                raise RuntimeError("LLM fora do ar")
+            return await super().ainvoke(inputs)
+
+    chain = Flaky(Retriever(), {"lenta": 0.2, "rápida": 0.01})
+    events = asyncio.run(collect(chain, questions, concurrency=3))
+    kinds = [(e["type"], e.get("index")) for e in events[1:-1]]
+    assert kinds == [("error", 2), ("answer", 1), ("answer", 0)]
+    assert events[-1]["failed"] == 1
+
+
+def test_graph_uses_prefetched_documents_without_searching():
+    class NoSearch:
+        def invoke(self, query, config=None):
+            raise AssertionError("não deveria buscar")
+
+    generator = SimpleNamespace(invoke=lambda inputs: "Ok.")
+    pipeline = LangGraphRAGPipeline(SimpleNamespace(retriever=NoSearch(), document_chain=generator), use_rerank=False)
+    docs = [Document(page_content="passage: Art. 1º")]
+    result = pipeline.invoke({"input": "Qual o artigo?", "documents": docs})
+    assert result["answer"] == "Ok."
+    assert [d.page_content for d in result["source_documents"]] == ["passage: Art. 1º"]
+    assert result["metadata"]["prefetched"] is True
@@ -0,0 +1,49 @@
+from langchain_core.documents import Document
+
+from core.bm25 import BM25Index, HybridRetriever, reciprocal_rank_fusion, tokenize_pt
+
+
+DOCS = [
+    Document(page_content="passage: Art. 37 A administração pública obedecerá aos princípios da legalidade."),
+    Document(page_content="passage: § 2º A multa rescisória será de 10% do valor do contrato."),
+    Document(page_content="passage: O foro da comarca de São Paulo é o competente."),
+    Document(page_content="passage: Art. 5º Todos são iguais perante a lei."),
+]
+
+
+class FakeDense:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def invoke(self, query, config=None):
+        return list(self.docs)
+
+
+def test_tokenize_pt_keeps_legal_tokens():
+    assert tokenize_pt("passage: Art. 37, § 2º da Lei 8.666/93 — Ação") == ["art", "37", "§", "2", "lei", "8666", "93", "acao"]
+
+
+def test_bm25_ranks_exact_citations():
+    index = BM25Index.build(DOCS)
+    assert index.search("art 37", k=2)[0][0] == 0
+    assert index.search("§ 2º multa", k=1)[0][0] == 1
+    assert index.search("comarca paulo", k=5) == [(2, index.scores("comarca paulo")[2])]
+    assert index.search("inexistente", k=3) == []
+    assert index.offsets[-1] == len(index.doc_ids) == len(index.term_freqs)
+    assert index.nbytes > 0
+
+
+def test_rrf_promotes_documents_in_both_rankings():
+    a, b, c = DOCS[:3]
+    fused = reciprocal_rank_fusion([[a, b, c], [c, b]], k=2)
+    assert fused == [b, c] or fused == [c, b]
+    assert a not in fused
+
+
+def test_hybrid_retriever_fuses_dense_and_bm25():
+    dense = FakeDense([DOCS[2]])
+    retriever = HybridRetriever(dense=dense, index=BM25Index.build(DOCS), k=2, candidates=2)
+    docs = retriever.invoke("Art. 37 legalidade")
+    assert DOCS[0] in docs  # perdido pelo denso, recuperado pelo BM25
+    assert len(docs) == 2
+    assert HybridRetriever(dense=FakeDense([DOCS[2], DOCS[3]]), k=1).invoke("x") == [DOCS[2]]
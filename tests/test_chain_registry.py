@@ -0,0 +1,75 @@
+import threading
+from types import SimpleNamespace
+
+from core.chain_registry import ChainRegistry, estimate_chain_bytes
+
+
+class Builder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, doc_id, entry):
+        self.calls.append((doc_id, entry["namespace"]))
+        return SimpleNamespace(doc_id=doc_id)
+
+
+def test_lru_eviction_and_lazy_rebuild(tmp_path):
+    builder = Builder()
+    registry = ChainRegistry(tmp_path / "chains.json", builder, max_chains=2)
+    for doc_id in ("a", "b", "c"):
+        registry.register(doc_id, SimpleNamespace(doc_id=doc_id), namespace=f"ns-{doc_id}")
+    stats = registry.stats()
+    assert (stats["loaded"], stats["evictions"], stats["manifest_documents"]) == (2, 1, 3)
+
+    # "a" foi despejada: volta pelo manifesto, sem reprocessar o documento
+    assert registry.get("a").doc_id == "a"
+    assert builder.calls == [("a", "ns-a")]
+    assert registry.get("a").doc_id == "a"
+    assert registry.stats()["rebuilds"] == 1
+    assert registry.get("desconhecido") is None
+
+
+def test_manifest_survives_restart(tmp_path):
+    path = tmp_path / "chains.json"
+    ChainRegistry(path, Builder()).register("a", object(), namespace="ns-a", backend="local")
+    builder = Builder()
+    restarted = ChainRegistry(path, builder)
+    assert restarted.known("a")
+    restarted.get("a")
+    assert builder.calls == [("a", "ns-a")]
+
+
+def test_memory_cap_counts_bm25_index(tmp_path):
+    index = SimpleNamespace(nbytes=1_000_000, documents=[])
+    heavy = SimpleNamespace(original_chain=SimpleNamespace(retriever=SimpleNamespace(index=index)))
+    assert estimate_chain_bytes(heavy) > 1_000_000
+    registry = ChainRegistry(tmp_path / "c.json", Builder(), max_chains=10, max_bytes=1_500_000)
+    registry.register("a", heavy, namespace="a")
+    registry.register("b", heavy, namespace="b")
+    assert registry.stats()["loaded"] == 1
+    assert registry.stats()["bytes"] <= 1_500_000
+
+
+def test_concurrent_gets_build_once(tmp_path):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_builder(doc_id, entry):
+        calls.append(doc_id)
+        started.set()
+        release.wait(2)
+        return object()
+
+    registry = ChainRegistry(tmp_path / "c.json", slow_builder)
+    registry.describe("a", namespace="ns-a")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("a"))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    started.wait(2)
+    release.set()
+    for t in threads:
+        t.join()
+    assert calls == ["a"]
+    assert len({id(r) for r in results}) == 1
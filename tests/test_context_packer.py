@@ -0,0 +1,50 @@
+import pytest
+from langchain_core.documents import Document
+
+from core import context_packer
+from core.context_packer import PackedRetriever, pack_context
+
+
+@pytest.fixture(autouse=True)
+def word_count_tokens(monkeypatch):
+    calls = []
+
+    def count(texts, model_name):
+        calls.append(list(texts))
+        return [len(t.split()) for t in texts]
+
+    monkeypatch.setattr(context_packer, "count_tokens_batch", count)
+    return calls
+
+
+def doc(text):
+    return Document(page_content=f"passage: {text}")
+
+
+def test_greedy_fill_in_relevance_order(word_count_tokens):
+    docs = [doc("a " * 5), doc("b " * 8), doc("c " * 3), doc("d " * 2)]
+    kept, report = pack_context(docs, budget=13, dedup_threshold=0.9)
+    # 6 + 9 não cabe; os menores seguintes ainda entram
+    assert kept == [docs[0], docs[2], docs[3]]
+    assert report["tokens_used"] == 6 + 4 + 3
+    assert report["tokens_dropped"] == 9
+    assert report["chunks_dropped_budget"] == 1
+    assert len(word_count_tokens) == 1  # uma única chamada do tokenizer
+
+
+def test_near_duplicates_removed():
+    base = "o prazo de vigência do contrato é de doze meses contados da assinatura"
+    docs = [doc(base), doc(base + " ."), doc("a multa rescisória é de dez por cento do valor")]
+    kept, report = pack_context(docs, budget=1000, dedup_threshold=0.8)
+    assert kept == [docs[0], docs[2]]
+    assert report["chunks_dropped_duplicate"] == 1
+
+
+def test_packed_retriever_applies_budget():
+    class Fake:
+        def invoke(self, query, config=None):
+            return [doc("x " * 4), doc("y " * 4)]
+
+    packed = PackedRetriever(retriever=Fake(), budget=6).invoke("q")
+    assert len(packed) == 1
+    assert packed.report["tokens_used"] == 5 and packed.report["chunks_dropped_budget"] == 1
@@ -0,0 +1,127 @@
+import pytest
+
+from core.embedding_cache import CachedEmbeddings, EmbeddingCache, chunk_hash, get_embedding_cache
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0, 0.5] for t in texts]
+
+    def embed_query(self, text):
+        self.calls.append(["query", text])
+        return [0.0, 0.0, 1.0]
+
+
+class SentenceTransformerEmbeddings(CountingEmbeddings):
+    """Como o HuggingFaceEmbeddings: perguntas usam `query_encode_kwargs`."""
+
+    def __init__(self, query_encode_kwargs=None):
+        super().__init__()
+        self.encode_kwargs = {}
+        self.query_encode_kwargs = query_encode_kwargs or {}
+
+    def _embed(self, texts, encode_kwargs):
+        self.calls.append(list(texts))
+        offset = len(encode_kwargs.get("prompt", ""))
+        return [[float(len(t) + offset), 1.0, 0.5] for t in texts]
+
+    def embed_documents(self, texts):
+        return self._embed(texts, self.encode_kwargs)
+
+    def embed_query(self, text):
+        return self._embed([text], self.query_encode_kwargs or self.encode_kwargs)[0]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = EmbeddingCache(tmp_path / "emb.sqlite")
+    yield c
+    c.close()
+
+
+def test_chunk_hash_is_stable():
+    assert chunk_hash("passage: a") == chunk_hash("passage: a")
+    assert chunk_hash("a") != chunk_hash("b")
+
+
+def test_only_misses_are_embedded(cache):
+    base = CountingEmbeddings()
+    emb = CachedEmbeddings(base, "e5", cache)
+    first = emb.embed_documents(["aa", "bbb", "aa"])
+    assert base.calls == [["aa", "bbb"]]  # duplicata embutida uma vez só
+    second = emb.embed_documents(["bbb", "cccc"])
+    assert base.calls[-1] == ["cccc"]
+    assert first[1] == second[0] == [3.0, 1.0, 0.5]
+    assert emb.misses == 3 and emb.hits == 1
+
+
+def test_cache_is_keyed_by_model_and_persists(tmp_path):
+    path = tmp_path / "emb.sqlite"
+    c1 = EmbeddingCache(path)
+    c1.put_many("m1", [(chunk_hash("x"), [1.0, 2.0])])
+    c1.close()
+    c2 = EmbeddingCache(path)
+    assert c2.get_many("m1", [chunk_hash("x")]) == {chunk_hash("x"): [1.0, 2.0]}
+    assert c2.get_many("m2", [chunk_hash("x")]) == {}
+    assert len(c2) == 1
+    c2.close()
+
+
+def test_embed_query_bypasses_cache(cache):
+    emb = CachedEmbeddings(CountingEmbeddings(), "e5", cache)
+    assert emb.embed_query("q") == [0.0, 0.0, 1.0]
+    assert len(cache) == 0
+
+
+def test_query_embeddings_use_bounded_lru(cache):
+    base = CountingEmbeddings()
+    emb = CachedEmbeddings(base, "e5", cache, query_cache_size=2)
+    for text in ("a", "b", "a", "c", "b"):
+        emb.embed_query(text)
+    # "a" reaproveitado; "b" saiu do LRU quando "c" entrou
+    assert [call[1] for call in base.calls] == ["a", "b", "c", "b"]
+    assert (emb.query_hits, emb.query_misses) == (1, 4)
+
+
+def test_get_embedding_cache_is_shared(tmp_path):
+    assert get_embedding_cache(tmp_path / "a.sqlite") is get_embedding_cache(tmp_path / "a.sqlite")
+
+
+def test_embed_queries_batches_misses_and_fills_lru(cache):
+    base = SentenceTransformerEmbeddings()
+    emb = CachedEmbeddings(base, "e5", cache, query_prefix="query: ")
+    emb.embed_query("a")
+    vectors = emb.embed_queries(["a", "bb", "ccc", "bb"])
+    # Uma chamada pública em lote, sem repetir, com o mesmo texto de embed_query
+    assert base.calls[1:] == [["query: bb", "query: ccc"]]
+    emb.embed_query("ccc")                             # já está no LRU
+    assert len(base.calls) == 2
+    assert len(cache) == 0                             # perguntas não vão para o disco
+    assert vectors[1] == vectors[3] == base.embed_query("query: bb")
+
+
+def test_embed_queries_keeps_distinct_query_kwargs(cache):
+    base = SentenceTransformerEmbeddings(query_encode_kwargs={"prompt": "query: "})
+    emb = CachedEmbeddings(base, "e5", cache)
+    assert emb.embed_queries(["x", "yy"]) == [base.embed_query("x"), base.embed_query("yy")]
+    assert emb.embed_queries(["x"])[0] != base.embed_documents(["x"])[0]
+
+
+def test_embed_queries_matches_embed_query_for_models_without_batch_path(cache):
+    base = CountingEmbeddings()
+    emb = CachedEmbeddings(base, "e5", cache)
+    assert emb.embed_queries(["x", "yy"]) == [base.embed_query("x"), base.embed_query("yy")]
+    assert ["yy"] not in base.calls                    # nunca pelo caminho de documento
+
+
+def test_query_prefix_goes_to_the_model_but_not_to_the_lru_key(cache):
+    base = CountingEmbeddings()
+    emb = CachedEmbeddings(base, "e5", cache, query_prefix="query: ")
+    emb.embed_query("qual o prazo?")
+    emb.embed_query("qual o prazo?")
+    assert base.calls == [["query", "query: qual o prazo?"]]
+    assert emb.query_hits == 1
@@ -0,0 +1,67 @@
+import hashlib
+import io
+import json
+
+from core.ingest_cache import IngestCache, save_upload
+
+
+def test_save_upload_is_content_addressed(tmp_path):
+    data = b"%PDF-1.4 " + b"x" * (3 * 1024 * 1024)
+    path1, digest1 = save_upload(io.BytesIO(data), tmp_path)
+    path2, digest2 = save_upload(io.BytesIO(data), tmp_path)
+    assert digest1 == digest2 == hashlib.sha256(data).hexdigest()
+    assert path1 == path2 == tmp_path / f"{digest1}.pdf"
+    assert path1.read_bytes() == data
+    # Nenhum arquivo temporário sobra no diretório
+    assert [p.name for p in tmp_path.iterdir()] == [path1.name]
+
+
+def test_lookup_counts_hits_and_misses(tmp_path):
+    cache = IngestCache(tmp_path / "manifest.sqlite")
+    assert cache.lookup("abc") is None
+    cache.record("abc", "uploaded_docs/abc.pdf", filename="contrato.pdf")
+    entry = cache.lookup("abc")
+    assert entry["doc_id"] == "uploaded_docs/abc.pdf"
+    assert entry["filename"] == "contrato.pdf"
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["documents"] == 1 and stats["hit_rate"] == 0.5
+
+
+def test_manifest_survives_restart(tmp_path):
+    manifest = tmp_path / "sub" / "manifest.sqlite"
+    IngestCache(manifest).record("abc", "doc-abc")
+    reloaded = IngestCache(manifest)
+    assert reloaded.lookup("abc")["doc_id"] == "doc-abc"
+    assert reloaded.find_by_doc_id("doc-abc")["content_hash"] == "abc"
+    # Contadores são por processo, em memória
+    assert IngestCache(manifest).stats() == {"hits": 0, "misses": 0, "documents": 1, "hit_rate": 0.0}
+
+
+def test_lookup_does_not_write_and_workers_share_records(tmp_path):
+    manifest = tmp_path / "manifest.sqlite"
+    worker1, worker2 = IngestCache(manifest), IngestCache(manifest)
+    worker1.record("abc", "doc-abc")
+    worker2.record("def", "doc-def")
+    before = manifest.stat().st_mtime_ns
+    assert worker1.lookup("def")["doc_id"] == "doc-def"
+    assert worker2.lookup("abc")["doc_id"] == "doc-abc"
+    assert manifest.stat().st_mtime_ns == before
+    assert worker1.stats()["documents"] == 2
+
+
+def test_legacy_json_manifest_is_migrated(tmp_path):
+    legacy = tmp_path / "manifest.json"
+    legacy.write_text(json.dumps({
+        "documents": {"abc": {"doc_id": "doc-abc", "indexed_at": "2025-01-01", "namespace": "doc-x"}},
+        "stats": {"hits": 5, "misses": 2},
+    }))
+    cache = IngestCache(tmp_path / "manifest.sqlite")
+    assert cache.lookup("abc") == {"doc_id": "doc-abc", "indexed_at": "2025-01-01", "namespace": "doc-x"}
+    assert not legacy.exists()
+
+
+def test_corrupt_legacy_manifest_starts_empty(tmp_path):
+    (tmp_path / "manifest.json").write_text("{não é json")
+    cache = IngestCache(tmp_path / "manifest.sqlite")
+    assert cache.lookup("abc") is None
@@ -0,0 +1,74 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from core.ingest_pipeline import embed_and_upsert
+
+
+def make_docs(n):
+    return [SimpleNamespace(page_content=f"chunk {i}") for i in range(n)]
+
+
+def embed(texts):
+    return [[float(len(t))] for t in texts]
+
+
+def test_upserts_overlap_and_respect_in_flight_limit():
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+    sent = []
+
+    def upsert(batch, vectors):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.05)
+        with lock:
+            active -= 1
+            sent.extend(doc.page_content for doc in batch)
+
+    start = time.perf_counter()
+    report = embed_and_upsert(make_docs(16), embed, upsert, batch_size=2, workers=4, max_in_flight=3)
+    wall = time.perf_counter() - start
+    assert sorted(sent) == sorted(f"chunk {i}" for i in range(16))
+    assert peak == 3                      # limitado pelos lotes em voo, não pelos workers
+    assert wall < 8 * 0.05                # envios sobrepostos, não em série
+    assert report["chunks"] == 16 and report["upsert_vectors_per_s"] > 0
+
+
+def test_retries_with_backoff_and_reports_progress():
+    attempts = []
+    progress = []
+
+    def flaky(batch, vectors):
+        attempts.append(batch[0].page_content)
+        if attempts.count(batch[0].page_content) == 1:
+            raise ConnectionError("timeout")
+
+    report = embed_and_upsert(
+        make_docs(3), embed, flaky, batch_size=2, workers=1, retries=2, backoff=0.0,
+        progress=lambda stage, **c: progress.append((stage, c)),
+    )
+    assert report["upsert_retries"] == 2
+    assert progress[-1] == ("upserting", {"chunks_upserted": 3, "chunks_total": 3})
+    assert ("embedding", {"chunks_embedded": 3, "chunks_total": 3}) in progress
+
+
+def test_exhausted_retries_stop_production_and_raise():
+    embedded = []
+
+    def tracking_embed(texts):
+        embedded.extend(texts)
+        time.sleep(0.01)
+        return embed(texts)
+
+    def broken(batch, vectors):
+        raise ConnectionError("índice fora do ar")
+
+    with pytest.raises(ConnectionError):
+        embed_and_upsert(make_docs(40), tracking_embed, broken, batch_size=2, workers=1, retries=1, backoff=0.0)
+    assert len(embedded) < 40
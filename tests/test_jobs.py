@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+
+from core.jobs import IngestionQueue, QueueFullError, stage_slot
+
+
+def wait_for(job, status, timeout=2.0):
+    deadline = time.time() + timeout
+    while job.to_dict()["status"] != status:
+        assert time.time() < deadline, job.to_dict()
+        time.sleep(0.01)
+
+
+def test_job_reports_progress_and_completion():
+    q = IngestionQueue(workers=1, max_queued=4)
+
+    def ingest(job, total):
+        for done in range(1, total + 1):
+            job.update("ocr", pages_done=done, pages_total=total)
+
+    job = q.submit(ingest, 3, doc_id="doc-1")
+    q.join()
+    state = job.to_dict()
+    assert state["status"] == "done"
+    assert state["progress"] == {"pages_done": 3, "pages_total": 3}
+    assert state["doc_id"] == "doc-1"
+    assert q.get(job.job_id) is job
+
+
+def test_failed_job_keeps_error():
+    q = IngestionQueue(workers=1, max_queued=4)
+
+    def boom(job):
+        raise ValueError("pdf corrompido")
+
+    job = q.submit(boom)
+    q.join()
+    assert job.to_dict()["status"] == "failed"
+    assert "pdf corrompido" in job.to_dict()["error"]
+
+
+def test_bounded_queue_and_dedup_by_key():
+    release = threading.Event()
+    q = IngestionQueue(workers=1, max_queued=1)
+    running = q.submit(lambda job: release.wait(), key="a")
+    wait_for(running, "running")
+    queued = q.submit(lambda job: None, key="b")
+    assert q.submit(lambda job: None, key="b") is queued  # mesmo conteúdo → mesmo job
+    with pytest.raises(QueueFullError):
+        q.submit(lambda job: None, key="c")
+    release.set()
+    q.join()
+    assert queued.to_dict()["status"] == "done"
+
+
+def test_unknown_stage_is_unbounded():
+    with stage_slot("inexistente"):
+        with stage_slot("inexistente"):
+            pass
@@ -0,0 +1,236 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from langchain.chains.combine_documents.stuff import create_stuff_documents_chain
+from langchain_core.documents import Document
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+
+from core.graph_wrapper import GraphChainWrapper
+from core.langgraph_pipeline import LangGraphRAGPipeline, message_text
+from core.retrieval_cache import RetrievalCache
+
+
+class FakeRetriever:
+    def __init__(self, docs):
+        self.docs = docs
+        self.calls = 0
+
+    def invoke(self, query, config=None):
+        self.calls += 1
+        return self.docs
+
+    async def ainvoke(self, query, config=None):
+        return self.invoke(query, config)
+
+
+def keep_first(query, docs, top_n=1):
+    return [(doc, 1.0) for doc in docs[:top_n]]
+
+
+def make_pipeline(answer, docs=None, use_rerank=False):
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content=answer)]))
+    prompt = ChatPromptTemplate.from_template("{context}\n\nPergunta: {input}")
+    retriever = FakeRetriever(docs or [Document(page_content="Art. 1º O prazo é de 12 meses.")])
+    base = SimpleNamespace(retriever=retriever, document_chain=create_stuff_documents_chain(llm, prompt))
+    return LangGraphRAGPipeline(base, use_rerank=use_rerank, reranker=keep_first), retriever
+
+
+def test_invoke_generates_from_retrieved_documents_only():
+    pipeline, retriever = make_pipeline("O prazo é de 12 meses.")
+    result = pipeline.invoke({"input": "Qual o prazo?"})
+    assert result["answer"] == "O prazo é de 12 meses."
+    assert retriever.calls == 1  # geração não recupera de novo
+    assert result["metadata"]["retrieve_count"] == 1
+    assert result["metadata"]["generation_complete"] is True
+
+
+def test_stream_emits_tokens_then_final_event():
+    pipeline, _ = make_pipeline("O prazo é de 12 meses.", use_rerank=True)
+    events = list(pipeline.stream({"input": "Qual o prazo?"}))
+    tokens = [e["content"] for e in events if e["type"] == "token"]
+    final = events[-1]
+    assert len(tokens) > 1
+    assert "".join(tokens) == "O prazo é de 12 meses."
+    assert final["type"] == "final"
+    assert final["answer"] == "O prazo é de 12 meses."
+    assert final["source_documents"][0].page_content.startswith("Art. 1º")
+    assert final["metadata"]["ttft"] is not None
+    assert final["metadata"]["ttft"] <= final["metadata"]["total_time"]
+
+
+
+def test_wrapper_stream_passes_tokens_and_annotates_final_event():
+    def stream(inputs):
+        yield {"type": "token", "content": "res"}
+        yield {"type": "final", "answer": "resposta", "source_documents": []}
+
+    wrapper = GraphChainWrapper(SimpleNamespace(stream=stream), use_langgraph=False)
+    events = list(wrapper.stream({"input": "q"}))
+    assert [e["type"] for e in events] == ["token", "final"]
+    assert events[-1]["metadata"] == {"using_langgraph": False}
+
+
+def test_wrapper_delegates_unknown_attributes_to_active_chain():
+    chain = SimpleNamespace(invoke=lambda inputs: {"answer": f"resposta {inputs['input']}"}, retriever="r")
+    wrapper = GraphChainWrapper(chain, use_langgraph=False)
+    assert wrapper.retriever == "r"
+    assert wrapper({"input": "x"})["answer"] == "resposta x"
+
+def test_rerank_node_trims_context_and_records_latency():
+    docs = [Document(page_content=f"chunk {i}") for i in range(4)]
+    pipeline, _ = make_pipeline("Resposta.", docs=docs, use_rerank=True)
+    result = pipeline.invoke({"input": "Pergunta?"})
+    assert [d.page_content for d in result["source_documents"]] == ["chunk 0"]
+    assert result["source_documents"][0].metadata["rerank_score"] == 1.0
+    assert "rerank_score" not in docs[0].metadata
+    assert result["metadata"]["rerank_kept"] == 1
+    assert result["metadata"]["rerank_latency"] >= 0
+
+
+def test_rerank_keeps_as_many_chunks_as_the_plan_retrieves():
+    docs = [Document(page_content=f"chunk {i}") for i in range(6)]
+    pipeline, _ = make_pipeline("Resumo.", docs=docs, use_rerank=True)
+    plan = {"strategy": "extraction", "retrieval": {"k": 4}}
+    result = pipeline.invoke({"input": "Qual o prazo?", "plan": plan})
+    assert result["metadata"]["rerank_kept"] == 4
+
+
+def test_rerank_reduces_summarization_below_k():
+    from core.config import STRATEGY_PROFILES
+    profile = STRATEGY_PROFILES["summarization"]
+    assert profile["rerank_top_n"] < profile["k"]
+    docs = [Document(page_content=f"chunk {i}") for i in range(6)]
+    pipeline, _ = make_pipeline("Resumo.", docs=docs, use_rerank=True)
+    plan = {"strategy": "summarization", "retrieval": {"k": 6, "rerank_top_n": 3}}
+    result = pipeline.invoke({"input": "Resuma o contrato", "plan": plan})
+    assert result["metadata"]["rerank_kept"] == 3
+
+
+def test_retrieval_cache_skips_retriever_for_repeated_query():
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content="a"), AIMessage(content="b")]))
+    prompt = ChatPromptTemplate.from_template("{context}\n\nPergunta: {input}")
+    retriever = FakeRetriever([Document(page_content="Art. 1º")])
+    base = SimpleNamespace(retriever=retriever, document_chain=create_stuff_documents_chain(llm, prompt))
+    pipeline = LangGraphRAGPipeline(base, use_rerank=False, retrieval_cache=RetrievalCache(), scope="doc")
+    first = pipeline.invoke({"input": "Qual o prazo?"})
+    second = pipeline.invoke({"input": "qual o prazo"})
+    assert retriever.calls == 1
+    assert first["metadata"]["retrieval_cache"]["hit"] is False
+    assert second["metadata"]["retrieval_cache"]["hit"] is True
+    assert second["metadata"]["retrieval_cache"]["hits"] == 1
+    assert second["source_documents"][0].page_content == "Art. 1º"
+
+
+def test_pack_node_runs_after_rerank_with_chain_packer():
+    docs = [Document(page_content=f"chunk {i}") for i in range(3)]
+    pipeline, _ = make_pipeline("Resposta.", docs=docs)
+    seen = []
+
+    def packer(documents):
+        seen.append(list(documents))
+        return documents[:2], {"tokens_used": 4}
+
+    pipeline.existing_chain.packer = packer
+    pipeline = LangGraphRAGPipeline(pipeline.existing_chain, use_rerank=False)
+    result = pipeline.invoke({"input": "Pergunta?"})
+    assert seen == [docs]
+    assert len(result["source_documents"]) == 2
+    assert result["metadata"]["context_packing"] == {"tokens_used": 4}
+
+
+def test_message_text_handles_content_blocks():
+    assert message_text(SimpleNamespace(content="abc")) == "abc"
+    assert message_text(SimpleNamespace(content=[{"type": "text", "text": "a"}, {"type": "text", "text": "b"}])) == "ab"
+    assert message_text(SimpleNamespace(content=None)) == ""
+
+
+def test_history_goes_to_generation_not_to_retrieval():
+    seen = []
+
+    class Retriever:
+        def invoke(self, query, config=None):
+            seen.append(query)
+            return [Document(page_content="Art. 1º")]
+
+    prompts = []
+    generator = SimpleNamespace(invoke=lambda inputs: prompts.append(inputs["input"]) or "Ok.")
+    pipeline = LangGraphRAGPipeline(SimpleNamespace(retriever=Retriever(), document_chain=generator), use_rerank=False)
+    pipeline.invoke({"input": "E o prazo?", "generation_input": "Contexto anterior: ...\n\nPergunta atual: E o prazo?"})
+    assert seen == ["E o prazo?"]
+    assert prompts[0].startswith("Contexto anterior:")
+
+
+def test_ainvoke_and_astream_match_sync_results():
+    pipeline, retriever = make_pipeline("O prazo é de 12 meses.", use_rerank=True)
+    result = asyncio.run(pipeline.ainvoke({"input": "Qual o prazo?"}))
+    assert result["answer"] == "O prazo é de 12 meses."
+    assert result["metadata"]["rerank_applied"] is True
+
+    pipeline, _ = make_pipeline("O prazo é de 12 meses.")
+
+    async def collect():
+        return [event async for event in pipeline.astream({"input": "Qual o prazo?"})]
+
+    events = asyncio.run(collect())
+    assert "".join(e["content"] for e in events if e["type"] == "token") == "O prazo é de 12 meses."
+    assert events[-1]["type"] == "final" and events[-1]["metadata"]["ttft"] is not None
+
+
+
+class AsyncChain:
+    def __init__(self):
+        self.calls = []
+
+    async def ainvoke(self, inputs):
+        self.calls.append(inputs["input"])
+        return {"answer": f"resposta {inputs['input']}", "source_documents": []}
+
+    async def astream(self, inputs):
+        yield {"type": "token", "content": "res"}
+        yield {"type": "final", **await self.ainvoke(inputs)}
+
+
+def test_wrapper_async_paths_use_answer_cache_and_record_stats():
+    records, cache = [], {}
+    stats = SimpleNamespace(record=lambda strategy, latency, result: records.append(result["answer"]))
+    answer_cache = SimpleNamespace(
+        lookup=lambda doc_id, question: (cache.get(question), None),
+        store=lambda doc_id, question, result, vector: cache.setdefault(
+            question, {**result, "metadata": {"answer_cache": {"hit": True}}},
+        ),
+    )
+    chain = AsyncChain()
+    wrapper = GraphChainWrapper(
+        chain, use_langgraph=False, doc_id="doc", answer_cache=answer_cache, strategy_stats=stats,
+    )
+
+    async def drain(inputs):
+        return [event["type"] async for event in wrapper.astream(inputs)]
+
+    assert asyncio.run(wrapper.ainvoke({"input": "a"}))["metadata"]["answer_cache"] == {"hit": False}
+    assert asyncio.run(wrapper.ainvoke({"input": "a"}))["metadata"]["answer_cache"] == {"hit": True}
+    assert asyncio.run(drain({"input": "b"})) == ["token", "final"]
+    assert asyncio.run(drain({"input": "b"})) == ["final"]
+    assert chain.calls == ["a", "b"]
+    assert records == ["resposta a", "resposta b"]
+
+def test_concurrent_ainvoke_does_not_serialize_on_llm_latency():
+    async def slow_llm(inputs):
+        await asyncio.sleep(0.2)
+        return "Ok."
+
+    generator = RunnableLambda(lambda inputs: "Ok.", afunc=slow_llm)
+    retriever = FakeRetriever([Document(page_content="Art. 1º")])
+    pipeline = LangGraphRAGPipeline(SimpleNamespace(retriever=retriever, document_chain=generator), use_rerank=False)
+
+    async def burst():
+        return await asyncio.gather(*(pipeline.ainvoke({"input": f"pergunta {i}"}) for i in range(50)))
+
+    start = time.perf_counter()
+    results = asyncio.run(burst())
+    assert all(r["answer"] == "Ok." for r in results)
+    assert time.perf_counter() - start < 2.0      # sequencial levaria 10 s
@@ -1,7 +1,11 @@
+import importlib
 import sys
 import types
+import numpy as np
 import pytest
 
+from core import models  # sem dependências: o layout_ocr testado usa o registro real
+
 # Helper to create dummy modules
 def stub_module(name, attrs=None):
     m = types.ModuleType(name)
@@ -10,10 +14,37 @@ def stub_module(name, attrs=None):
         setattr(m, k, v)
     return m
 
+def import_with_stubs(name, stubs):
+    """
+    Importa `name` com os stubs em sys.modules e restaura o estado anterior.
+    O módulo importado guarda referências aos stubs; os outros arquivos de
+    teste continuam vendo os módulos reais.
+    """
+    saved = {key: sys.modules.get(key) for key in stubs}
+    loaded = set(sys.modules)
+    sys.modules.update(stubs)
+    try:
+        return importlib.import_module(name)
+    finally:
+        package = sys.modules['core']
+        for key in set(sys.modules) - loaded:
+            if key.startswith('core.') and key not in stubs:  # importado sobre os stubs
+                module = sys.modules.pop(key)
+                attr = key.split('.', 1)[1]
+                if package.__dict__.get(attr) is module:
+                    delattr(package, attr)
+        for key, module in saved.items():
+            if module is None:
+                sys.modules.pop(key, None)
+            else:
+                sys.modules[key] = module
+
+STUBS = {}
+
 # Stub heavy external dependencies
-sys.modules['streamlit'] = stub_module('streamlit', {'info': lambda msg: None})
-sys.modules['langsmith'] = stub_module('langsmith', {'traceable': lambda name=None, **kw: (lambda f: f)})
-sys.modules['transformers'] = stub_module('transformers', {
+STUBS['streamlit'] = stub_module('streamlit', {'info': lambda msg: None})
+STUBS['langsmith'] = stub_module('langsmith', {'traceable': lambda name=None, **kw: (lambda f: f)})
+STUBS['transformers'] = stub_module('transformers', {
     'LayoutLMv2Processor': types.SimpleNamespace(
         from_pretrained=lambda x: types.SimpleNamespace(
             __call__=lambda *args, **kwargs: {'input_ids': [], 'attention_mask': []}
@@ -21,55 +52,69 @@ sys.modules['transformers'] = stub_module('transformers', {
     )
 })
 # Stub PIL.Image for type annotations
-sys.modules['PIL'] = stub_module('PIL')
+STUBS['PIL'] = stub_module('PIL')
 image_mod = stub_module('PIL.Image', {'Image': type('ImageClass', (), {})})
-sys.modules['PIL.Image'] = image_mod
+STUBS['PIL.Image'] = image_mod
 # Ensure from PIL import Image returns our stub
-setattr(sys.modules['PIL'], 'Image', image_mod)
+setattr(STUBS['PIL'], 'Image', image_mod)
 
-sys.modules['pytesseract'] = stub_module('pytesseract', {
+STUBS['pytesseract'] = stub_module('pytesseract', {
     'image_to_data': lambda img, output_type, lang: {
         'text': [], 'left': [], 'top': [], 'width': [], 'height': [], 'line_num': []
     },
     'Output': types.SimpleNamespace(DICT=None)
 })
-sys.modules['pdf2image'] = stub_module('pdf2image', {'convert_from_path': lambda fp, dpi: []})
-sys.modules['sentence_transformers'] = stub_module('sentence_transformers', {
+STUBS['pdf2image'] = stub_module('pdf2image', {
+    'convert_from_path': lambda fp, dpi, **kwargs: [],
+    'pdfinfo_from_path': lambda fp: {'Pages': 0},
+})
+STUBS['sentence_transformers'] = stub_module('sentence_transformers', {
     'SentenceTransformer': type('SentenceTransformer', (), {
         '__init__': lambda self, model: None,
-        'encode': lambda self, text, convert_to_tensor: text
+        # Vetores idênticos e normalizados → similaridade 1.0
+        'encode': lambda self, texts, **kwargs: np.full((len(texts), 4), 0.5)
     })
 })
-sys.modules['sentence_transformers.util'] = stub_module('sentence_transformers.util', {
+STUBS['sentence_transformers.util'] = stub_module('sentence_transformers.util', {
     'cos_sim': lambda e1, e2: types.SimpleNamespace(item=lambda: 1.0)
 })
-sys.modules['langchain_core.documents'] = stub_module('langchain_core.documents', {
+STUBS['langchain_core.documents'] = stub_module('langchain_core.documents', {
     'Document': lambda page_content, metadata: types.SimpleNamespace(
         page_content=page_content,
         metadata=metadata
     )
 })
 # Utils stubs
-sys.modules['core.utils'] = stub_module('core.utils', {
+STUBS['core.utils'] = stub_module('core.utils', {
     'split_text_by_token_limit': lambda s, limit: [s],
     'adjust_chunks_to_token_limit': lambda docs, limit: docs
 })
-sys.modules['core.config'] = stub_module('core.config', {'EMBEDDING_TOKEN_LIMIT': 1000})
-sys.modules['core.utils'] = stub_module('core.utils', {
-    'split_text_by_token_limit': lambda s, limit: [s],
-    'adjust_chunks_to_token_limit': lambda docs, limit: docs
+STUBS['core.config'] = stub_module('core.config', {
+    'EMBEDDING_TOKEN_LIMIT': 1000,
+    'SEMANTIC_BATCH_SIZE': 8,
+    'SEMANTIC_MODEL_NAME': 'semantic',
+    'LAYOUT_MODEL_NAME': 'layout',
+    'OCR_LAYOUTLM_ENCODING': False,
+    'OCR_DPI': 300,
+    'OCR_WORKERS': 1,
+    'OCR_PAGE_WINDOW': 2,
+    'OCR_PENDING_PER_WORKER': 2,
 })
-sys.modules['core.config'] = stub_module('core.config', {'EMBEDDING_TOKEN_LIMIT': 1000})
 
 # Now import functions under test
-from core.layout_ocr import (
-    split_legal_chunks_regex,
-    adaptive_similarity_threshold,
-    group_similar_chunks,
-    layout_ocr_from_pdf,
-    image_to_layout_chunks
-)
-from langchain_core.documents import Document as LCDocument
+lo = import_with_stubs('core.layout_ocr', STUBS)
+split_legal_chunks_regex = lo.split_legal_chunks_regex
+adaptive_similarity_threshold = lo.adaptive_similarity_threshold
+group_similar_chunks = lo.group_similar_chunks
+layout_ocr_from_pdf = lo.layout_ocr_from_pdf
+image_to_layout_chunks = lo.image_to_layout_chunks
+LCDocument = lo.LCDocument
+
+@pytest.fixture(autouse=True)
+def stubbed_modules(monkeypatch):
+    """Reinstala os stubs durante cada teste (modelos carregados sob demanda, reload)."""
+    for name, module in {**STUBS, 'core.layout_ocr': lo}.items():
+        monkeypatch.setitem(sys.modules, name, module)
 
 # Tests for split_legal_chunks_regex
 ... # previous tests ...
@@ -88,12 +133,53 @@ def test_group_similar_chunks():
     assert len(result) == 1
     assert "a" in result[0].page_content and "b" in result[0].page_content
 
+def test_group_similar_chunks_matches_pairwise_greedy(monkeypatch):
+    vectors = np.array([[1.0, 0.0], [0.9, 0.436], [0.0, 1.0], [0.1, 0.995], [1.0, 0.0]])
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    calls = []
+
+    class FakeModel:
+        def encode(self, texts, **kwargs):
+            calls.append(len(texts))
+            return vectors[:len(texts)]
+
+    monkeypatch.setattr(lo, 'get_semantic_model', lambda: FakeModel())
+    chunks = [LCDocument(page_content=t, metadata={'i': n}) for n, t in enumerate("abcde")]
+
+    # Referência: laço original, par a par, comparando com o primeiro chunk do grupo
+    expected, current, anchor = [], "a", 0
+    for i in range(1, 5):
+        if float(vectors[anchor] @ vectors[i]) >= lo.adaptive_similarity_threshold(current):
+            current += "\n" + "abcde"[i]
+        else:
+            expected.append(current)
+            current, anchor = "abcde"[i], i
+    expected.append(current)
+
+    result = group_similar_chunks(chunks)
+    assert [d.page_content for d in result] == expected
+    assert calls == [5]  # um único encode em lote
+
+def test_models_are_not_loaded_at_import():
+    models.unload_models()
+    importlib.reload(lo)
+    assert lo.LAYOUT_PROCESSOR not in models.loaded_models()
+    assert lo.SEMANTIC_MODEL not in models.loaded_models()
+
+def test_image_to_layout_chunks_skips_layoutlm_encoding(monkeypatch):
+    ocr = {'text': ['Art.', '1º', 'texto', 'longo', 'o', 'bastante'], 'left': [0] * 6, 'top': [0] * 6,
+           'width': [1] * 6, 'height': [1] * 6, 'line_num': [1] * 6}
+    monkeypatch.setattr(lo.pytesseract, 'image_to_data', lambda img, output_type, lang: ocr)
+    monkeypatch.setattr(lo, 'get_layout_processor', lambda: pytest.fail("LayoutLMv2 não deveria carregar"))
+    docs = lo.image_to_layout_chunks(types.SimpleNamespace(size=(100, 100)), page_number=3)
+    assert docs and docs[0].metadata == {'page': 3, 'line': 1}
+
 # Tests for layout_ocr_from_pdf pipeline
 def test_layout_ocr_from_pdf(monkeypatch):
-    import core.layout_ocr as lo
     # Stub convert_from_path imported in module to return one fake image
     fake_image = types.SimpleNamespace(size=(100, 100))
-    monkeypatch.setattr(lo, 'convert_from_path', lambda fp, dpi: [fake_image])
+    monkeypatch.setattr(lo, 'pdfinfo_from_path', lambda fp: {'Pages': 1})
+    monkeypatch.setattr(lo, 'convert_from_path', lambda fp, dpi, first_page, last_page: [fake_image])
     # Stub image_to_layout_chunks and grouping on the module
     monkeypatch.setattr(lo, 'image_to_layout_chunks', lambda img, page_number: [LCDocument(page_content="x", metadata={})])
     monkeypatch.setattr(lo, 'group_similar_chunks', lambda docs: docs)
@@ -103,3 +189,40 @@ def test_layout_ocr_from_pdf(monkeypatch):
     assert isinstance(result, list)
     assert len(result) == 1
     assert result[0].page_content == "x"
+
+def test_layout_ocr_from_pdf_parallel_windows_keep_page_order(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    rasterized = []
+
+    def fake_convert(fp, dpi, first_page, last_page):
+        rasterized.append((first_page, last_page))
+        return [types.SimpleNamespace(page=n) for n in range(first_page, last_page + 1)]
+
+    monkeypatch.setattr(lo, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(lo, 'pdfinfo_from_path', lambda fp: {'Pages': 7})
+    monkeypatch.setattr(lo, 'convert_from_path', fake_convert)
+    monkeypatch.setattr(lo, 'image_to_layout_chunks',
+                        lambda img, page_number: [LCDocument(page_content=f"p{page_number}", metadata={})])
+    monkeypatch.setattr(lo, 'group_similar_chunks', lambda docs: docs)
+    monkeypatch.setattr(lo, 'adjust_chunks_to_token_limit', lambda docs, limit: docs)
+
+    result = lo.layout_ocr_from_pdf("dummy.pdf", workers=3, page_window=2)
+    assert [d.page_content for d in result] == [f"p{n}" for n in range(1, 8)]
+    # Nunca rasteriza o PDF inteiro de uma vez
+    assert sorted(rasterized) == [(1, 2), (3, 4), (5, 6), (7, 7)]
+
+def test_layout_ocr_from_pdf_pending_bound_follows_workers(monkeypatch):
+    calls = []
+
+    def fake_parallel(fp, windows, dpi, workers, max_pending, on_page):
+        calls.append((workers, max_pending))
+        return {}
+
+    monkeypatch.setattr(lo, 'pdfinfo_from_path', lambda fp: {'Pages': 8})
+    monkeypatch.setattr(lo, '_ocr_windows_parallel', fake_parallel)
+    monkeypatch.setattr(lo, 'group_similar_chunks', lambda docs: docs)
+    monkeypatch.setattr(lo, 'adjust_chunks_to_token_limit', lambda docs, limit: docs)
+
+    lo.layout_ocr_from_pdf("dummy.pdf", workers=3, page_window=2)
+    lo.layout_ocr_from_pdf("dummy.pdf", workers=8, page_window=2)
+    assert calls == [(3, 6), (8, 16)]
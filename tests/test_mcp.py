@@ -90,3 +90,135 @@ def test_global_singleton():
     assert isinstance(mcp_instance, MCPSystem)
     # Should have deque attribute with maxlen 50
     assert hasattr(mcp_instance, 'memory') and mcp_instance.memory.maxlen == 50
+
+def test_sessions_are_isolated_on_shared_store():
+    from core.mcp_store import InMemoryStore
+    store = InMemoryStore(memory_size=3, max_sessions=10)
+    a = MCPSystem(store=store, session_id="a")
+    b = a.session("b")
+    a.remember("Pergunta de A", "Resposta de A")
+    assert b.get_context() == ""
+    assert a.session("a").size() == 1
+    assert "Pergunta de A" in a.get_context()
+
+def test_in_memory_store_evicts_least_recent_session():
+    from core.mcp_store import InMemoryStore
+    store = InMemoryStore(memory_size=2, max_sessions=2)
+    store.append("s1", {"question": "1"})
+    store.append("s2", {"question": "2"})
+    store.recent("s1", 1)                      # s1 volta a ser a mais recente
+    store.append("s3", {"question": "3"})
+    assert store.count("s2") == 0
+    assert store.count("s1") == 1 and store.count("s3") == 1
+    assert store.stats()["evictions"] == 1
+
+def test_recent_returns_last_n_in_order():
+    from core.mcp_store import InMemoryStore
+    store = InMemoryStore(memory_size=5)
+    for i in range(7):
+        store.append("s", {"question": str(i)})
+    assert [t["question"] for t in store.recent("s", 3)] == ["4", "5", "6"]
+    assert store.count("s") == 5
+
+def test_sqlite_store_shared_between_instances(tmp_path):
+    from core.mcp_store import SQLiteStore
+    path = tmp_path / "mcp.sqlite"
+    worker1 = MCPSystem(store=SQLiteStore(path, memory_size=3), session_id="doc")
+    worker2 = MCPSystem(store=SQLiteStore(path, memory_size=3), session_id="doc")
+    for i in range(5):
+        worker1.remember(f"Q{i}", f"A{i}")
+    recent = worker2.get_serializable_memory(last_n=10)
+    assert [item["question"] for item in recent] == ["Q2", "Q3", "Q4"]
+    assert worker2.size() == 3
+    assert worker2.session("outra").size() == 0
+    worker2.forget()
+    assert worker1.get_context() == ""
+
+def test_sqlite_store_bounds_every_session(tmp_path):
+    from core.mcp_store import SQLiteStore
+    store = SQLiteStore(tmp_path / "mcp.sqlite", memory_size=2)
+    for i in range(5):
+        for session in ("a", "b", "c"):
+            store.append(session, {"question": f"{session}{i}"})
+    rows = store._conn.execute("SELECT session, COUNT(*) FROM mcp_turns GROUP BY session").fetchall()
+    assert dict(rows) == {"a": 2, "b": 2, "c": 2}
+    assert [t["question"] for t in store.recent("b", 5)] == ["b3", "b4"]
+
+def test_sqlite_store_evicts_idle_and_excess_sessions(tmp_path):
+    import time
+    from core.mcp_store import SQLiteStore
+    store = SQLiteStore(tmp_path / "mcp.sqlite", memory_size=5, max_sessions=2, idle_ttl=60, evict_interval=0)
+    for session in ("s1", "s2", "s3"):
+        store.append(session, {"question": session})
+        time.sleep(0.01)
+    # Acima de max_sessions: a sessão escrita há mais tempo sai
+    assert [store.count(s) for s in ("s1", "s2", "s3")] == [0, 1, 1]
+    store.evict_idle(now=time.time() + 61)
+    assert store.stats()["sessions"] == 0 and store.count("s3") == 0
+    assert store.stats()["evictions"] == 3
+
+def test_in_memory_store_evicts_idle_sessions():
+    import time
+    from core.mcp_store import InMemoryStore
+    store = InMemoryStore(memory_size=5, max_sessions=10, idle_ttl=60)
+    for session in ("s1", "s2", "s3"):
+        store.append(session, {"question": session})
+    store.recent("s1", 1)                       # s1 volta a ser a mais recente
+    store.evict_idle(now=time.time() + 30)
+    assert store.stats()["sessions"] == 3
+    store.evict_idle(now=time.time() + 61)
+    assert store.stats() == {"backend": "memory", "sessions": 0, "evictions": 3}
+
+def _topic_embedder(question):
+    # Um eixo por assunto: perguntas do mesmo assunto têm cosseno 1
+    topics = ["multa", "prazo", "foro"]
+    return [1.0 if t in question.lower() else 0.0 for t in topics] + [0.1]
+
+def test_context_pulls_relevant_turns_not_just_recent():
+    mcp = MCPSystem(memory_size=10, embedder=_topic_embedder)
+    mcp.remember("Qual a multa rescisória?", "10% do contrato")
+    mcp.remember("Qual o foro?", "Comarca de São Paulo")
+    mcp.remember("Quem assina o contrato?", "As partes")
+    for i in range(3):
+        mcp.remember(f"Qual o prazo {i}?", "12 meses")
+    context = mcp.get_context(question="E a multa, pode ser reduzida?")
+    assert "Qual a multa rescisória?" in context       # relevante, mesmo antigo
+    assert "Qual o prazo 2?" in context                # turno mais recente sempre entra
+    assert "foro" not in context and "prazo 0" not in context
+    # Ordem cronológica
+    assert context.index("multa rescisória") < context.index("prazo 2")
+
+def test_context_respects_token_budget():
+    mcp = MCPSystem(memory_size=10, token_counter=lambda texts: [len(t.split()) for t in texts])
+    mcp.remember("Q1", "A " * 50)
+    mcp.remember("Q2", "curta")
+    turns = mcp.relevant_turns(n=3, budget=10)
+    assert [t["question"] for t in turns] == ["Q2"]
+
+def test_prepare_inputs_keeps_search_query_short():
+    mcp = MCPSystem(memory_size=5)
+    assert mcp.prepare_inputs("Pergunta") == {"input": "Pergunta", "generation_input": "Pergunta"}
+    mcp.remember("Q1", "A1")
+    inputs = mcp.prepare_inputs("Nova pergunta")
+    assert inputs["input"] == "Nova pergunta"
+    assert inputs["generation_input"].startswith("Contexto anterior:")
+
+def test_comparison_queries_only_split_explicit_markers():
+    from core.mcp import comparison_queries
+    assert comparison_queries("Qual a diferença entre a cláusula 5 e a cláusula 7?") == ["a cláusula 5", "a cláusula 7"]
+    assert comparison_queries("Me ajude a comparar a multa com o aviso prévio") == ["a multa", "o aviso prévio"]
+    assert comparison_queries("Comparar multa vs. juros vs correção") == ["multa", "juros", "correção"]
+    assert comparison_queries("Aluguel versus condomínio, quem paga?") == ["Aluguel", "condomínio, quem paga"]
+
+def test_ordinary_questions_are_not_split():
+    from core.mcp import comparison_queries
+    for question in (
+        "qual a multa do contrato com a empresa X e o prazo",
+        "Quais as obrigações do locador e do locatário, e as penalidades?",
+        "O contrato com a empresa X pode ser rescindido ou renovado?",
+        "Quero comparar o contrato",                       # só um lado
+        "Qual a diferença de prazo?",                      # sem "entre A e B"
+    ):
+        assert comparison_queries(question) == [], question
+    plan = MCPSystem().plan("qual a multa do contrato com a empresa X e o prazo")
+    assert "queries" not in plan or plan["queries"] == []
@@ -0,0 +1,49 @@
+import threading
+import pytest
+
+from core import models
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    models.unload_models()
+    yield
+    models.unload_models()
+
+
+def test_model_loaded_once_on_first_use():
+    calls = []
+    models.register_model("fake", lambda: calls.append(1) or object())
+    assert "fake" not in models.loaded_models()
+    first = models.get_model("fake")
+    assert models.get_model("fake") is first
+    assert calls == [1]
+    assert "fake" in models.loaded_models()
+
+
+def test_concurrent_first_use_loads_once():
+    calls = []
+    barrier = threading.Barrier(8)
+    models.register_model("slow", lambda: calls.append(1) or object())
+
+    def worker(out):
+        barrier.wait()
+        out.append(models.get_model("slow"))
+
+    results = []
+    threads = [threading.Thread(target=worker, args=(results,)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == [1]
+    assert len({id(r) for r in results}) == 1
+
+
+def test_preload_and_unknown_model():
+    models.register_model("a", object)
+    models.register_model("b", object)
+    loaded = models.preload_models(["a"])
+    assert set(loaded) == {"a"}
+    with pytest.raises(KeyError):
+        models.get_model("inexistente")
@@ -1,6 +1,12 @@
+import asyncio
+import time
 import sys, types
+import contextlib
+import importlib
 import pytest
 
+import core.config as real_config
+
 # Helper to create dummy modules
 def stub_module(name, attrs=None):
     m = types.ModuleType(name)
@@ -9,40 +15,67 @@ def stub_module(name, attrs=None):
         setattr(m, k, v)
     return m
 
+def import_with_stubs(name, stubs):
+    """
+    Importa `name` com os stubs em sys.modules e restaura o estado anterior.
+    O módulo importado guarda referências aos stubs; os outros arquivos de
+    teste continuam vendo os módulos reais.
+    """
+    saved = {key: sys.modules.get(key) for key in stubs}
+    loaded = set(sys.modules)
+    sys.modules.update(stubs)
+    try:
+        return importlib.import_module(name)
+    finally:
+        package = sys.modules['core']
+        for key in set(sys.modules) - loaded:
+            if key.startswith('core.') and key not in stubs:  # importado sobre os stubs
+                module = sys.modules.pop(key)
+                attr = key.split('.', 1)[1]
+                if package.__dict__.get(attr) is module:
+                    delattr(package, attr)
+        for key, module in saved.items():
+            if module is None:
+                sys.modules.pop(key, None)
+            else:
+                sys.modules[key] = module
+
+STUBS = {}
+
 # Stub heavy external modules before importing rag_pipeline
-sys.modules['streamlit'] = stub_module('streamlit')
-sys.modules['streamlit.delta_generator'] = stub_module('streamlit.delta_generator')
-sys.modules['streamlit.cursor'] = stub_module('streamlit.cursor')
-sys.modules['streamlit.runtime'] = stub_module('streamlit.runtime')
-sys.modules['streamlit.runtime.runtime'] = stub_module('streamlit.runtime.runtime')
-sys.modules['streamlit.proto'] = stub_module('streamlit.proto')
-sys.modules['streamlit.proto.BackMsg_pb2'] = stub_module('streamlit.proto.BackMsg_pb2')
-
-sys.modules['langchain_huggingface'] = stub_module('langchain_huggingface', {'HuggingFaceEmbeddings': type('HuggingFaceEmbeddings', (), {'__init__': lambda self, model_name: None})})
-sys.modules['langchain_core.vectorstores'] = stub_module('langchain_core.vectorstores', {'VectorStore': type('VectorStore', (), {})})
-sys.modules['langchain_community.vectorstores'] = stub_module('langchain_community.vectorstores', {'Pinecone': type('PineconeLang', (), {'from_documents': staticmethod(lambda *args, **kwargs: None)})})
-sys.modules['pinecone'] = stub_module('pinecone', {'Pinecone': type('Pinecone', (), {'__init__': lambda self, api_key: None, 'list_indexes': lambda self: types.SimpleNamespace(names=[])})})
-sys.modules['langchain_core.documents'] = stub_module('langchain_core.documents', {'Document': type('LCDocument', (), {})})
-sys.modules['langchain_anthropic'] = stub_module('langchain_anthropic', {'ChatAnthropic': type('ChatAnthropic', (), {'__init__': lambda self, *args, **kwargs: None})})
-sys.modules['langchain_core.prompts'] = stub_module('langchain_core.prompts', {'ChatPromptTemplate': type('ChatPromptTemplate', (), {'from_template': staticmethod(lambda t: None)})})
+STUBS['streamlit'] = stub_module('streamlit')
+STUBS['streamlit.delta_generator'] = stub_module('streamlit.delta_generator')
+STUBS['streamlit.cursor'] = stub_module('streamlit.cursor')
+STUBS['streamlit.runtime'] = stub_module('streamlit.runtime')
+STUBS['streamlit.runtime.runtime'] = stub_module('streamlit.runtime.runtime')
+STUBS['streamlit.proto'] = stub_module('streamlit.proto')
+STUBS['streamlit.proto.BackMsg_pb2'] = stub_module('streamlit.proto.BackMsg_pb2')
+
+STUBS['langchain_huggingface'] = stub_module('langchain_huggingface', {'HuggingFaceEmbeddings': type('HuggingFaceEmbeddings', (), {'__init__': lambda self, model_name: None})})
+STUBS['langchain_core.embeddings'] = stub_module('langchain_core.embeddings', {'Embeddings': type('Embeddings', (), {})})
+STUBS['langchain_core.vectorstores'] = stub_module('langchain_core.vectorstores', {'VectorStore': type('VectorStore', (), {})})
+STUBS['pinecone'] = stub_module('pinecone', {'Pinecone': type('Pinecone', (), {'__init__': lambda self, api_key: None, 'list_indexes': lambda self: types.SimpleNamespace(names=[])})})
+STUBS['langchain_core.documents'] = stub_module('langchain_core.documents', {'Document': type('LCDocument', (), {})})
+STUBS['langchain_anthropic'] = stub_module('langchain_anthropic', {'ChatAnthropic': type('ChatAnthropic', (), {'__init__': lambda self, *args, **kwargs: None})})
+STUBS['langchain_core.prompts'] = stub_module('langchain_core.prompts', {'ChatPromptTemplate': type('ChatPromptTemplate', (), {'from_template': staticmethod(lambda t: None)})})
 
 # Chain modules
 tmp = stub_module('langchain.chains.combine_documents.stuff', {'create_stuff_documents_chain': lambda *args, **kwargs: None})
-sys.modules['langchain.chains.combine_documents.stuff'] = tmp
-sys.modules['langchain.chains.retrieval'] = stub_module('langchain.chains.retrieval', {'create_retrieval_chain': lambda *args, **kwargs: None})
+STUBS['langchain.chains.combine_documents.stuff'] = tmp
+STUBS['langchain.chains.retrieval'] = stub_module('langchain.chains.retrieval', {'create_retrieval_chain': lambda *args, **kwargs: None})
 
 # Docling stubs
-sys.modules['langchain_docling'] = stub_module('langchain_docling', {'DoclingLoader': type('DoclingLoader', (), {'__init__': lambda self, file_path, export_type: None, 'load': lambda self: []})})
-sys.modules['langchain_docling.loader'] = stub_module('langchain_docling.loader', {'ExportType': type('ExportType', (), {'DOC_CHUNKS': None})})
+STUBS['langchain_docling'] = stub_module('langchain_docling', {'DoclingLoader': type('DoclingLoader', (), {'__init__': lambda self, file_path, export_type: None, 'load': lambda self: []})})
+STUBS['langchain_docling.loader'] = stub_module('langchain_docling.loader', {'ExportType': type('ExportType', (), {'DOC_CHUNKS': None})})
 
 # LangSmith stub
 def _noop(f): return f
-sys.modules['langsmith'] = stub_module('langsmith', {'traceable': lambda name=None, **kwargs: _noop})
+STUBS['langsmith'] = stub_module('langsmith', {'traceable': lambda name=None, **kwargs: _noop})
 
 # Stub core submodules
 def dummy_layout(file_path): return []
-sys.modules['core.layout_ocr'] = stub_module('core.layout_ocr', {'layout_ocr_from_pdf': dummy_layout})
-sys.modules['core.utils'] = stub_module('core.utils', {
+STUBS['core.layout_ocr'] = stub_module('core.layout_ocr', {'layout_ocr_from_pdf': dummy_layout})
+STUBS['core.utils'] = stub_module('core.utils', {
     'sanitize_metadata': lambda md: md,
     'log_time': lambda f: f,
     'prefix_documents_for_e5': lambda docs: docs,
@@ -50,26 +83,85 @@ sys.modules['core.utils'] = stub_module('core.utils', {
     'format_response': lambda ans: ans,
     'adjust_chunks_to_token_limit': lambda docs, limit: docs,
 })
-sys.modules['core.config'] = stub_module('core.config', {
+# Config completa (valores reais) com os ajustes dos testes
+STUBS['core.config'] = stub_module('core.config', {
+    **{k: v for k, v in vars(real_config).items() if k.isupper()},
     'EMBEDDING_MODEL_NAME': 'embed_model',
     'LLM_MODEL_NAME': 'llm_model',
     'TOKEN_LIMIT': 100,
     'PINECONE_INDEX_NAME': 'idx',
     'EMBEDDING_TOKEN_LIMIT': 1000,
     'PINECONE_BATCH_SIZE': 10,
+    'UPSERT_WORKERS': 2,
+    'UPSERT_MAX_IN_FLIGHT': 2,
+    'UPSERT_RETRIES': 1,
+    'UPSERT_BACKOFF': 0.0,
     'PINECONE_API_KEY': 'key',
-    'ANTHROPIC_API_KEY': 'anthro_key'
+    'ANTHROPIC_API_KEY': 'anthro_key',
+    'USE_LANGGRAPH': False,
+    'USE_RERANKING': False,
+    'USE_HYBRID_RETRIEVAL': True,
+    'HYBRID_CANDIDATES': 30,
+    'ANSWER_CACHE_ENABLED': False,
+    'RETRIEVAL_CACHE_ENABLED': False,
+    'CONTEXT_PACKING_ENABLED': True,
+    'CHUNKS_FOLDER': None,
+})
+STUBS['core.setup_langsmith'] = stub_module('core.setup_langsmith', {'tracing_enabled': False})
+STUBS['core.graph_wrapper'] = stub_module('core.graph_wrapper', {
+    'GraphChainWrapper': lambda chain, **kwargs: chain,
+})
+STUBS['core.embedding_cache'] = stub_module('core.embedding_cache', {
+    'chunk_hash': lambda text: f"h-{text}",
+})
+STUBS['core.jobs'] = stub_module('core.jobs', {
+    'ProgressCallback': object,
+    'no_progress': lambda stage, **counters: None,
+    'stage_slot': lambda stage: contextlib.nullcontext(),
+})
+STUBS['core.resources'] = stub_module('core.resources', {
+    'get_embeddings': lambda: None,
+    'get_llm': lambda: None,
+})
+STUBS['core.bm25'] = stub_module('core.bm25', {
+    'BM25Index': type('BM25Index', (), {'build': staticmethod(lambda docs: docs)}),
+    'HybridRetriever': lambda **kwargs: types.SimpleNamespace(**kwargs),
+})
+STUBS['core.answer_cache'] = stub_module('core.answer_cache', {
+    'get_answer_cache': lambda: None,
+})
+STUBS['core.retrieval_cache'] = stub_module('core.retrieval_cache', {
+    'get_retrieval_cache': lambda: None,
+})
+STUBS['core.context_packer'] = stub_module('core.context_packer', {
+    'PackedRetriever': lambda retriever: ('packed', retriever),
+    'pack_context': lambda docs: (docs, {}),
+})
+async def _aretrieve_planned(retriever, query, plan):
+    return await retriever.ainvoke(query)
+
+STUBS['core.strategies'] = stub_module('core.strategies', {
+    'aretrieve_planned': _aretrieve_planned,
+    'configure_retriever': lambda retriever, params: retriever,
+    'get_strategy_stats': lambda: None,
+    'packing_kwargs': lambda plan: {},
+    'plan_strategy': lambda plan: (plan or {}).get('strategy', 'default'),
+    'retrieval_params': lambda plan: (plan or {}).get('retrieval', {}),
+    'retrieve_planned': lambda retriever, query, plan: retriever.invoke(query),
+})
+STUBS['core.vectorstores'] = stub_module('core.vectorstores', {
+    'open_vector_index': lambda name: None,
+    'as_vectorstore': lambda index, embeddings, namespace: None,
+    'doc_namespace': lambda doc_id: f"doc-{doc_id}",
+    'ALL_NAMESPACES': "*",
 })
-sys.modules['core.setup_langsmith'] = stub_module('core.setup_langsmith', {'tracing_enabled': False})
 
 # Now import the module under test
-from core import rag_pipeline
-from core.rag_pipeline import (
-    _invoke_core,
-    load_documents_with_docling,
-    create_or_load_vectorstore,
-    create_rag_chain
-)
+rag_pipeline = import_with_stubs('core.rag_pipeline', STUBS)
+_invoke_core = rag_pipeline._invoke_core
+load_documents_with_docling = rag_pipeline.load_documents_with_docling
+create_or_load_vectorstore = rag_pipeline.create_or_load_vectorstore
+create_rag_chain = rag_pipeline.create_rag_chain
 
 # Dummy classes for testing
 class DummyChain:
@@ -98,17 +190,140 @@ def test_invoke_core_formats_answer(monkeypatch):
     assert dummy_chain.invoked_with == {"input": "abc"}
 
 
+def test_invoke_core_reports_packed_context_tokens(monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "count_tokens", lambda text, model_name: 10)
+    monkeypatch.setattr(rag_pipeline, "format_response", lambda ans: ans)
+
+    class Packed(list):
+        report = {"tokens_used": 120, "budget": 3000}
+
+    class Chain:
+        def invoke(self, inputs):
+            return {"answer": "ok", "context": Packed(["d1"])}
+
+    output = _invoke_core(Chain(), {"input": "abc"}, "template {context}{input}")
+    assert output["metadata"]["context_packing"] == {"tokens_used": 120, "budget": 3000}
+
+
+def test_ainvoke_core_matches_invoke_core(monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "count_tokens", lambda text, model_name: 10)
+    monkeypatch.setattr(rag_pipeline, "format_response", lambda ans: ans.strip())
+
+    class Packed(list):
+        report = {"tokens_used": 120, "budget": 3000}
+
+    class Chain:
+        async def ainvoke(self, inputs):
+            return {"answer": " ok ", "context": Packed(["d1"])}
+
+    output = asyncio.run(rag_pipeline._ainvoke_core(Chain(), {"input": "abc"}, "template {context}{input}"))
+    assert output["answer"] == "ok"
+    assert output["metadata"]["context_packing"] == {"tokens_used": 120, "budget": 3000}
+
+
+class StreamingRetriever:
+    def __init__(self):
+        self.queries = []
+
+    def invoke(self, query):
+        self.queries.append(query)
+        return ["doc 1", "doc 2"]
+
+    async def ainvoke(self, query):
+        return self.invoke(query)
+
+
+class FakeStreamingLLM:
+    """Cadeia de geração que demora a emitir o primeiro token (um vazio antes)."""
+
+    CHUNKS = ["", "Pra", "zo", " de 12 meses"]
+
+    def __init__(self):
+        self.inputs = None
+
+    def stream(self, inputs):
+        self.inputs = inputs
+        time.sleep(0.05)
+        for chunk in self.CHUNKS:
+            yield chunk
+            time.sleep(0.01)
+
+    async def astream(self, inputs):
+        self.inputs = inputs
+        await asyncio.sleep(0.05)
+        for chunk in self.CHUNKS:
+            yield chunk
+            await asyncio.sleep(0.01)
+
+
+def check_stream_events(events, retriever, llm):
+    *tokens, final = events
+    assert tokens == [{"type": "token", "content": c} for c in ("Pra", "zo", " de 12 meses")]
+    assert final["type"] == "final"
+    assert final["answer"] == "Prazo de 12 meses"
+    assert final["source_documents"] == ["doc 1"]          # empacotado
+    metadata = final["metadata"]
+    assert metadata["strategy"] == "extraction"
+    assert metadata["context_packing"] == {"tokens_used": 3}
+    # TTFT: depois da busca e da espera do LLM, antes do fim da geração
+    assert metadata["retrieve_latency"] <= metadata["ttft"] <= metadata["total_time"]
+    assert metadata["ttft"] >= 0.05 and metadata["total_time"] >= metadata["ttft"] + 0.02
+    # Busca pela pergunta pura; o histórico do MCP vai só para a geração
+    assert retriever.queries == ["Qual o prazo?"]
+    assert llm.inputs == {"input": "histórico + Qual o prazo?", "context": ["doc 1"]}
+
+
+STREAM_INPUTS = {
+    "input": "Qual o prazo?",
+    "generation_input": "histórico + Qual o prazo?",
+    "plan": {"strategy": "extraction", "retrieval": {"k": 5}},
+}
+
+
+def pack_first(docs, **kwargs):
+    return docs[:1], {"tokens_used": 3}
+
+
+def test_stream_core_emits_tokens_then_final_with_ttft(monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "format_response", lambda ans: ans)
+    retriever, llm = StreamingRetriever(), FakeStreamingLLM()
+    events = list(rag_pipeline._stream_core(retriever, llm, STREAM_INPUTS, pack_first))
+    check_stream_events(events, retriever, llm)
+
+
+def test_astream_core_matches_stream_core(monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "format_response", lambda ans: ans)
+    retriever, llm = StreamingRetriever(), FakeStreamingLLM()
+
+    async def collect():
+        return [event async for event in rag_pipeline._astream_core(retriever, llm, STREAM_INPUTS, pack_first)]
+
+    check_stream_events(asyncio.run(collect()), retriever, llm)
+    final = asyncio.run(rag_pipeline._acollect(rag_pipeline._astream_core(retriever, llm, {"input": "q"})))
+    assert set(final) == {"answer", "source_documents", "metadata"}
+
+
 def test_create_rag_chain(monkeypatch):
     called = {}
-    class FakeChatAnthropic:
-        def __init__(self, temperature, model_name, api_key, max_tokens):
-            called.update({"model_name": model_name})
-    monkeypatch.setattr(rag_pipeline, "ChatAnthropic", FakeChatAnthropic)
+    shared_llm = object()
+    monkeypatch.setattr(rag_pipeline, "get_llm", lambda: shared_llm)
+    monkeypatch.setattr(rag_pipeline, "create_stuff_documents_chain",
+                        lambda llm, prompt: called.update({"llm": llm}))
     monkeypatch.setattr(rag_pipeline, "_invoke_core", lambda chain, inputs, template: {"ok": True})
     vs = DummyVectorStore()
     wrapper = create_rag_chain(vs)
     assert wrapper.invoke({}) == {"ok": True}
-    assert called.get("model_name") == rag_pipeline.LLM_MODEL_NAME
+    # Todas as cadeias usam o cliente LLM do pool
+    assert called.get("llm") is shared_llm
+
+
+def test_create_rag_chain_hybrid_with_documents(monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "_build_bm25", lambda docs: ("bm25", docs))
+    chain = create_rag_chain(DummyVectorStore(), documents=["d1", "d2"])
+    assert chain.retriever.dense == "dummy_retriever"
+    assert chain.retriever.index == ("bm25", ["d1", "d2"])
+    # Sem documentos (reconstrução preguiçosa) fica só o denso
+    assert create_rag_chain(DummyVectorStore()).retriever == "dummy_retriever"
 
 
 def test_load_documents_with_docling(monkeypatch):
@@ -122,24 +337,46 @@ def test_load_documents_with_docling(monkeypatch):
 
 
 def test_create_or_load_vectorstore_success(monkeypatch):
-    class FakePC:
-        def __init__(self, api_key): assert api_key == "key"
-        def list_indexes(self):
-            class X:
-                def names(self):
-                    return ["idx"]
-            return X()
-    monkeypatch.setattr(rag_pipeline, "PineconeLang", type("L", (), {"from_documents": staticmethod(lambda *args, **kwargs: "vs")}))
-    # Ensure Pinecone client stub is used for success scenario
-    monkeypatch.setattr(rag_pipeline, "Pinecone", FakePC)
-    vs = create_or_load_vectorstore("file", documents=[type("D", (), {"metadata": {}})()], embeddings=None)
-    assert vs == "vs"
+    received = {}
+    upserts = []
+    progress = []
+
+    class FakeVectorStore:
+        def __init__(self, index, embeddings, namespace):
+            received.update({"index": index, "namespace": namespace})
+
+    class FakeIndex:
+        def upsert(self, vectors, namespace):
+            upserts.append((vectors, namespace))
+
+    class FakeEmbeddings:
+        def embed_documents(self, texts):
+            return [[float(len(t))] for t in texts]
+
+    index = FakeIndex()
+    monkeypatch.setattr(rag_pipeline, "as_vectorstore", FakeVectorStore)
+    monkeypatch.setattr(rag_pipeline, "PINECONE_BATCH_SIZE", 2)
+    monkeypatch.setattr(rag_pipeline, "open_vector_index", lambda name: index if name == "idx" else None)
+    docs = [types.SimpleNamespace(page_content=t, metadata={"page": 1}) for t in ("a", "b", "a")]
+    vs = create_or_load_vectorstore("file", documents=docs, embeddings=FakeEmbeddings(),
+                                    progress=lambda stage, **c: progress.append((stage, c)),
+                                    namespace="doc-file")
+    assert isinstance(vs, FakeVectorStore)
+    # Chunks e busca restritos ao namespace do documento
+    assert received["namespace"] == "doc-file"
+    assert {ns for _, ns in upserts} == {"doc-file"}
+    # Handle de índice compartilhado, sem criar cliente novo
+    assert received["index"] is index
+    # IDs determinísticos: mesmo texto → mesmo ID (lotes enviados em paralelo)
+    ids = [vid for vectors, _ in upserts for vid, _, _ in vectors]
+    assert sorted(ids) == sorted(rag_pipeline.chunk_hash(t) for t in ("a", "b", "a"))
+    first_vector = next(v for vectors, _ in upserts for v in vectors if v[0] == rag_pipeline.chunk_hash("a"))
+    assert first_vector[2] == {"page": 1, "text": "a"}
+    assert progress[-1] == ("upserting", {"chunks_upserted": 3, "chunks_total": 3})
+    assert ("embedding", {"chunks_embedded": 2, "chunks_total": 3}) in progress
 
 
 def test_create_or_load_vectorstore_failure(monkeypatch):
-    class FakePC2:
-        def __init__(self, api_key): pass
-        def list_indexes(self): return types.SimpleNamespace(names=[])
-    monkeypatch.setattr(rag_pipeline, "Pinecone", FakePC2)
+    monkeypatch.setattr(rag_pipeline, "open_vector_index", lambda name: None)
     vs = create_or_load_vectorstore("f", documents=[], embeddings=None)
     assert vs is None
@@ -0,0 +1,56 @@
+import sys
+import types
+
+import pytest
+from langchain_core.documents import Document
+
+from core import models, rerank
+
+
+class FakeCrossEncoder:
+    instances = 0
+
+    def __init__(self, model_name, max_length, device):
+        FakeCrossEncoder.instances += 1
+        self.batches = []
+
+    def predict(self, pairs, batch_size, show_progress_bar):
+        self.batches.append(batch_size)
+        # Score = número de palavras da pergunta presentes no chunk
+        return [float(sum(w in text.split() for w in query.split())) for query, text in pairs]
+
+
+@pytest.fixture(autouse=True)
+def fake_cross_encoder(monkeypatch):
+    FakeCrossEncoder.instances = 0
+    monkeypatch.setitem(sys.modules, "sentence_transformers", types.SimpleNamespace(CrossEncoder=FakeCrossEncoder))
+    models.unload_models()
+    yield
+    models.unload_models()
+
+
+DOCS = [Document(page_content=t) for t in (
+    "passage: foro da comarca",
+    "passage: prazo de entrega e multa",
+    "passage: multa rescisória",
+    "passage: vigência do contrato",
+)]
+
+
+def test_keeps_top_n_in_score_order():
+    ranked = rerank.rerank_documents("multa prazo", DOCS, top_n=2, min_score=None)
+    assert [doc.page_content for doc, _ in ranked] == ["passage: prazo de entrega e multa", "passage: multa rescisória"]
+    assert [score for _, score in ranked] == [2.0, 1.0]
+
+
+def test_threshold_cuts_early_but_keeps_best():
+    assert len(rerank.rerank_documents("multa prazo", DOCS, top_n=4, min_score=1.5)) == 1
+    assert len(rerank.rerank_documents("inexistente", DOCS, top_n=4, min_score=1.0)) == 1
+    assert rerank.rerank_documents("x", [], top_n=3) == []
+
+
+def test_cross_encoder_cached_per_process():
+    rerank.rerank_documents("multa", DOCS, batch_size=8)
+    rerank.rerank_documents("prazo", DOCS, batch_size=8)
+    assert FakeCrossEncoder.instances == 1
+    assert rerank.get_cross_encoder().batches == [8, 8]
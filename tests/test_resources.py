@@ -0,0 +1,70 @@
+import sys
+import types
+
+import pytest
+
+from core import models, resources
+
+
+class FakeIndexList:
+    def __init__(self, names):
+        self._names = names
+
+    def names(self):
+        return self._names
+
+
+class FakePinecone:
+    instances = 0
+    available = ["legalmentor"]
+
+    def __init__(self, api_key, pool_threads):
+        FakePinecone.instances += 1
+        self.list_calls = 0
+
+    def list_indexes(self):
+        self.list_calls += 1
+        return FakeIndexList(list(FakePinecone.available))
+
+    def Index(self, name, pool_threads):
+        return types.SimpleNamespace(name=name)
+
+
+@pytest.fixture(autouse=True)
+def fake_pinecone(monkeypatch):
+    FakePinecone.instances = 0
+    monkeypatch.setitem(sys.modules, "pinecone", types.SimpleNamespace(Pinecone=FakePinecone))
+    models.unload_models()
+    resources.reset_index_cache()
+    yield
+    models.unload_models()
+    resources.reset_index_cache()
+
+
+def test_single_pinecone_client_and_cached_index():
+    assert resources.pinecone_index_exists("legalmentor")
+    assert resources.pinecone_index_exists("legalmentor")
+    first = resources.get_pinecone_index("legalmentor")
+    assert resources.get_pinecone_index("legalmentor") is first
+    assert FakePinecone.instances == 1
+    assert resources.get_pinecone().list_calls == 1
+
+
+def test_unknown_index_refreshes_listing():
+    assert not resources.pinecone_index_exists("novo")
+    FakePinecone.available = ["legalmentor", "novo"]
+    assert resources.pinecone_index_exists("novo")
+    FakePinecone.available = ["legalmentor"]
+
+
+def test_llm_is_shared(monkeypatch):
+    created = []
+
+    class FakeChat:
+        def __init__(self, **kwargs):
+            created.append(kwargs)
+
+    monkeypatch.setitem(sys.modules, "langchain_anthropic", types.SimpleNamespace(ChatAnthropic=FakeChat))
+    assert resources.get_llm() is resources.get_llm()
+    assert len(created) == 1
+    assert created[0]["model_name"] == resources.LLM_MODEL_NAME
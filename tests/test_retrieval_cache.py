@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+
+from core.retrieval_cache import RetrievalCache, retriever_fingerprint
+
+DOCS = [Document(page_content="passage: prazo de 12 meses"), Document(page_content="passage: multa de 10%")]
+
+
+def test_hit_on_normalized_query_within_scope_and_params():
+    cache = RetrievalCache(max_entries=4)
+    cache.put(cache.key("d", "Qual o prazo?", "p"), DOCS)
+    assert cache.get(cache.key("d", "  qual o PRAZO ", "p")) == DOCS
+    assert cache.get(cache.key("e", "qual o prazo", "p")) is None
+    assert cache.get(cache.key("d", "qual o prazo", "outro")) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["chunks"]) == (1, 2, 2)
+
+
+def test_lru_eviction_releases_unreferenced_chunks():
+    cache = RetrievalCache(max_entries=1)
+    cache.put(cache.key("d", "a", "p"), DOCS)
+    cache.put(cache.key("d", "b", "p"), DOCS[:1])
+    assert cache.get(cache.key("d", "a", "p")) is None
+    assert cache.stats()["chunks"] == 1 and cache.stats()["evictions"] == 1
+    assert cache.invalidate("d") == 1
+    assert cache.stats()["chunks"] == 0
+
+
+def test_identical_chunks_keep_each_documents_metadata():
+    cache = RetrievalCache(max_entries=4)
+    text = "passage: foro da comarca de São Paulo"
+    cache.put(cache.key("a.pdf", "foro", "p"), [Document(page_content=text, metadata={"doc_id": "a.pdf", "page": 3})])
+    cache.put(cache.key("b.pdf", "foro", "p"), [Document(page_content=text, metadata={"doc_id": "b.pdf", "page": 9})])
+    assert cache.get(cache.key("b.pdf", "foro", "p"))[0].metadata == {"doc_id": "b.pdf", "page": 9}
+    assert cache.get(cache.key("a.pdf", "foro", "p"))[0].metadata == {"doc_id": "a.pdf", "page": 3}
+    cache.invalidate("a.pdf")
+    assert cache.stats()["chunks"] == 1
+
+
+def test_fingerprint_tracks_search_parameters():
+    mmr = SimpleNamespace(search_type="mmr", search_kwargs={"k": 20, "fetch_k": 100})
+    other = SimpleNamespace(search_type="mmr", search_kwargs={"k": 10, "fetch_k": 100})
+    assert retriever_fingerprint(mmr) == retriever_fingerprint(SimpleNamespace(**vars(mmr)))
+    assert retriever_fingerprint(mmr) != retriever_fingerprint(other)
@@ -0,0 +1,181 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from langchain.chains.combine_documents.stuff import create_stuff_documents_chain
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from core.bm25 import BM25Index, HybridRetriever
+from core.graph_wrapper import GraphChainWrapper
+from core.langgraph_pipeline import LangGraphRAGPipeline
+from core.mcp import MCPSystem
+from core.strategies import (
+    StrategyStats,
+    configure_retriever,
+    interleave,
+    packing_kwargs,
+    plan_queries,
+    retrieve_many,
+)
+
+
+def make_retriever():
+    store = InMemoryVectorStore(DeterministicFakeEmbedding(size=16))
+    return store.as_retriever(search_type="mmr", search_kwargs={"k": 20, "fetch_k": 100, "lambda_mult": 0.8})
+
+
+def test_plan_carries_strategy_parameters():
+    mcp = MCPSystem(memory_size=5)
+    extraction = mcp.plan("Mostre a cláusula 4")
+    assert extraction["retrieval"]["search_type"] == "similarity"
+    assert extraction["retrieval"]["k"] == 5
+    comparison = mcp.plan("Qual a diferença entre a cláusula 5 e a cláusula 7?")
+    assert comparison["queries"] == ["a cláusula 5", "a cláusula 7"]
+    assert mcp.plan("Qualquer pergunta")["retrieval"] == {}
+
+
+def test_configure_retriever_copies_without_touching_chain_retriever():
+    base = make_retriever()
+    small = configure_retriever(base, {"search_type": "similarity", "k": 5})
+    assert small.search_type == "similarity" and small.search_kwargs == {"k": 5}
+    assert base.search_type == "mmr" and base.search_kwargs["k"] == 20
+    assert small.vectorstore is base.vectorstore
+    assert configure_retriever(base, {}) is base
+
+
+def test_configure_hybrid_scales_candidates_with_k():
+    docs = [Document(page_content="art 1"), Document(page_content="art 2")]
+    hybrid = HybridRetriever(dense=make_retriever(), index=BM25Index.build(docs))
+    small = configure_retriever(hybrid, {"search_type": "similarity", "k": 5})
+    assert (small.k, small.candidates) == (5, 15)
+    assert small.dense.search_kwargs == {"k": 15}
+    assert small.index is hybrid.index
+
+
+def test_interleave_alternates_and_dedupes():
+    a, b, c = (Document(page_content=t) for t in "abc")
+    assert [d.page_content for d in interleave([[a, b], [c, a]])] == ["a", "c", "b"]
+
+
+def test_packing_kwargs_from_plan():
+    assert packing_kwargs({"retrieval": {"context_budget": 2000}}) == {"budget": 2000}
+    assert packing_kwargs(None) == {}
+
+
+def test_pipeline_fans_out_comparison_queries():
+    seen = []
+
+    class Retriever:
+        def invoke(self, query, config=None):
+            seen.append(query)
+            return [Document(page_content=f"trecho sobre {query}")]
+
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content="Comparação.")]))
+    prompt = ChatPromptTemplate.from_template("{context}\n\nPergunta: {input}")
+    base = SimpleNamespace(retriever=Retriever(), document_chain=create_stuff_documents_chain(llm, prompt))
+    pipeline = LangGraphRAGPipeline(base, use_rerank=False)
+    plan = MCPSystem().plan("Comparar a multa com o aviso prévio")
+    result = pipeline.invoke({"input": "Comparar a multa com o aviso prévio", "plan": plan})
+    assert sorted(seen) == sorted(["Comparar a multa com o aviso prévio", "a multa", "o aviso prévio"])
+    assert len(result["source_documents"]) == 3
+    assert result["metadata"]["strategy"] == "comparison"
+    assert "retrieve_latency" in result["metadata"]
+
+
+def test_strategy_stats_aggregates_latency_and_tokens():
+    stats = StrategyStats(token_counter=lambda texts: [len(t.split()) for t in texts])
+    docs = [Document(page_content="um dois três")]
+    stats.record("extraction", 0.2, {"answer": "sim", "source_documents": docs, "metadata": {}})
+    stats.record("extraction", 0.4, {
+        "answer": "não sei",
+        "source_documents": docs,
+        "metadata": {"context_packing": {"tokens_used": 7}, "retrieve_latency": 0.1},
+    })
+    report = stats.stats()["extraction"]
+    assert report["requests"] == 2
+    assert abs(report["avg_latency"] - 0.3) < 1e-9
+    assert report["avg_context_tokens"] == 5      # (3 + 7) / 2
+    assert report["avg_answer_tokens"] == 1.5
+    assert abs(report["avg_retrieve_latency"] - 0.05) < 1e-9
+
+
+def test_strategy_stats_counts_tokens_off_the_request_thread():
+    threads = []
+
+    def counter(texts):
+        threads.append(threading.current_thread())
+        return [len(t.split()) for t in texts]
+
+    stats = StrategyStats(token_counter=counter)
+    stats.record("summarization", 0.1, {
+        "answer": "resumo em quatro palavras",
+        "source_documents": [],
+        "metadata": {"context_packing": {"tokens_used": 30}},
+    })
+    report = stats.stats()["summarization"]
+    assert (report["avg_context_tokens"], report["avg_answer_tokens"]) == (30, 4)
+    assert threads and threading.current_thread() not in threads
+
+
+
+def test_graph_wrapper_records_strategy_once_per_answer():
+    records = []
+    stats = SimpleNamespace(record=lambda strategy, latency, result: records.append((strategy, result["answer"])))
+    cache = {}
+    answer_cache = SimpleNamespace(
+        lookup=lambda doc_id, question: (cache.get(question), None),
+        store=lambda doc_id, question, result, vector: cache.setdefault(question, result),
+    )
+    chain = SimpleNamespace(invoke=lambda inputs: {"answer": f"resposta {inputs['input']}", "source_documents": []})
+    wrapper = GraphChainWrapper(
+        chain, use_langgraph=False, doc_id="doc", answer_cache=answer_cache, strategy_stats=stats,
+    )
+    wrapper.invoke({"input": "q", "plan": {"strategy": "extraction"}})
+    wrapper.invoke({"input": "q"})      # hit do cache não conta de novo
+    wrapper.invoke({"input": "r"})
+    assert records == [("extraction", "resposta q"), ("default", "resposta r")]
+
+class SlowRetriever:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def invoke(self, query, config=None):
+        time.sleep(self.delay)
+        return [Document(page_content="comum"), Document(page_content=f"sobre {query}")]
+
+
+def test_decomposition_without_plan_detects_comparisons():
+    assert plan_queries("Qual a diferença entre multa e juros?", None) == [
+        "Qual a diferença entre multa e juros?", "multa", "juros",
+    ]
+    assert plan_queries("Qual o prazo?", None) == ["Qual o prazo?"]
+    # Com plano, só a estratégia de comparação decompõe
+    assert plan_queries("Qual a diferença entre multa e juros?", {"strategy": "default", "retrieval": {}}) == [
+        "Qual a diferença entre multa e juros?",
+    ]
+
+
+def test_retrieve_many_runs_branches_concurrently_and_dedupes():
+    start = time.perf_counter()
+    docs, branches = retrieve_many(SlowRetriever(0.2), ["q", "a", "b"])
+    wall = time.perf_counter() - start
+    assert wall < 0.4                                   # ~uma busca, não três
+    assert [d.page_content for d in docs] == ["comum", "sobre q", "sobre a", "sobre b"]
+    assert [b["query"] for b in branches] == ["q", "a", "b"]
+    assert all(b["latency"] >= 0.2 and b["count"] == 2 for b in branches)
+
+
+def test_graph_reports_per_branch_latency():
+    generator = SimpleNamespace(invoke=lambda inputs: "Ok.")
+    pipeline = LangGraphRAGPipeline(
+        SimpleNamespace(retriever=SlowRetriever(0.05), document_chain=generator), use_rerank=False,
+    )
+    result = pipeline.invoke({"input": "Comparar multa versus juros"})
+    assert result["metadata"]["sub_queries"] == ["multa", "juros"]
+    assert [b["query"] for b in result["metadata"]["fan_out"]] == ["Comparar multa versus juros", "multa", "juros"]
+    assert result["metadata"]["retrieve_count"] == 4
@@ -22,13 +22,29 @@ class DummyTokenizer:
         return list(text)
     def decode(self, tokens, skip_special_tokens=True):
         return ''.join(tokens)
+    def __call__(self, texts, truncation=False, add_special_tokens=True, return_offsets_mapping=False):
+        # Espaços não viram tokens, como nos tokenizers reais
+        offsets = [[(i, i + 1) for i, c in enumerate(t) if not c.isspace()] for t in texts]
+        enc = {'input_ids': [[t[a] for a, _ in offs] for t, offs in zip(texts, offsets)]}
+        if return_offsets_mapping:
+            enc['offset_mapping'] = offsets
+        return enc
+    def num_special_tokens_to_add(self):
+        return 0
+    def batch_decode(self, batch, skip_special_tokens=True):
+        return [self.decode(tokens) for tokens in batch]
 
 @pytest.fixture(autouse=True)
 def patch_tokenizer(monkeypatch):
     dummy = DummyTokenizer()
+    loads = []
     # Patch AutoTokenizer.from_pretrained
-    monkeypatch.setattr(utils, 'AutoTokenizer', types.SimpleNamespace(from_pretrained=lambda model_name: dummy))
-    yield
+    monkeypatch.setattr(utils, 'AutoTokenizer', types.SimpleNamespace(
+        from_pretrained=lambda model_name: loads.append(model_name) or dummy
+    ))
+    utils.clear_tokenizer_cache()
+    yield loads
+    utils.clear_tokenizer_cache()
 
 # Tests for sanitize_metadata
 def test_sanitize_metadata_various_types():
@@ -54,14 +70,51 @@ def test_split_text_by_token_limit_simple():
     parts = utils.split_text_by_token_limit(text, max_tokens=2)
     assert parts == ['ab', 'cd', 'ef']
 
+def test_split_keeps_original_text_and_prefers_sentence_end():
+    text = 'Um dois. Tres quatro cinco'
+    parts = utils.split_text_by_token_limit(text, max_tokens=8)
+    # Corte recua até o fim da frase em vez de quebrar no meio da palavra
+    assert parts[0] == 'Um dois.'
+    assert ''.join(p.replace(' ', '') for p in parts) == text.replace(' ', '')
+
+def test_split_repeats_prefix_and_respects_budget():
+    text = 'passage: ' + 'abcdefghij'
+    parts = utils.split_text_by_token_limit(text, max_tokens=14, prefix='passage: ')
+    assert all(p.startswith('passage: ') for p in parts)
+    assert all(utils.count_tokens(p) <= 14 for p in parts)
+    assert ''.join(p[len('passage: '):] for p in parts) == 'abcdefghij'
+
+def test_split_with_overlap():
+    parts = utils.split_text_by_token_limit('abcdefgh', max_tokens=4, overlap=2)
+    assert parts == ['abcd', 'cdef', 'efgh']
+
+def test_split_batch_matches_single_split():
+    texts = ['abcdef', 'xyz', '']
+    assert utils.split_batch(texts, max_tokens=2) == [
+        utils.split_text_by_token_limit(t, max_tokens=2) for t in texts
+    ]
+
+# Tests for the shared tokenizer registry
+def test_tokenizer_loaded_once_per_model(patch_tokenizer):
+    for _ in range(3):
+        utils.count_tokens('abc', model_name='m1')
+    utils.split_text_by_token_limit('abc', max_tokens=2, model_name='m1')
+    utils.count_tokens('abc', model_name='m2')
+    assert patch_tokenizer == ['m1', 'm2']
+
+def test_count_tokens_batch():
+    assert utils.count_tokens_batch(['a', 'abc', '']) == [1, 3, 0]
+    assert utils.count_tokens_batch([]) == []
+    assert utils.count_tokens('abcd') == 4
+
 # Tests for adjust_chunks_to_token_limit
 @pytest.mark.parametrize('chunks,limit,expected', [
     ([SimpleNamespace(page_content='abcd', metadata={})], 2, ['ab','cd']),
     ([SimpleNamespace(page_content='', metadata={'m':1})], 10, [''])
 ])
 def test_adjust_chunks_to_token_limit(monkeypatch, chunks, limit, expected):
-    # Stub split_text_by_token_limit
-    monkeypatch.setattr(utils, 'split_text_by_token_limit', lambda text, max_tokens: expected)
+    # Stub split_batch
+    monkeypatch.setattr(utils, 'split_batch', lambda texts, max_tokens, **kw: [expected for _ in texts])
     docs = [SimpleNamespace(page_content='unused', metadata={'m':1})]
     adjusted = utils.adjust_chunks_to_token_limit(docs, limit)
     assert [d.page_content for d in adjusted] == expected
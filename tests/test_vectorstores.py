@@ -0,0 +1,171 @@
+import numpy as np
+import pytest
+
+from core import vectorstores
+from core.vectorstores import LocalIndex, LocalVectorStore, as_vectorstore, matches_filter
+
+
+class KeywordEmbeddings:
+    """Vetor = contagem de cada palavra-chave no texto."""
+
+    VOCAB = ["prazo", "multa", "foro", "rescisão"]
+
+    def _embed(self, text):
+        words = text.lower().split()
+        return [float(words.count(w)) + 0.01 for w in self.VOCAB]
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalVectorStore(LocalIndex(tmp_path), KeywordEmbeddings(), namespace="doc")
+
+
+def test_cosine_top_k_and_relevance(store):
+    store.add_texts(["prazo prazo de entrega", "multa por atraso", "foro da comarca"],
+                    metadatas=[{"page": 1}, {"page": 2}, {"page": 3}])
+    results = store.similarity_search_with_score("qual o prazo", k=2)
+    assert [doc.metadata["page"] for doc, _ in results][0] == 1
+    assert results[0][1] > results[1][1]
+    assert results[0][0].page_content == "prazo prazo de entrega"
+    assert "text" not in results[0][0].metadata
+
+
+def test_filters_and_namespaces(store):
+    store.add_texts(["prazo um", "prazo dois"], metadatas=[{"page": 1}, {"page": 2}])
+    store.add_texts(["prazo outro documento"], namespace="outro")
+    docs = store.similarity_search("prazo", k=5, filter={"page": {"$gte": 2}})
+    assert [d.page_content for d in docs] == ["prazo dois"]
+    assert len(store.similarity_search("prazo", k=5)) == 2
+    assert len(store.similarity_search("prazo", k=5, namespace="outro")) == 1
+    assert matches_filter({"a": 1, "b": "x"}, {"$or": [{"a": 2}, {"b": {"$in": ["x"]}}]})
+    with pytest.raises(ValueError):
+        matches_filter({"a": 1}, {"a": {"$regex": "."}})
+
+
+def test_incremental_append_and_idempotent_upsert_persist(tmp_path):
+    store = LocalVectorStore(LocalIndex(tmp_path), KeywordEmbeddings(), namespace="doc")
+    store.add_texts(["prazo", "multa"])
+    store.add_texts(["multa", "foro"], metadatas=[{"v": 2}, {}])  # "multa" reaproveita a linha
+    assert (tmp_path / "doc" / "vectors.f32").stat().st_size == 3 * 4 * 4
+
+    reopened = LocalIndex(tmp_path)
+    assert reopened.describe_index_stats()["namespaces"] == {"doc": {"vector_count": 3}}
+    top = reopened.query(KeywordEmbeddings().embed_query("multa"), top_k=1, namespace="doc")
+    assert top[0]["metadata"] == {"v": 2, "text": "multa"}
+
+
+def test_mmr_and_retriever_interface(store):
+    store.add_texts(["prazo prazo", "prazo prazo.", "prazo multa", "foro"])
+    retriever = store.as_retriever(search_type="mmr", search_kwargs={"k": 2, "fetch_k": 4, "lambda_mult": 0.3})
+    docs = retriever.invoke("prazo")
+    assert len(docs) == 2
+    # MMR evita as duas cópias quase idênticas
+    assert {d.page_content for d in docs} != {"prazo prazo", "prazo prazo."}
+
+
+def test_backend_selection(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstores, "LOCAL_INDEX_FOLDER", tmp_path)
+    monkeypatch.setattr(vectorstores, "_INDEXES", {})
+    index = vectorstores.get_local_index(tmp_path)
+    assert vectorstores.open_vector_index("idx", backend="local") is index
+    assert isinstance(as_vectorstore(index, KeywordEmbeddings()), LocalVectorStore)
+    with pytest.raises(ValueError):
+        vectorstores.open_vector_index("idx", backend="faiss")
+
+
+def test_dimension_mismatch_rejected(tmp_path):
+    index = LocalIndex(tmp_path)
+    index.upsert([("a", [1.0, 0.0], {})], namespace="n")
+    with pytest.raises(ValueError):
+        index.upsert([("b", np.ones(3), {})], namespace="n")
+
+
+def test_doc_namespace_is_stable_and_distinct():
+    assert vectorstores.doc_namespace("a.pdf") == vectorstores.doc_namespace("a.pdf")
+    assert vectorstores.doc_namespace("a.pdf") != vectorstores.doc_namespace("b.pdf")
+
+
+def make_documents(index, emb):
+    LocalVectorStore(index, emb, namespace="doc-a").add_texts(
+        ["prazo prazo contrato a", "multa contrato a"], metadatas=[{"doc": "a"}, {"doc": "a"}],
+    )
+    LocalVectorStore(index, emb, namespace="doc-b").add_texts(
+        ["prazo contrato b", "foro contrato b"], metadatas=[{"doc": "b"}, {"doc": "b"}],
+    )
+
+
+def test_scoped_store_only_sees_its_document_and_all_namespaces_merges(tmp_path):
+    index = LocalIndex(tmp_path)
+    emb = KeywordEmbeddings()
+    make_documents(index, emb)
+
+    scoped = as_vectorstore(index, emb, namespace="doc-b")
+    assert {d.page_content for d in scoped.similarity_search("prazo", k=5)} == {"prazo contrato b", "foro contrato b"}
+
+    # Cosseno com a consulta [1.01, .01, .01, .01]: "prazo contrato b" é o
+    # mesmo vetor (1.0); "prazo prazo contrato a" fica logo abaixo (~0.99998)
+    everything = as_vectorstore(index, emb, namespace=vectorstores.ALL_NAMESPACES)
+    assert [d.page_content for d in everything.similarity_search("prazo", k=2)] == [
+        "prazo contrato b", "prazo prazo contrato a",
+    ]
+    assert [d.page_content for d in everything.similarity_search("prazo", k=4, filter={"doc": "a"})] == [
+        "prazo prazo contrato a", "multa contrato a",
+    ]
+    # Namespace novo aparece depois do TTL da listagem
+    LocalVectorStore(index, emb, namespace="doc-c").add_texts(["rescisão imediata c"])
+    everything._listed_at = 0.0
+    assert everything.similarity_search("rescisão", k=1)[0].page_content == "rescisão imediata c"
+
+
+def test_all_namespaces_retriever_keeps_mmr_and_search_kwargs(tmp_path):
+    index = LocalIndex(tmp_path)
+    emb = KeywordEmbeddings()
+    make_documents(index, emb)
+    everything = as_vectorstore(index, emb, namespace=vectorstores.ALL_NAMESPACES)
+
+    retriever = everything.as_retriever(search_type="mmr", search_kwargs={"k": 2, "fetch_k": 4, "lambda_mult": 0.3})
+    docs = retriever.invoke("prazo")
+    # O segundo "prazo" é quase idêntico ao primeiro: o MMR troca por um chunk diverso
+    assert docs[0].page_content == "prazo contrato b"
+    assert docs[1].page_content in {"multa contrato a", "foro contrato b"}
+    filtered = everything.as_retriever(search_type="mmr", search_kwargs={"k": 2, "filter": {"doc": "b"}})
+    assert {d.metadata["doc"] for d in filtered.invoke("prazo")} == {"b"}
+
+
+def test_all_namespaces_searches_every_document_with_bounded_concurrency(tmp_path, monkeypatch):
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    index = LocalIndex(tmp_path)
+    emb = KeywordEmbeddings()
+    for i in range(20):  # mais namespaces do que o pool tem threads
+        LocalVectorStore(index, emb, namespace=f"doc-{i:02d}").add_texts([f"rescisão contrato {i}"])
+    active, peak = 0, 0
+    lock = threading.Lock()
+    search = LocalVectorStore.similarity_search_by_vector_with_score
+
+    def tracked(self, *args, **kwargs):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.01)
+        try:
+            return search(self, *args, **kwargs)
+        finally:
+            with lock:
+                active -= 1
+
+    monkeypatch.setattr(LocalVectorStore, "similarity_search_by_vector_with_score", tracked)
+    monkeypatch.setattr(vectorstores, "_SEARCH_POOL", ThreadPoolExecutor(max_workers=3))
+    everything = as_vectorstore(index, emb, namespace=vectorstores.ALL_NAMESPACES)
+    found = everything.similarity_search("rescisão", k=20)
+    assert {d.page_content for d in found} == {f"rescisão contrato {i}" for i in range(20)}
+    assert peak == 3